@@ -0,0 +1,244 @@
+import asyncio
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Annotated
+from unittest.mock import AsyncMock, MagicMock
+
+from fastapi import Depends
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.utils.entry import CachedUrl, decode_entry, encode_entry, pack_entry
+from app.utils.hash import from_hash
+from app.utils.lru import LRUCache
+from app.utils.metrics import Gauge, registry
+
+# marker stored in the local cache for unknown or inactive hashes
+NOT_FOUND = object()
+
+# hot links are served from the worker memory before reaching redis or the db
+local_cache = LRUCache(maxsize=settings.local_cache_size, ttl=settings.local_cache_ttl)
+
+# invalidation generation of the hashes the resolver is loading, bumped by
+# every eviction so that a load racing with a write does not cache old data
+generations: dict[str, int] = {}
+
+
+# hashes evicted while a bulk fill of redis runs, one set per fill; the fill
+# may have read them before their write and writes them again afterwards
+fills: list[set[str]] = []
+
+
+def evict_local(hash: str) -> None:
+    "drop the local cache entry of a hash, its load in flight turns stale"
+    local_cache.pop(hash)
+    if hash in generations:
+        generations[hash] += 1
+    for evicted in fills:
+        evicted.add(hash)
+
+
+@contextmanager
+def track_evictions() -> Iterator[set[str]]:
+    "the hashes evicted until the block exits"
+    evicted: set[str] = set()
+    fills.append(evicted)
+    try:
+        yield evicted
+    finally:
+        fills.remove(evicted)
+
+
+def clear_local() -> None:
+    "drop every local cache entry, the loads in flight turn stale"
+    local_cache.clear()
+    for hash in generations:
+        generations[hash] += 1
+
+
+registry.register(
+    Gauge(
+        "local_cache_entries",
+        "number of entries in the worker local cache",
+        lambda: {(): len(local_cache)},
+    )
+)
+
+
+class CacheClient:
+    "process lifetime redis client, one connection pool per worker"
+
+    def __init__(self):
+        self.pool: aioredis.ConnectionPool | None = None
+        self.client: aioredis.Redis | MagicMock | None = None
+
+    async def connect(self) -> None:
+        """Create the connection pool, called once on the app startup."""
+        if self.client is not None:
+            return
+        if settings.env != "PROD":
+            self.client = await gen_dev_cache()
+            return
+
+        self.pool = aioredis.ConnectionPool.from_url(
+            settings.cache_uri,
+            max_connections=settings.cache_pool_size,
+            socket_timeout=settings.cache_socket_timeout,
+            socket_connect_timeout=settings.cache_connect_timeout,
+            health_check_interval=settings.cache_health_check_interval,
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+
+    async def warm(self, size: int = settings.cache_pool_warm) -> None:
+        """Open pooled connections up front with concurrent pings."""
+        await self.connect()
+        await asyncio.gather(*(self.client.ping() for _ in range(size)))
+
+    async def close(self) -> None:
+        """Release all pooled connections, called on the app shutdown."""
+        if isinstance(self.client, aioredis.Redis):
+            await self.client.aclose()
+        if self.pool is not None:
+            await self.pool.disconnect()
+        self.client, self.pool = None, None
+
+    async def health(self) -> dict:
+        """Ping the cache server and report the pool usage."""
+        if self.client is None:
+            return {"status": "down", "error": "not connected"}
+        try:
+            async with asyncio.timeout(settings.cache_socket_timeout):
+                await self.client.ping()
+        except (RedisError, OSError, TimeoutError) as exc:
+            return {"status": "down", "error": str(exc)}
+
+        report = {"status": "up"}
+        if self.pool is not None:
+            report["max_connections"] = self.pool.max_connections
+            report["in_use"] = len(self.pool._in_use_connections)
+            report["available"] = len(self.pool._available_connections)
+        return report
+
+
+cache_client = CacheClient()
+
+
+def bucket_of(hash: str) -> tuple[str, int]:
+    "redis hash and field of a short URL in the bucket layout"
+    idx = from_hash(hash)
+    bits = settings.cache_bucket_bits
+    return f"b:{idx >> bits:x}", idx & ((1 << bits) - 1)
+
+
+def _buckets(hashes) -> dict[str, list[tuple[str, int]]]:
+    "group short URLs by bucket, with their field"
+    buckets: dict[str, list[tuple[str, int]]] = {}
+    for hash in hashes:
+        key, field = bucket_of(hash)
+        buckets.setdefault(key, []).append((hash, field))
+    return buckets
+
+
+async def read_entry(rd, hash: str) -> CachedUrl | None:
+    """Cache entry of a short URL stored in redis, in the configured layout."""
+    if settings.cache_layout == "bucket":
+        value = await rd.hget(*bucket_of(hash))
+    else:
+        value = await rd.get(hash)
+    return decode_entry(value) if value else None
+
+
+async def write_entry(rd, hash: str, entry: CachedUrl) -> None:
+    """Store the cache entry of a short URL in redis, in the configured layout."""
+    if settings.cache_layout == "bucket":
+        await rd.hset(*bucket_of(hash), pack_entry(entry, settings.cache_compress_min))
+    else:
+        await rd.set(hash, encode_entry(entry), exat=entry.expires_at or None)
+
+
+def queue_entries(pipe, entries: dict[str, CachedUrl], nx: bool = False) -> None:
+    """Queue the writes of cache entries, expiring links get a matching redis TTL.
+
+    With `nx` only the missing keys are written and expired entries are left
+    alone, for bulk fills that must not overwrite the writes of the app.
+    """
+    if settings.cache_layout == "bucket":
+        return _queue_bucket_entries(pipe, entries, nx)
+
+    values, now = {}, time.time()
+    for hash, entry in entries.items():
+        if not entry.expires_at:
+            values[hash] = encode_entry(entry)
+        elif entry.expired(now):
+            if not nx:
+                pipe.delete(hash)
+        else:
+            pipe.set(hash, encode_entry(entry), nx=nx, exat=entry.expires_at)
+    if not values:
+        return
+    if nx:
+        # MSETNX writes nothing as soon as one of the keys exists
+        for hash, value in values.items():
+            pipe.set(hash, value, nx=True)
+    else:
+        pipe.mset(values)
+
+
+def _queue_bucket_entries(pipe, entries: dict[str, CachedUrl], nx: bool) -> None:
+    "a HSET per bucket, fields have no TTL, readers check the expiry of the entry"
+    now, compress_min = time.time(), settings.cache_compress_min
+    expired = [hash for hash, entry in entries.items() if entry.expired(now)]
+    for key, fields in _buckets(entries).items():
+        values = {
+            field: pack_entry(entries[hash], compress_min)
+            for hash, field in fields
+            if not entries[hash].expired(now)
+        }
+        if nx:
+            for field, value in values.items():
+                pipe.hsetnx(key, field, value)
+        elif values:
+            pipe.hset(key, mapping=values)
+    if not nx:
+        queue_deletes(pipe, expired)
+
+
+def queue_deletes(pipe, hashes: list[str]) -> None:
+    "queue the invalidation of short URLs, in the configured layout"
+    if not hashes:
+        return
+    if settings.cache_layout == "bucket":
+        for key, fields in _buckets(hashes).items():
+            pipe.hdel(key, *(field for _, field in fields))
+    else:
+        pipe.delete(*hashes)
+
+
+async def get_redis():
+    "FastAPI dependency, falls back to a lazy connection when startup did not run"
+    if cache_client.client is None:
+        await cache_client.connect()
+    return cache_client.client
+
+
+# handler parameter of the redis client
+RedisClient = Annotated[aioredis.Redis, Depends(get_redis)]
+
+
+async def gen_dev_cache():
+    "dummy developemnet / testing cache. better to use lru from boltons in the future"
+    cache = MagicMock()
+    cache.get = AsyncMock(return_value=None)
+    cache.set = AsyncMock(return_value=None)
+    cache.mset = AsyncMock(return_value=None)
+    cache.delete = AsyncMock(return_value=None)
+    cache.hget = AsyncMock(return_value=None)
+    cache.hset = AsyncMock(return_value=None)
+    cache.hdel = AsyncMock(return_value=None)
+    cache.ping = AsyncMock(return_value=True)
+    cache.pipeline = MagicMock(
+        return_value=MagicMock(execute=AsyncMock(return_value=[]))
+    )
+    return cache
@@ -0,0 +1,334 @@
+"""Offline bulk import and export of the URL records, straight to the DB.
+
+    python -m app.cli export urls.ndjson [--resume]
+    python -m app.cli import urls.csv [--resume]
+    python -m app.cli prefill urls.ndjson
+
+Files are CSV when their name ends with `.csv` and NDJSON otherwise, unless
+`--format` is given. They are streamed in chunks of `--chunk-size` rows, a
+transaction or a redis pipeline per chunk, so the memory stays bounded
+whatever the file size. Progress and throughput are reported on stderr.
+
+Every chunk records a checkpoint next to the file (`<file>.checkpoint`).
+With `--resume` an interrupted run continues after the last complete chunk:
+an export after the last exported table index, an import after the last
+imported line. Resuming a finished export appends the records added since.
+
+Imported records keep their hash when the file has one, i.e. an export of a
+deployment with the same HASH_KEY, and get a new one otherwise. Records that
+keep their hash must be imported before the app serves traffic: running
+workers may hold blocks of ids that overlap them.
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from collections.abc import AsyncIterator, Iterator
+from datetime import datetime
+from typing import BinaryIO
+
+from pydantic import BaseModel, HttpUrl, ValidationError
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import cache_client, get_redis, queue_entries
+from app.database import SessionLocal, engine
+from app.models import UrlModel
+from app.repository.base import to_idx
+from app.repository.id_allocator import url_id_allocator
+from app.repository.url_repository import url_repository
+from app.utils.entry import CachedUrl
+from app.utils.hash import from_hash, valid_hash
+
+FIELDS = ("hash", "url", "on", "permanent", "version", "updated_at", "expires_at")
+
+
+class Record(BaseModel):
+    "a line of an import file, only the URL is required"
+
+    hash: str | None = None
+    url: HttpUrl
+    on: bool = True
+    permanent: bool = False
+    version: int | None = None
+    updated_at: datetime | None = None
+    expires_at: datetime | None = None
+
+
+class Progress:
+    "rows done and throughput, rewritten in place on stderr"
+
+    def __init__(self, action: str, rows: int = 0):
+        self.action = action
+        self.rows = rows
+        self.new = 0
+        self.start = time.perf_counter()
+
+    def update(self, rows: int) -> None:
+        self.rows += rows
+        self.new += rows
+        rate = self.new / max(time.perf_counter() - self.start, 1e-9)
+        print(
+            f"\r{self.action} {self.rows} rows, {rate:.0f} rows/s",
+            end="",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    def done(self) -> None:
+        print(file=sys.stderr)
+
+
+def checkpoint_path(path: str) -> str:
+    return f"{path}.checkpoint"
+
+
+def read_checkpoint(path: str) -> dict | None:
+    try:
+        with open(checkpoint_path(path)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path: str, **state) -> None:
+    "replaced atomically, an interrupted write leaves the previous checkpoint"
+    tmp = checkpoint_path(path) + ".tmp"
+    with open(tmp, "w") as file:
+        json.dump(state, file)
+    os.replace(tmp, checkpoint_path(path))
+
+
+def batched(iterable, size: int) -> Iterator[list]:
+    "consecutive lists of at most `size` items"
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def encode(records: list[UrlModel], fmt: str) -> bytes:
+    "lines of a chunk of exported records"
+    if fmt == "ndjson":
+        return "".join(record.model_dump_json() + "\n" for record in records).encode()
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for record in records:
+        row = record.model_dump(mode="json")
+        writer.writerow("" if row[field] is None else row[field] for field in FIELDS)
+    return buffer.getvalue().encode()
+
+
+def read_records(
+    file: BinaryIO, fmt: str, offset: int = 0
+) -> Iterator[tuple[int, Record]]:
+    "records of a file from a byte offset, with the offset of the next line"
+    fields = None
+    if fmt == "csv":
+        header = file.readline()
+        fields = next(csv.reader([header.decode()]))
+        offset = max(offset, len(header))
+    file.seek(offset)
+
+    for line in file:
+        start, offset = offset, offset + len(line)
+        if not line.strip():
+            continue
+        try:
+            if fields is None:
+                record = Record.model_validate_json(line)
+            else:
+                values = next(csv.reader([line.decode()]))
+                # empty CSV cells are missing values
+                row = {key: value for key, value in zip(fields, values) if value != ""}
+                record = Record.model_validate(row)
+        except ValidationError as exc:
+            raise SystemExit(f"invalid record at byte {start}: {exc}") from exc
+        yield offset, record
+
+
+async def read_chunks(
+    path: str, fmt: str, size: int, offset: int = 0
+) -> AsyncIterator[list[tuple[int, Record]]]:
+    "chunks of `read_records`, the file is read in a thread"
+    file = await asyncio.to_thread(open, path, "rb")
+    try:
+        chunks = batched(read_records(file, fmt, offset), size)
+        while chunk := await asyncio.to_thread(next, chunks, []):
+            yield chunk
+    finally:
+        await asyncio.to_thread(file.close)
+
+
+def start_export(path: str, fmt: str, offset: int) -> int:
+    "drop what follows the offset of the checkpoint, returns where to write next"
+    with open(path, "r+b" if offset else "wb") as file:
+        file.truncate(offset)
+        file.seek(offset)
+        if offset == 0 and fmt == "csv":
+            file.write((",".join(FIELDS) + "\n").encode())
+        return file.tell()
+
+
+def _timestamp(value: datetime | None) -> int | None:
+    return int(value.timestamp()) if value is not None else None
+
+
+def _to_row(record: Record) -> dict:
+    "table columns of an imported record, the index of its hash if it has one"
+    idx = to_idx(record.hash) if record.hash and valid_hash(record.hash) else None
+    if record.hash and idx is None:
+        # the link must keep its hash, a new one would break it
+        raise SystemExit(f"invalid hash {record.hash!r} of {record.url}")
+    return {
+        "idx": idx,
+        "url": str(record.url),
+        "on": record.on,
+        "permanent": record.permanent,
+        "version": record.version or 1,
+        "updated_at": _timestamp(record.updated_at),
+        "expires_at": _timestamp(record.expires_at),
+    }
+
+
+async def export_urls(
+    path: str,
+    fmt: str,
+    session_factory: sessionmaker = SessionLocal,
+    chunk_size: int = 10_000,
+    resume: bool = False,
+) -> int:
+    """Stream the table to a file with a server side cursor, returns the rows written."""
+    state = await asyncio.to_thread(read_checkpoint, path) if resume else None
+    after, offset = (state["idx"], state["offset"]) if state else (0, 0)
+    progress = Progress("exported", state["rows"] if state else 0)
+    offset = await asyncio.to_thread(start_export, path, fmt, offset)
+
+    def flush(chunk: list[UrlModel]) -> None:
+        "append a chunk and record its checkpoint, run in a thread"
+        nonlocal offset
+        with open(path, "r+b") as file:
+            file.seek(offset)
+            file.write(encode(chunk, fmt))
+            offset = file.tell()
+        progress.update(len(chunk))
+        write_checkpoint(
+            path, idx=from_hash(chunk[-1].hash), offset=offset, rows=progress.rows
+        )
+
+    async with session_factory() as db:
+        chunk = []
+        async for record in url_repository.stream(db, after=after):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                await asyncio.to_thread(flush, chunk)
+                chunk = []
+        if chunk:
+            await asyncio.to_thread(flush, chunk)
+
+    progress.done()
+    return progress.new
+
+
+async def import_urls(
+    path: str,
+    fmt: str,
+    session_factory: sessionmaker = SessionLocal,
+    chunk_size: int = 10_000,
+    resume: bool = False,
+) -> int:
+    """Insert the records of a file, a transaction per chunk, returns the new rows."""
+    state = await asyncio.to_thread(read_checkpoint, path) if resume else None
+    offset = state["offset"] if state else 0
+    progress = Progress("imported", state["rows"] if state else 0)
+    inserted = 0
+
+    async for chunk in read_chunks(path, fmt, chunk_size, offset):
+        rows = [_to_row(record) for _, record in chunk]
+        async with session_factory() as db:
+            # the ids of the imported hashes must not be handed out again
+            kept = [row["idx"] for row in rows if row["idx"] is not None]
+            if kept:
+                await url_id_allocator.advance(max(kept), db)
+            try:
+                inserted += await url_repository.import_many(rows, db)
+            except ValueError as exc:
+                raise SystemExit(f"conflicting record: {exc}") from exc
+        progress.update(len(chunk))
+        await asyncio.to_thread(
+            write_checkpoint, path, offset=chunk[-1][0], rows=progress.rows
+        )
+
+    progress.done()
+    return inserted
+
+
+async def prefill_cache(path: str, fmt: str, client, chunk_size: int = 10_000) -> int:
+    """Write the active links of an export to redis, returns how many."""
+    progress = Progress("cached")
+    written = 0
+    async for chunk in read_chunks(path, fmt, chunk_size):
+        now = time.time()
+        entries = {
+            record.hash: CachedUrl(
+                str(record.url),
+                record.version or 0,
+                _timestamp(record.updated_at) or 0,
+                record.permanent,
+                _timestamp(record.expires_at) or 0,
+            )
+            for _, record in chunk
+            if record.hash and record.on
+        }
+        entries = {
+            hash: entry for hash, entry in entries.items() if not entry.expired(now)
+        }
+        pipe = client.pipeline(transaction=False)
+        # links written by the app since the export are newer, they are kept
+        queue_entries(pipe, entries, nx=True)
+        await pipe.execute()
+        written += len(entries)
+        progress.update(len(chunk))
+
+    progress.done()
+    return written
+
+
+async def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__)
+    parser.add_argument("command", choices=("export", "import", "prefill"))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "ndjson"))
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args(argv)
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+
+    try:
+        if args.command == "export":
+            rows = await export_urls(
+                args.path, fmt, chunk_size=args.chunk_size, resume=args.resume
+            )
+            print(f"exported {rows} records")
+        elif args.command == "import":
+            rows = await import_urls(
+                args.path, fmt, chunk_size=args.chunk_size, resume=args.resume
+            )
+            print(f"imported {rows} new records")
+        else:
+            rows = await prefill_cache(
+                args.path, fmt, await get_redis(), chunk_size=args.chunk_size
+            )
+            print(f"cached {rows} links")
+    finally:
+        await cache_client.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
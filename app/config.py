@@ -1,4 +1,5 @@
 import os
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
@@ -13,7 +14,125 @@ class Settings(BaseSettings):
 
     env: str = os.getenv("ENV", "DEV")
     db_uri: str = get_db_url()
+    # read replicas, a JSON list, plain reads are spread over them
+    db_replica_uris: list[str] = []
+    # sqlalchemy engine and connection pool, ignored by the sqlite backend; the
+    # pool is per worker, see server_workers for the connections of a container
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 500
+    # workers apply the pending migrations on startup, PROD runs them out of
+    # band with `python -m app.migrations` and the workers refuse to start
+    migrate_on_startup: bool = os.getenv("ENV") != "PROD"
+    # sqlite pragmas for the development backend
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
     cache_uri: str = os.getenv("CACHE_URI", "")
+    # redis connection pool, one per worker
+    cache_pool_size: int = 50
+    cache_pool_warm: int = 10
+    cache_socket_timeout: float = 1.0
+    cache_connect_timeout: float = 1.0
+    cache_health_check_interval: int = 30
+    # "string" keeps a key per link, "bucket" packs the links in redis hashes
+    # of 2**cache_bucket_bits consecutive ids, small enough for listpacks
+    cache_layout: Literal["string", "bucket"] = "string"
+    cache_bucket_bits: int = 7
+    # URLs from this length are deflated in the bucket layout, 0 disables it
+    cache_compress_min: int = 48
+    # write-behind cache updates, see app/service/cache_sync.py
+    cache_sync_batch_size: int = 500
+    cache_sync_linger: float = 0.005
+    cache_sync_retry_delay: float = 0.1
+    cache_sync_max_retry_delay: float = 5.0
+    # writes wait for redis in the "cache" serving mode, pending updates are
+    # retried for stop_timeout when a worker stops, below the gunicorn one
+    cache_sync_write_timeout: float = 5.0
+    cache_sync_stop_timeout: float = 20.0
+    # cross worker invalidations, local entries ttl while the bus is down
+    invalidation_channel: str = "url-invalidations"
+    invalidation_degraded_ttl: float = 1.0
+    # directory shared by the workers of a server, /system/metrics then merges
+    # the metrics of all of them instead of reporting the answering worker's
+    prometheus_multiproc_dir: str = ""
+    metrics_sync_interval: float = 5.0
+    # gunicorn server, see app/server.py, 0 workers means one per core; each
+    # worker opens up to db_pool_size + db_max_overflow DB connections
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 0
+    server_keepalive: int = 5
+    server_backlog: int = 2048
+    server_timeout: int = 30
+    # status code and Cache-Control header sent by the redirect route
+    redirect_status_code: Literal[301, 302, 307, 308] = 302
+    redirect_cache_control: str = ""
+    # permanent links get a 301 that browsers and proxies may keep for max-age
+    redirect_permanent_max_age: int = 86400
+    # secret of the hash cipher, an empty key keeps the plain sequential encoding;
+    # indexes up to hash_legacy_max_idx keep it too, for links issued before the key
+    hash_key: str = ""
+    hash_legacy_max_idx: int = 0
+    # table indexes reserved at once by each worker
+    id_block_size: int = 1000
+    # a redirect missing on a replica is retried on the primary only for the
+    # last ids reserved, blocks of every worker of every replica in flight
+    db_replica_retry_span: int = 100_000
+    # max number of URLs accepted by the bulk endpoint
+    bulk_max_urls: int = 50_000
+    # click analytics, buffered in memory and written in batches
+    clicks_queue_size: int = 100_000
+    clicks_batch_size: int = 5_000
+    clicks_flush_interval: float = 1.0
+    clicks_bucket_seconds: int = 60
+    # expired links, "deactivate" keeps the rows and "purge" deletes them with
+    # their clicks; a single worker sweeps each interval, elected in redis
+    expiry_sweep_interval: float = 60.0
+    expiry_sweep_batch_size: int = 1000
+    expiry_sweep_mode: Literal["purge", "deactivate"] = "deactivate"
+    # "db" resolves cache misses in the DB, "cache" serves the reads from redis
+    # alone, backfilled from the DB once, the DB only persists the writes; the
+    # workers check the backfill marker every interval and refill a flushed redis
+    serving_mode: Literal["db", "cache"] = "db"
+    backfill_timeout: float = 600.0
+    backfill_check_interval: float = 10.0
+    # hot links preloaded on startup, the most clicked of the window first
+    warmup_size: int = 1000
+    warmup_window: int = 86400
+    warmup_timeout: float = 10.0
+    # token buckets per client, "METHOD /route/{param}": [rate per second, burst]
+    rate_limits: dict[str, tuple[float, float]] = {
+        "GET /{hash}": (50.0, 200),
+        "POST /api/v1/urls/": (5.0, 20),
+        "POST /api/v1/urls/bulk": (0.5, 5),
+    }
+    # "local" buckets per worker or "redis" global ones leased by batches
+    rate_limit_backend: Literal["local", "redis"] = "local"
+    rate_limit_lease: int = 10
+    # seconds on the local buckets after redis failed, before trying it again
+    rate_limit_redis_cooldown: float = 5.0
+    rate_limit_max_clients: int = 100_000
+    # API keys sent in X-API-Key, limited per key with a factor on the rules
+    api_keys: list[str] = []
+    rate_limit_key_factor: float = 10.0
+    # reverse proxies in front of the app, the client IP is read from X-Forwarded-For
+    rate_limit_trusted_proxies: int = 0
+    # opt-in tracing, the fraction of the requests traced with per step spans
+    # and the duration in seconds from which requests are logged, 0 disables
+    trace_sample_rate: float = 0.0
+    trace_slow_threshold: float = 0.0
+    # /system/profile samples the stacks of a live worker, keep it internal
+    profiler_enabled: bool = False
+    profiler_max_seconds: float = 60.0
+    # per worker in-memory cache in front of redis
+    local_cache_size: int = 10_000
+    local_cache_ttl: float = 60.0
+    negative_cache_ttl: float = 5.0
 
 
 settings = Settings()
@@ -1,8 +1,72 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-router = APIRouter(prefix="/system", tags=["System"])
+from app.cache import cache_client
+from app.config import settings
+from app.database import engine, pool_stats
+from app.middleware.tracing import TracedRoute
+from app.service.metrics_sync import metrics_sync
+from app.service.profiler import profiler, render
+from app.service.warmup import warmup
+
+router = APIRouter(prefix="/system", tags=["System"], route_class=TracedRoute)
 
 
 @router.get("/health")
 async def health():
-    return True
+    cache = await cache_client.health()
+    status_code = 200 if cache["status"] == "up" else 503
+    return JSONResponse({"cache": cache}, status_code=status_code)
+
+
+@router.get("/health/live")
+async def live():
+    "the worker process is up and serving requests"
+    return {"status": "up"}
+
+
+@router.get("/health/ready")
+async def ready():
+    "the worker can take traffic, its caches are warm and redis is reachable"
+    cache = await cache_client.health()
+    is_ready = warmup.ready and cache["status"] == "up"
+    content = {
+        "status": "ready" if is_ready else "not ready",
+        "warmup": {"done": warmup.ready, "loaded": warmup.loaded},
+        "cache": cache,
+    }
+    return JSONResponse(content, status_code=200 if is_ready else 503)
+
+
+@router.get("/pool")
+async def pool():
+    "database connection pool usage of the worker that answers, not of the server"
+    return pool_stats.report(engine)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    "prometheus scrape target, all the workers with PROMETHEUS_MULTIPROC_DIR"
+    text = await metrics_sync.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=settings.profiler_max_seconds),
+    interval: float = Query(0.005, ge=0.001, le=1.0),
+):
+    """Sample the stacks of the worker that answers for `seconds`, as folded stacks.
+
+    Only that worker is profiled, the other workers of the server are not.
+
+    The output is the input of flamegraph.pl, inferno or speedscope. Time
+    spent waiting on the network shows up in the event loop selector.
+    """
+    if not settings.profiler_enabled:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    try:
+        stacks = await profiler.profile(seconds, interval)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(render(stacks))
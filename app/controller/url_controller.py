@@ -1,15 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, HttpUrl
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from app.database import get_db, get_redis
-from app.models import UrlModel
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import AwareDatetime, BaseModel, Field, HttpUrl
+
+from app.cache import RedisClient
+from app.config import settings
+from app.database import DbSession, SessionFactory, use_primary
+from app.middleware.tracing import TracedRoute
+from app.models import ClickModel, UrlModel
+from app.repository.click_repository import click_repository
 from app.repository.url_repository import url_repository
-from app.utils.hash import valid_hash
+from app.service.cache_sync import cache_sync
+from app.service.resolver import resolve_url
+from app.utils.entry import CachedUrl
+from app.utils.hash import from_hash, valid_hash
 
 
 class UrlRequest(BaseModel):
     url: HttpUrl
+    # permanent links are redirected with a cacheable 301 and can not be edited
+    permanent: bool | None = None
+    # the link stops resolving after this date, never by default
+    expires_at: AwareDatetime | None = None
+
+
+class BulkUrlRequest(BaseModel):
+    urls: list[HttpUrl] = Field(min_length=1, max_length=settings.bulk_max_urls)
+    expires_at: AwareDatetime | None = None
 
 
 class UrlResponse(BaseModel):
@@ -22,52 +41,159 @@ class MultipleUrlsResponse(BaseModel):
     data: list[UrlModel]
     status: str = "success"
     errors: str | None = None
+    next_cursor: str | None = None
+
+
+class ClickStatsResponse(BaseModel):
+    data: list[ClickModel]
+    total: int
+    status: str = "success"
+    errors: str | None = None
+
+
+router = APIRouter(
+    prefix="/api/v1/urls", tags=["UrlShortener API"], route_class=TracedRoute
+)
+
+
+def _timestamp(value: datetime | None) -> int | None:
+    "unix timestamp of an optional request date"
+    return int(value.timestamp()) if value is not None else None
+
+
+async def _confirm(*hashes: str) -> None:
+    "in the cache serving mode a write only shows once redis applied it"
+    try:
+        await cache_sync.confirm(*hashes)
+    except TimeoutError:
+        raise HTTPException(
+            status_code=503, detail="Saved but not served yet, try again later"
+        )
+
+
+def _validators(entry: CachedUrl) -> dict[str, str]:
+    "ETag and Last-Modified of a record, none for entries cached without a version"
+    if not entry.version:
+        return {}
+    return {
+        "ETag": f'"{entry.version}"',
+        "Last-Modified": formatdate(entry.updated_at, usegmt=True),
+    }
+
+
+def _not_modified(request: Request, entry: CachedUrl) -> bool:
+    "conditional GET, If-None-Match takes precedence over If-Modified-Since"
+    if not entry.version:
+        return False
+    if (match := request.headers.get("if-none-match")) is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in match.split(",")}
+        return "*" in tags or f'"{entry.version}"' in tags
+    if (since := request.headers.get("if-modified-since")) is not None:
+        try:
+            return entry.updated_at <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False  # an invalid date is ignored
+    return False
+
 
+# declared before "/{hash}" so the path is not taken as a hash
+@router.get("/export")
+async def export(session_factory: SessionFactory, cursor: str | None = None):
+    """Stream all URL records as newline delimited JSON."""
+    if cursor is not None and not valid_hash(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-router = APIRouter(prefix="/api/v1/urls", tags=["UrlShortener API"])
+    after = from_hash(cursor) if cursor else 0
+
+    async def lines():
+        # the session must outlive the handler, so the generator owns it
+        async with session_factory() as db:
+            async for record in url_repository.stream(db, after=after):
+                yield record.model_dump_json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @router.get("/{hash}", response_model=UrlResponse)
-async def get(hash: str, db: AsyncSession = Depends(get_db)):
-    """Retrieve a URL by its hash if it's active, using cache if available."""
+async def get(
+    hash: str,
+    request: Request,
+    response: Response,
+    session_factory: SessionFactory,
+    rd: RedisClient,
+):
+    """Retrieve a URL by its hash if it's active, using cache if available.
+
+    Answers with ETag and Last-Modified, and a 304 to conditional requests
+    for a version the client already has.
+    """
     if not valid_hash(hash):
         raise HTTPException(status_code=400, detail="Invalid short URL")
 
-    rd = await get_redis()
-
-    # check if short URL alreadt in cache
-    if cached := await rd.get(hash):
-        UrlResponse(data=UrlModel(url=cached, hash=hash, on=True))
-
-    # query the SQL DB
-    record = await url_repository.get(hash, db)
-    if record is None or not record.on:
+    entry = await resolve_url(hash, session_factory, rd)
+    if entry is None:
         raise HTTPException(status_code=404, detail="URL not found")
 
-    # cache short URL
-    await rd.set(record.hash, str(record.url))
+    validators = _validators(entry)
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=validators)
+    response.headers.update(validators)
 
-    return UrlResponse(data=record)
+    return UrlResponse(
+        data=UrlModel(
+            url=entry.url,
+            hash=hash,
+            on=True,
+            permanent=entry.permanent,
+            version=entry.version or None,
+            updated_at=entry.updated_at or None,
+            expires_at=entry.expires_at or None,
+        )
+    )
 
 
 @router.get("/", response_model=MultipleUrlsResponse)
-async def get_all(db: AsyncSession = Depends(get_db)):
-    """Retrieve all URL records."""
-    records = await url_repository.get_all(db)
+async def get_all(
+    db: DbSession,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Retrieve a page of URL records, pass `next_cursor` to get the next one."""
+    if cursor is not None and not valid_hash(cursor):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    after = from_hash(cursor) if cursor else 0
+    records = await url_repository.get_page(db, after=after, limit=limit)
     if records is None or not len(records):
         raise HTTPException(status_code=404, detail="No URLs found")
-    return MultipleUrlsResponse(data=records)
+
+    # the cursor is the hash of the last record, i.e. the opaque table index
+    next_cursor = records[-1].hash if len(records) == limit else None
+    return MultipleUrlsResponse(data=records, next_cursor=next_cursor)
+
+
+@router.get("/stats/{hash}", response_model=ClickStatsResponse)
+async def stats(hash: str, db: DbSession, since: int = 0):
+    """Retrieve the click counts of a short URL per time bucket."""
+    if not valid_hash(hash):
+        raise HTTPException(status_code=400, detail="Invalid short URL")
+
+    records = await click_repository.get(hash, db, since=since)
+    return ClickStatsResponse(
+        data=records, total=sum(record.count for record in records)
+    )
 
 
 @router.post("/", response_model=UrlResponse)
-async def create(data: UrlRequest, db: AsyncSession = Depends(get_db)):
+async def create(data: UrlRequest, db: DbSession):
     """Register a new short URL, or return the existing one if already registered."""
-    rd = await get_redis()
-
     # try to add URL to database
-    record = await url_repository.add(str(data.url), db)
+    record = await url_repository.add(
+        str(data.url), db, bool(data.permanent), _timestamp(data.expires_at)
+    )
     if record:
-        await rd.set(record.hash, str(record.url))  # cache short URL
+        cache_sync.sync(record)  # cache short URL
+        await _confirm(record.hash)
         return UrlResponse(data=record)
 
     # case where the URL is already in the DB
@@ -78,15 +204,37 @@ async def create(data: UrlRequest, db: AsyncSession = Depends(get_db)):
         )
 
     # cache the old short url just to be sure
-    await rd.set(existing_record.hash, str(existing_record.url))
+    cache_sync.sync(existing_record)
+    await _confirm(existing_record.hash)
 
     return UrlResponse(
         data=existing_record, status="warning", errors="URL already in database"
     )
 
 
+@router.post("/bulk", response_model=MultipleUrlsResponse)
+async def create_many(data: BulkUrlRequest, db: DbSession):
+    """Register many short URLs at once, already registered URLs are reused."""
+    records, duplicated = await url_repository.add_many(
+        [str(url) for url in data.urls], db, _timestamp(data.expires_at)
+    )
+
+    # warm the cache, applied in batches by the background sync
+    for record in records:
+        cache_sync.sync(record)
+    await _confirm(*(record.hash for record in records))
+
+    if duplicated:
+        return MultipleUrlsResponse(
+            data=records,
+            status="warning",
+            errors=f"{duplicated} URLs already in database",
+        )
+    return MultipleUrlsResponse(data=records)
+
+
 @router.delete("/{hash}", response_model=UrlResponse)
-async def delete(hash: str, db: AsyncSession = Depends(get_db)):
+async def delete(hash: str, db: DbSession):
     """Delete a URL record by its hash."""
     if not valid_hash(hash):
         raise HTTPException(status_code=400, detail="Invalid short URL")
@@ -96,32 +244,55 @@ async def delete(hash: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="No record found to delete")
 
     # sync cache with db
-    rd = await get_redis()
-    await rd.delete(record.hash)
+    cache_sync.delete(record.hash)
+    await _confirm(record.hash)
 
     return UrlResponse(data=record)
 
 
 @router.put("/{hash}", response_model=UrlResponse)
-async def update(hash: str, data: UrlRequest, db: AsyncSession = Depends(get_db)):
+async def update(hash: str, data: UrlRequest, db: DbSession):
     """Update the URL of a given short URL."""
     if not valid_hash(hash):
         raise HTTPException(status_code=400, detail="Invalid short URL")
 
-    input = UrlModel(hash=hash, url=str(data.url), on=None)
+    # a replica may not have seen the link turn permanent yet
+    use_primary(db)
+    current = await url_repository.get(hash, db)
+    if current is None:
+        raise HTTPException(status_code=404, detail="No record found to update")
+    # clients may have cached the redirect of a permanent link, it can not
+    # change target, turn temporary, or start and stop expiring
+    if current.permanent and (
+        str(current.url) != str(data.url)
+        or data.permanent is not True
+        or (
+            data.expires_at is not None
+            and _timestamp(data.expires_at) != _timestamp(current.expires_at)
+        )
+    ):
+        raise HTTPException(status_code=409, detail="Permanent links can not be edited")
+
+    input = UrlModel(
+        hash=hash,
+        url=str(data.url),
+        on=None,
+        permanent=data.permanent,
+        expires_at=data.expires_at,
+    )
     record = await url_repository.update(input, db)
     if record is None:
         raise HTTPException(status_code=404, detail="No record found to update")
 
-    # sync cache with db
-    rd = await get_redis()
-    await rd.set(record.hash, str(record.url))
+    # sync cache with db, an inactive record must stay out of the cache
+    cache_sync.sync(record)
+    await _confirm(record.hash)
 
     return UrlResponse(data=record)
 
 
 @router.put("/activate/{hash}", response_model=UrlResponse)
-async def activate(hash: str, db: AsyncSession = Depends(get_db)):
+async def activate(hash: str, db: DbSession):
     """Activate a short URL."""
     if not valid_hash(hash):
         raise HTTPException(status_code=400, detail="Invalid short URL")
@@ -130,11 +301,15 @@ async def activate(hash: str, db: AsyncSession = Depends(get_db)):
     if record is None:
         raise HTTPException(status_code=404, detail="No record found to activate")
 
+    # sync cache with db
+    cache_sync.sync(record)
+    await _confirm(record.hash)
+
     return UrlResponse(data=record)
 
 
 @router.put("/deactivate/{hash}", response_model=UrlResponse)
-async def deactivate(hash: str, db: AsyncSession = Depends(get_db)):
+async def deactivate(hash: str, db: DbSession):
     """Deactivate a short URL."""
     if not valid_hash(hash):
         raise HTTPException(status_code=400, detail="Invalid short URL")
@@ -144,7 +319,7 @@ async def deactivate(hash: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="No record found to deactivate")
 
     # sync cache with db
-    rd = await get_redis()
-    await rd.delete(record.hash)
+    cache_sync.delete(record.hash)
+    await _confirm(record.hash)
 
     return UrlResponse(data=record)
@@ -1,17 +1,51 @@
-from fastapi import APIRouter, Depends
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, HTTPException
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, Response
 
-from app.controller import url_controller
+from app.cache import RedisClient
+from app.config import settings
+from app.database import SessionFactory
+from app.middleware.tracing import TracedRoute
+from app.service.clicks import click_collector
+from app.service.resolver import resolve_url
+from app.utils.hash import from_hash, valid_hash
 
-router = APIRouter(prefix="", tags=["Landing Page"])
+router = APIRouter(prefix="", tags=["Landing Page"], route_class=TracedRoute)
 
 router.mount(
     "/static", StaticFiles(directory="app/templates", html=True), name="templates"
 )
 
+# headers shared by every redirect, built once
+REDIRECT_HEADERS = [(b"content-length", b"0")]
+if settings.redirect_cache_control:
+    REDIRECT_HEADERS.append(
+        (b"cache-control", settings.redirect_cache_control.encode("latin-1"))
+    )
+# permanent links can not be edited, clients may cache their redirect
+PERMANENT_HEADERS = [
+    (b"content-length", b"0"),
+    (
+        b"cache-control",
+        f"public, max-age={settings.redirect_permanent_max_age}".encode("latin-1"),
+    ),
+]
+
+
+class Redirect(Response):
+    "bodyless redirect, skips the URL quoting and header parsing of RedirectResponse"
+
+    def __init__(
+        self,
+        url: str,
+        status_code: int = settings.redirect_status_code,
+        headers: list[tuple[bytes, bytes]] = REDIRECT_HEADERS,
+    ):
+        self.status_code = status_code
+        self.body = b""
+        self.background = None
+        self.raw_headers = [(b"location", url.encode("latin-1")), *headers]
+
 
 @router.get("/")
 async def landing_page():
@@ -20,8 +54,21 @@ async def landing_page():
 
 
 @router.get("/{hash}")
-async def redirect(hash: str, db: AsyncSession = Depends(url_controller.get_db)):
+async def redirect(
+    hash: str,
+    session_factory: SessionFactory,
+    rd: RedisClient,
+):
     "redirect short link to the orginal URL"
-    response = await url_controller.get(hash, db)
-    redirect_url = str(response.data.url)
-    return RedirectResponse(redirect_url, status_code=302)
+    if not valid_hash(hash):
+        raise HTTPException(status_code=400, detail="Invalid short URL")
+
+    # plain tuple all the way, no pydantic model on the hot path
+    entry = await resolve_url(hash, session_factory, rd)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="URL not found")
+
+    click_collector.record(from_hash(hash))
+    if entry.permanent:
+        return Redirect(entry.url, 301, PERMANENT_HEADERS)
+    return Redirect(entry.url)
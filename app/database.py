@@ -1,36 +1,250 @@
-from unittest.mock import AsyncMock, MagicMock
+import asyncio
+import random
+import time
+from typing import Annotated
 
-from redis import asyncio as aioredis
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from fastapi import Depends
+from sqlalchemy import Select, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from app.config import settings
+from app.utils.metrics import Gauge, registry
+from app.utils.tracing import record
 
-connect_args = {} if settings.env == "PROD" else {"check_same_thread": False}
-engine = create_async_engine(settings.db_uri, echo=True, connect_args=connect_args)
+
+def build_engine(uri: str) -> AsyncEngine:
+    "create an async engine tuned from the app settings"
+    if make_url(uri).get_backend_name() == "sqlite":
+        engine = create_async_engine(
+            uri,
+            echo=settings.db_echo,
+            connect_args={"check_same_thread": False},
+        )
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+        return engine
+
+    return create_async_engine(
+        uri,
+        echo=settings.db_echo,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={
+            "prepared_statement_cache_size": settings.db_statement_cache_size
+        },
+    )
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    "WAL and mmap make the dev sqlite backend closer to a real server"
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size:d}")
+    cursor.close()
+
+
+class PoolStats:
+    "live connection pool usage, including how long sessions wait for a connection"
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def track(self, engine: AsyncEngine) -> None:
+        event.listen(engine.sync_engine, "checkout", self._on_checkout)
+        event.listen(engine.sync_engine, "checkin", self._on_checkin)
+        event.listen(engine.sync_engine, "connect", self._on_connect)
+
+    def _on_checkout(self, *args):
+        self.checkouts += 1
+
+    def _on_checkin(self, *args):
+        self.checkins += 1
+
+    def _on_connect(self, *args):
+        self.connects += 1
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def report(self, engine: AsyncEngine) -> dict:
+        pool = engine.pool
+        report = {
+            "pool": pool.__class__.__name__,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "connects": self.connects,
+            "wait_avg": self.wait_total / self.waits if self.waits else 0.0,
+            "wait_max": self.wait_max,
+        }
+        # only queue based pools keep track of their size
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                report[name] = getattr(pool, name)()
+        return report
+
+
+class TimedSession(Session):
+    "session that reports to pool_stats the time spent acquiring a connection"
+
+
+class RoutingSession(TimedSession):
+    """Session sending plain reads to a read replica and everything else to the
+    primary bound to the session.
+
+    Once a session writes, it reads from the primary until it is closed, so a
+    request always reads its own writes. A session picks a single replica,
+    its reads see a consistent state of that replica.
+    """
+
+    def __init__(self, *args, replicas: list[Engine] = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = list(replicas)
+        self.replica: Engine | None = None
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if self.replicas and not self.info.get("primary"):
+            if self._is_read(clause):
+                if self.replica is None:
+                    self.replica = random.choice(self.replicas)
+                return self.replica
+            if self._flushing or clause is not None:
+                self.info["primary"] = True  # a write, stick to the primary
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+    def _is_read(self, clause) -> bool:
+        return (
+            not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        )
+
+
+def on_replica(session: AsyncSession) -> bool:
+    "whether the reads of a session go to a replica"
+    sync_session = session.sync_session
+    return bool(getattr(sync_session, "replicas", None)) and not sync_session.info.get(
+        "primary"
+    )
+
+
+def use_primary(session: AsyncSession) -> bool:
+    "route the next reads of a session to the primary, False if they already were"
+    if not on_replica(session):
+        return False
+    session.sync_session.info["primary"] = True
+    return True
+
+
+@event.listens_for(TimedSession, "after_transaction_create")
+def _start_checkout_timer(session, transaction):
+    if transaction.parent is None:
+        session.info["checkout_started"] = time.perf_counter()
+
+
+@event.listens_for(TimedSession, "after_begin")
+def _stop_checkout_timer(session, transaction, connection):
+    if (started := session.info.pop("checkout_started", None)) is not None:
+        waited = time.perf_counter() - started
+        pool_stats.record_wait(waited)
+        record("db.checkout", started, waited)
+
+
+engine = build_engine(settings.db_uri)
+replica_engines = [build_engine(uri) for uri in settings.db_replica_uris]
+
+pool_stats = PoolStats()
+for _engine in (engine, *replica_engines):
+    pool_stats.track(_engine)
+
+registry.register(
+    Gauge(
+        "db_pool",
+        "database connection pool usage of the worker",
+        lambda: {(k,): v for k, v in pool_stats.report(engine).items() if k != "pool"},
+        labels=("stat",),
+    )
+)
 
 SessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+    autocommit=False,
+    autoflush=False,
+    bind=engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    replicas=[replica.sync_engine for replica in replica_engines],
 )
 
 Base = declarative_base()
 
 
+class LazySession:
+    """Stand-in for the session of a request, created on its first use.
+
+    Requests answered from the caches, e.g. most redirects, never build a
+    session nor check out a connection. Everything else is forwarded to the
+    underlying AsyncSession.
+    """
+
+    def __init__(self, factory: sessionmaker = SessionLocal):
+        self.factory = factory
+        self.session: AsyncSession | None = None
+
+    @property
+    def opened(self) -> bool:
+        return self.session is not None
+
+    def __getattr__(self, name: str):
+        # only reached for attributes missing from the stand-in
+        if self.session is None:
+            self.session = self.factory()
+        return getattr(self.session, name)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
 async def get_db():
-    async with SessionLocal() as session:
+    session = LazySession(SessionLocal)
+    try:
         yield session
+    finally:
+        await session.close()
+
+
+# handler parameter of the session of the request
+DbSession = Annotated[AsyncSession, Depends(get_db)]
+
+
+async def get_sessionmaker():
+    "for handlers that must own the session lifetime, e.g. streaming responses"
+    return SessionLocal
+
+
+SessionFactory = Annotated[sessionmaker, Depends(get_sessionmaker)]
 
 
-async def get_redis():
-    if settings.env == "PROD":
-        return await aioredis.from_url(settings.cache_uri)
-    return await gen_dev_cache()
+async def warm_db_pool(size: int = settings.db_pool_size):
+    "open the pooled connections up front, so the first requests do not pay for it"
 
+    async def ping(engine: AsyncEngine):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
 
-async def gen_dev_cache():
-    "dummy developemnet / testing cache. better to use lru from boltons in the future"
-    cache = MagicMock()
-    cache.get = AsyncMock(return_value=None)
-    cache.set = AsyncMock(return_value=None)
-    cache.delete = AsyncMock(return_value=None)
-    return cache
+    # concurrent checkouts force the pool to open distinct connections
+    await asyncio.gather(
+        *(ping(target) for target in (engine, *replica_engines) for _ in range(size))
+    )
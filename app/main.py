@@ -1,8 +1,19 @@
 from fastapi import FastAPI
 
-from app.database import engine
-from app.models import Base
+from app.cache import cache_client
+from app.config import settings
+from app.database import engine, warm_db_pool
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.middleware.tracing import TracingMiddleware
+from app.migrations import migrate, pending
 from app.router import api_router
+from app.service.cache_sync import cache_sync
+from app.service.clicks import click_collector
+from app.service.expiry import expiry_sweeper
+from app.service.invalidation import invalidation_bus
+from app.service.metrics_sync import metrics_sync
+from app.service.warmup import warmup
 
 
 def create_app() -> FastAPI:
@@ -11,12 +22,46 @@ def create_app() -> FastAPI:
 
     @app.on_event("startup")
     async def startup():  # initialize database
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        # versioned migrations, the workers wait for the first one to apply them;
+        # deployments apply them before starting the workers
+        if settings.migrate_on_startup:
+            await migrate(engine)
+        elif names := await pending(engine):
+            raise RuntimeError(
+                f"pending migrations {', '.join(names)}, run python -m app.migrations"
+            )
+        # open connections before the worker accepts traffic
+        await warm_db_pool()
+        await cache_client.warm()
+        await click_collector.start()
+        await cache_sync.start()
+        await invalidation_bus.start()
+        await expiry_sweeper.start()
+        await metrics_sync.start()
+        # preload the hot links, the worker is not ready until it finished
+        await warmup.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():  # flush buffers and release pooled connections
+        await warmup.stop()
+        await expiry_sweeper.stop()
+        await metrics_sync.stop()
+        await click_collector.stop()
+        await cache_sync.stop()
+        await invalidation_bus.stop()
+        await cache_client.close()
 
     # add routes
     app.include_router(api_router)
 
+    # token buckets per client, before routing so rejections stay cheap
+    app.add_middleware(RateLimitMiddleware)
+    # sampled spans and slow request logs, only when enabled
+    if settings.trace_sample_rate or settings.trace_slow_threshold:
+        app.add_middleware(TracingMiddleware)
+    # request latency histograms per route, rejected requests included
+    app.add_middleware(MetricsMiddleware)
+
     return app
 
 
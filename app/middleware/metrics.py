@@ -0,0 +1,36 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.metrics import request_latency
+
+
+class MetricsMiddleware:
+    "records the latency of every http request, labeled by the route template"
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router stores the matched route in the scope, use its template
+            # so that every short URL falls under the same "/{hash}" series
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            request_latency.observe(
+                time.perf_counter() - start, scope["method"], path, str(status)
+            )
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import math
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+from app.service.rate_limiter import RateLimiter, rate_limited, rate_limiter
+
+BODY = json.dumps({"detail": "Too Many Requests"}).encode()
+
+
+class RateLimitMiddleware:
+    """Rejects with a 429 the clients that ran out of tokens for a route.
+
+    A client sending a known API key in `X-API-Key` is limited per key, any
+    other client per IP address, read from `X-Forwarded-For` when the app
+    runs behind trusted proxies.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiter: RateLimiter = rate_limiter,
+        api_keys: list[str] = settings.api_keys,
+        trusted_proxies: int = settings.rate_limit_trusted_proxies,
+    ):
+        self.app = app
+        self.limiter = limiter
+        # the raw keys never leave the worker, buckets are named by a digest
+        self.api_keys = {
+            key.encode(): "key:"
+            + hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+            for key in api_keys
+        }
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rule = self.limiter.match(scope["method"], scope["path"])
+        if rule is None:
+            return await self.app(scope, receive, send)
+
+        client, keyed = self.client(scope)
+        if keyed:
+            rule = self.limiter.keyed[rule.name]
+        if wait := await self.limiter.acquire(rule, client):
+            rate_limited.inc(rule.name)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(BODY)).encode()),
+                        (b"retry-after", str(math.ceil(wait)).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": BODY})
+            return
+
+        await self.app(scope, receive, send)
+
+    def client(self, scope: Scope) -> tuple[str, bool]:
+        "bucket name of the client, True when it is a known API key"
+        forwarded = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                if (key := self.api_keys.get(value)) is not None:
+                    return key, True
+            elif name == b"x-forwarded-for":
+                forwarded = value
+
+        if self.trusted_proxies and forwarded is not None:
+            hops = forwarded.decode("latin-1").split(",")
+            # the entries on the right were appended by the trusted proxies
+            return hops[max(0, len(hops) - self.trusted_proxies)].strip(), False
+        peer = scope.get("client")
+        return (peer[0] if peer else "unknown"), False
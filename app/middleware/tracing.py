@@ -0,0 +1,141 @@
+import inspect
+import logging
+import random
+import time
+from functools import wraps
+
+from fastapi.routing import APIRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.utils.metrics import Counter, registry
+from app.utils.tracing import Trace, current_trace
+
+logger = logging.getLogger(__name__)
+
+slow_requests = registry.register(
+    Counter(
+        "slow_requests_total",
+        "requests slower than the slow request threshold, by route",
+        labels=("method", "route"),
+    )
+)
+
+
+class TracingMiddleware:
+    """Traces a sample of the requests and logs the slow ones.
+
+    A traced request collects the spans of the cache, repository, hashing
+    and routing steps it goes through (see app/utils/tracing.py). Requests
+    taking `slow_threshold` seconds or more are logged, with the total time
+    per span when they were traced.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = settings.trace_sample_rate,
+        slow_threshold: float = settings.trace_slow_threshold,
+        sample=random.random,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.sample = sample
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = None
+        if self.sample_rate and self.sample() < self.sample_rate:
+            trace = Trace()
+            token = current_trace.set(trace)
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if trace is not None:
+                current_trace.reset(token)
+            if self.slow_threshold and elapsed >= self.slow_threshold:
+                self.log(scope, status, elapsed, trace)
+
+    def log(self, scope: Scope, status: int, elapsed: float, trace: Trace | None):
+        route = getattr(scope.get("route"), "path", "unmatched")
+        slow_requests.inc(scope["method"], route)
+        if trace is None:
+            spans = "not traced"
+        else:
+            spans = " ".join(
+                f"{name}={duration * 1000:.2f}ms"
+                for name, duration in trace.breakdown().items()
+            )
+        logger.warning(
+            "slow request %s %s %d %.2fms: %s",
+            scope["method"],
+            scope["path"],
+            status,
+            elapsed * 1000,
+            spans,
+        )
+
+
+class TracedRoute(APIRoute):
+    """Route adding the spans of the FastAPI request handling to traced requests.
+
+    `route.dependencies` covers the request parsing, validation and the
+    dependencies, `route.endpoint` the handler and `route.serialize` the
+    response model validation and rendering.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        if not inspect.iscoroutinefunction(call):
+            return
+
+        # the request handler looks the endpoint up on the dependant when called
+        @wraps(call)
+        async def endpoint(*args, **kwargs):
+            if (trace := current_trace.get()) is None:
+                return await call(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                trace.add("route.endpoint", start, time.perf_counter() - start)
+
+        self.dependant.call = endpoint
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            if (trace := current_trace.get()) is None:
+                return await handler(request)
+            start = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                _add_stages(trace, start, time.perf_counter())
+
+        return traced_handler
+
+
+def _add_stages(trace: Trace, start: float, end: float) -> None:
+    "spans before and after the endpoint span of a route handled in [start, end]"
+    for name, offset, duration in reversed(trace.spans):
+        if name == "route.endpoint":
+            called = trace.start + offset
+            trace.add("route.dependencies", start, called - start)
+            trace.add("route.serialize", called + duration, end - called - duration)
+            return
@@ -0,0 +1,134 @@
+"""Versioned schema migrations, applied in order before the workers start.
+
+    python -m app.migrations
+
+Deployments run them out of band, a backfill may outlast the worker boot
+timeout; the workers only check that none is pending, and apply them
+themselves when `MIGRATE_ON_STARTUP` is set (the default outside of PROD,
+for development databases). The applied versions are recorded in the
+`schema_version` table. Workers starting together serialize on a lock (an
+advisory lock on PostgreSQL, a file lock next to a SQLite database), the
+first one applies the pending migrations and the others find the schema up
+to date, so replicas never race on DDL.
+
+The first migration creates the missing tables with the current models, so
+a new database skips the intermediate layouts. Later migrations must check
+the state they change, a new database may already have it.
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.migrations import url_digest, url_expiry, url_versions
+from app.models import Base
+
+logger = logging.getLogger(__name__)
+
+# arbitrary key of the postgres advisory lock held while migrating
+LOCK_KEY = 0x55524C53
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(64), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+
+async def create_tables(conn: AsyncConnection) -> None:
+    "tables that do not exist yet are created with the current models"
+    await conn.run_sync(Base.metadata.create_all)
+
+
+Migration = tuple[int, str, Callable[[AsyncConnection], Awaitable[None]]]
+
+MIGRATIONS: list[Migration] = [
+    (1, "create_tables", create_tables),
+    (2, "url_digest", url_digest.upgrade),
+    (3, "url_versions", url_versions.upgrade),
+    (4, "url_expiry", url_expiry.upgrade),
+]
+
+
+@contextlib.asynccontextmanager
+async def _file_lock(engine: AsyncEngine):
+    "exclusive lock shared by the processes using the same sqlite file"
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        yield
+        return
+    path = f"{database}.migrate.lock"
+    lock = await asyncio.to_thread(os.open, path, os.O_RDWR | os.O_CREAT)
+    try:
+        await asyncio.to_thread(fcntl.flock, lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    finally:
+        os.close(lock)
+
+
+async def pending(engine: AsyncEngine) -> list[str]:
+    """Names of the migrations not applied yet."""
+    async with engine.connect() as conn:
+        exists = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).has_table(schema_version.name)
+        )
+        current = None
+        if exists:
+            current = (
+                await conn.execute(select(func.max(schema_version.c.version)))
+            ).scalar()
+    return [
+        name for version, name, _ in MIGRATIONS if current is None or version > current
+    ]
+
+
+async def migrate(engine: AsyncEngine) -> list[str]:
+    """Apply the pending migrations in a single transaction, returns their names."""
+    applied = []
+    async with _file_lock(engine), engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # released with the transaction, the other workers wait here
+            await conn.execute(
+                text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY}
+            )
+        await conn.run_sync(schema_version.create, checkfirst=True)
+        current = (
+            await conn.execute(select(func.max(schema_version.c.version)))
+        ).scalar()
+
+        for version, name, upgrade in MIGRATIONS:
+            if current is not None and version <= current:
+                continue
+            logger.info("applying migration %d %s", version, name)
+            await upgrade(conn)
+            await conn.execute(
+                insert(schema_version).values(
+                    version=version, name=name, applied_at=datetime.now(UTC)
+                )
+            )
+            applied.append(name)
+    return applied
@@ -0,0 +1,16 @@
+import asyncio
+import logging
+
+from app.database import engine
+from app.migrations import migrate
+
+
+async def main() -> None:
+    applied = await migrate(engine)
+    print(f"applied: {', '.join(applied)}" if applied else "schema up to date")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
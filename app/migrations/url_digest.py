@@ -0,0 +1,95 @@
+"""Move the URL deduplication to the fixed width `url_digest` column.
+
+Adds and backfills the digest of the existing rows, checks that no two
+rows share a digest, then swaps the unique constraint of `url` for one on
+`url_digest` and widens `url` to TEXT. Tables created by `create_all`
+already have the new layout, running it twice is a no-op.
+"""
+
+import logging
+
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models import UrlRegister
+from app.repository.base import BULK_CHUNK_SIZE
+from app.utils.digest import url_digest
+
+logger = logging.getLogger(__name__)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    def columns(sync_conn) -> set[str] | None:
+        inspector = inspect(sync_conn)
+        if not inspector.has_table("urls"):
+            return None
+        return {column["name"] for column in inspector.get_columns("urls")}
+
+    existing = await conn.run_sync(columns)
+    if existing is None or "url_digest" in existing:
+        return  # new database, or already migrated
+
+    postgres = conn.dialect.name == "postgresql"
+    blob = "BYTEA" if postgres else "BLOB"
+    await conn.execute(text(f"ALTER TABLE urls ADD COLUMN url_digest {blob}"))
+    await backfill(conn)
+    await check_duplicates(conn)
+
+    if postgres:
+        await conn.execute(text("ALTER TABLE urls ALTER COLUMN url TYPE TEXT"))
+        await conn.execute(text("ALTER TABLE urls DROP CONSTRAINT urls_url_key"))
+        await conn.execute(
+            text("ALTER TABLE urls ALTER COLUMN url_digest SET NOT NULL")
+        )
+        await conn.execute(
+            text(
+                "ALTER TABLE urls ADD CONSTRAINT urls_url_digest_key"
+                " UNIQUE (url_digest)"
+            )
+        )
+    else:
+        # sqlite can not drop a constraint, the table is rebuilt instead
+        await conn.execute(text("ALTER TABLE urls RENAME TO urls_old"))
+        await conn.run_sync(UrlRegister.__table__.create)
+        await conn.execute(
+            text(
+                'INSERT INTO urls (idx, url, url_digest, "on")'
+                ' SELECT idx, url, url_digest, "on" FROM urls_old'
+            )
+        )
+        await conn.execute(text("DROP TABLE urls_old"))
+
+
+async def backfill(conn: AsyncConnection) -> None:
+    "compute the digests in chunks, walking the table by index"
+    select = text(
+        "SELECT idx, url FROM urls WHERE idx > :after ORDER BY idx LIMIT :limit"
+    )
+    update = text("UPDATE urls SET url_digest = :digest WHERE idx = :idx").bindparams(
+        bindparam("digest", type_=UrlRegister.url_digest.type)
+    )
+    after, total = 0, 0
+    while True:
+        rows = (
+            await conn.execute(select, {"after": after, "limit": BULK_CHUNK_SIZE})
+        ).all()
+        if not rows:
+            break
+        await conn.execute(
+            update, [{"idx": idx, "digest": url_digest(url)} for idx, url in rows]
+        )
+        after, total = rows[-1].idx, total + len(rows)
+    logger.info("computed the digest of %d URLs", total)
+
+
+async def check_duplicates(conn: AsyncConnection) -> None:
+    "URLs equal once normalized must be merged by hand before migrating"
+    stmt = text(
+        "SELECT idx, url FROM urls WHERE url_digest IN ("
+        " SELECT url_digest FROM urls GROUP BY url_digest HAVING count(*) > 1"
+        ") ORDER BY url_digest, idx LIMIT 100"
+    )
+    rows = (await conn.execute(stmt)).all()
+    if rows:
+        listing = ", ".join(f"{row.idx}: {row.url}" for row in rows)
+        raise RuntimeError(f"duplicated URLs once normalized: {listing}")
@@ -0,0 +1,31 @@
+"""Add the `expires_at` column of the URL records and its index.
+
+Existing rows never expire. The index keeps the sweeper batches cheap
+whatever the size of the table. Tables created by `create_all` already
+have both, running it twice is a no-op.
+"""
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+INDEX = "ix_urls_expires_at"
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    def layout(sync_conn) -> tuple[set[str], set[str]] | None:
+        inspector = inspect(sync_conn)
+        if not inspector.has_table("urls"):
+            return None
+        columns = {column["name"] for column in inspector.get_columns("urls")}
+        indexes = {index["name"] for index in inspector.get_indexes("urls")}
+        return columns, indexes
+
+    existing = await conn.run_sync(layout)
+    if existing is None:
+        return
+
+    columns, indexes = existing
+    if "expires_at" not in columns:
+        await conn.execute(text("ALTER TABLE urls ADD COLUMN expires_at INTEGER"))
+    if INDEX not in indexes:
+        await conn.execute(text(f"CREATE INDEX {INDEX} ON urls (expires_at)"))
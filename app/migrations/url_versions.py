@@ -0,0 +1,41 @@
+"""Add the HTTP caching columns of the URL records.
+
+`version` and `updated_at` are the validators of the API reads (ETag and
+Last-Modified), `permanent` selects the cacheable 301 redirect. Existing
+rows start at version 1, modified at the time of the migration, and are
+not permanent. Tables created by `create_all` or rebuilt by an earlier
+migration already have the columns, running it twice is a no-op.
+"""
+
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+COLUMNS = {
+    "version": "INTEGER NOT NULL DEFAULT 1",
+    "updated_at": "INTEGER NOT NULL DEFAULT 0",
+    "permanent": "BOOLEAN NOT NULL DEFAULT FALSE",
+}
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    def columns(sync_conn) -> set[str] | None:
+        inspector = inspect(sync_conn)
+        if not inspector.has_table("urls"):
+            return None
+        return {column["name"] for column in inspector.get_columns("urls")}
+
+    existing = await conn.run_sync(columns)
+    if existing is None:
+        return
+
+    for name, ddl in COLUMNS.items():
+        if name not in existing:
+            await conn.execute(text(f"ALTER TABLE urls ADD COLUMN {name} {ddl}"))
+
+    # a constant default keeps the ALTER cheap, the timestamps are set after
+    await conn.execute(
+        text("UPDATE urls SET updated_at = :now WHERE updated_at = 0"),
+        {"now": int(time.time())},
+    )
@@ -1,14 +1,63 @@
+import time
+from datetime import datetime
+
 from pydantic import BaseModel, Field, HttpUrl
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    false,
+)
 
 from app.database import Base
+from app.utils.digest import DIGEST_SIZE, url_digest
+
+
+def _url_digest(context) -> bytes:
+    "column default, the digest of the URL inserted in the same row"
+    return url_digest(context.get_current_parameters()["url"])
 
 
 class UrlRegister(Base):
     __tablename__ = "urls"
     idx = Column(Integer, primary_key=True, autoincrement=True)
-    url = Column(String(255), nullable=False, unique=True)
+    url = Column(Text, nullable=False)
+    # dedup key, a compact unique index instead of one over the full URLs
+    url_digest = Column(
+        LargeBinary(DIGEST_SIZE), nullable=False, unique=True, default=_url_digest
+    )
     on = Column(Boolean, nullable=False, default=True)
+    # HTTP validators, bumped by every update
+    # server defaults fill the rows copied by the migrations
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(
+        Integer, nullable=False, default=lambda: int(time.time()), server_default="0"
+    )
+    # immutable link, redirected with a cacheable 301
+    permanent = Column(Boolean, nullable=False, default=False, server_default=false())
+    # unix timestamp after which the link stops resolving, NULL never expires
+    expires_at = Column(Integer, nullable=True, index=True)
+
+
+class IdBlockRegister(Base):
+    "next free table index of each sequence, reserved in blocks by the workers"
+
+    __tablename__ = "id_blocks"
+    name = Column(String(32), primary_key=True)
+    next_id = Column(BigInteger, nullable=False)
+
+
+class ClickRegister(Base):
+    "redirect counts aggregated per short URL and time bucket"
+
+    __tablename__ = "clicks"
+    idx = Column(Integer, primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # unix timestamp of the bucket start
+    count = Column(Integer, nullable=False, default=0)
 
 
 class UrlModel(BaseModel):
@@ -17,3 +66,13 @@ class UrlModel(BaseModel):
     hash: str = Field(min_length=8, max_length=8)
     url: HttpUrl | None
     on: bool | None = True
+    permanent: bool | None = None
+    version: int | None = None
+    updated_at: datetime | None = None
+    expires_at: datetime | None = None
+
+
+class ClickModel(BaseModel):
+    hash: str = Field(min_length=8, max_length=8)
+    bucket: datetime
+    count: int
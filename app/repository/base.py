@@ -0,0 +1,29 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils.hash import from_hash
+
+# keeps multi-row statements below the bind parameter limit of both backends
+BULK_CHUNK_SIZE = 1000
+
+# largest value of the 32 bits index columns, ciphered hashes decode to 48 bits
+MAX_IDX = 2**31 - 1
+
+
+def chunks(items: list, size: int = BULK_CHUNK_SIZE):
+    "split a list in consecutive slices of at most `size` items"
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def dialect_insert(db: AsyncSession):
+    "dialect specific insert, both support ON CONFLICT clauses and RETURNING"
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+def to_idx(hash: str) -> int | None:
+    "table index of a hash, None when it can not be a row of the table"
+    idx = from_hash(hash)
+    return idx if idx <= MAX_IDX else None
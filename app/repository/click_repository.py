@@ -0,0 +1,75 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import ClickModel, ClickRegister
+from app.repository.base import chunks, dialect_insert, to_idx
+from app.utils.hash import to_hash
+from app.utils.metrics import timed
+
+
+def _to_model(item: ClickRegister) -> ClickModel:
+    "helper function to convert a database row model to a pydantic obj"
+    return ClickModel(
+        hash=to_hash(item.idx),
+        bucket=datetime.fromtimestamp(item.bucket, tz=UTC),
+        count=item.count,
+    )
+
+
+class ClickRepository:
+    "aggregated click counters, written in batches by the click collector"
+
+    @timed("db")
+    async def add_counts(
+        self, counts: dict[tuple[int, int], int], db: AsyncSession
+    ) -> None:
+        """Increment the (idx, bucket) counters with a single upsert per chunk."""
+        insert = dialect_insert(db)
+        rows = [
+            {"idx": idx, "bucket": bucket, "count": count}
+            for (idx, bucket), count in counts.items()
+        ]
+        for chunk in chunks(rows):
+            stmt = insert(ClickRegister).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ClickRegister.idx, ClickRegister.bucket],
+                set_={"count": ClickRegister.count + stmt.excluded.count},
+            )
+            await db.execute(stmt)
+        await db.commit()
+
+    @timed("db")
+    async def get(
+        self, hash: str, db: AsyncSession, since: int = 0
+    ) -> list[ClickModel]:
+        """Retrieve the click counters of a short URL, oldest bucket first."""
+        if (idx := to_idx(hash)) is None:
+            return []
+        stmt = (
+            select(ClickRegister)
+            .where(ClickRegister.idx == idx)
+            .where(ClickRegister.bucket >= since)
+            .order_by(ClickRegister.bucket)
+        )
+        items = (await db.execute(stmt)).scalars().all()
+        return [_to_model(item) for item in items]
+
+    @timed("db")
+    async def top(
+        self, db: AsyncSession, since: int = 0, limit: int = 100
+    ) -> list[int]:
+        """Table indexes of the most clicked short URLs since a timestamp."""
+        total = func.sum(ClickRegister.count)
+        stmt = (
+            select(ClickRegister.idx)
+            .where(ClickRegister.bucket >= since)
+            .group_by(ClickRegister.idx)
+            .order_by(total.desc())
+            .limit(limit)
+        )
+        return list((await db.execute(stmt)).scalars())
+
+
+click_repository = ClickRepository()
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import IdBlockRegister, UrlRegister
+from app.repository.base import dialect_insert
+from app.utils.metrics import timed
+
+
+class IdAllocator:
+    """Hands out table indexes from blocks reserved in the `id_blocks` table.
+
+    Each worker reserves `block_size` ids with a single atomic UPDATE and
+    serves them from memory, so inserts know their index (and hash) upfront.
+    Blocks are never handed out twice: ids left unused when a worker stops
+    are skipped, which only leaves gaps in the sequence.
+    """
+
+    def __init__(self, name: str, block_size: int = 1000):
+        self.name = name
+        self.block_size = block_size
+        self.next_id = 0
+        self.end_id = 0  # exclusive
+        self.lock = asyncio.Lock()
+        # ids below were reserved, by any worker, when the counter was last read
+        self.high_water = 0
+        self.high_water_read = 0.0
+
+    def reset(self) -> None:
+        "forget the current block, e.g. when the database is recreated"
+        self.next_id = self.end_id = self.high_water = 0
+        self.high_water_read = 0.0
+
+    async def recently_reserved(
+        self, idx: int, db: AsyncSession, span: int, refresh: float = 1.0
+    ) -> bool:
+        """Whether `idx` is among the last `span` ids reserved by any worker.
+
+        Ids past the high-water mark re-read the counter on the primary, at
+        most every `refresh` seconds, so ids that were never handed out cost
+        no more than one read per interval.
+        """
+        if idx >= self.high_water and time.monotonic() - self.high_water_read > refresh:
+            self.high_water_read = time.monotonic()
+            self.high_water = max(self.high_water, await self._counter(db))
+        return self.high_water - span <= idx < self.high_water
+
+    async def _counter(self, db: AsyncSession) -> int:
+        async with db.bind.connect() as conn:
+            stmt = select(IdBlockRegister.next_id).where(
+                IdBlockRegister.name == self.name
+            )
+            if (counter := (await conn.execute(stmt)).scalar()) is None:
+                # nothing reserved yet, only the existing rows
+                stmt = select(func.max(UrlRegister.idx))
+                counter = ((await conn.execute(stmt)).scalar() or 0) + 1
+        return counter
+
+    async def allocate(self, n: int, db: AsyncSession) -> list[int]:
+        """Return `n` unused table indexes, in increasing order."""
+        ids: list[int] = []
+        async with self.lock:
+            while len(ids) < n:
+                if self.next_id >= self.end_id:
+                    await self._reserve(max(self.block_size, n - len(ids)), db)
+                take = min(n - len(ids), self.end_id - self.next_id)
+                ids.extend(range(self.next_id, self.next_id + take))
+                self.next_id += take
+        return ids
+
+    async def advance(self, idx: int, db: AsyncSession) -> None:
+        """Never hand out ids up to `idx`, e.g. after rows were imported with theirs."""
+        async with self.lock:
+            # the ids of the current block up to idx are skipped too
+            if self.next_id <= idx:
+                self.next_id = min(idx + 1, self.end_id)
+        async with db.bind.begin() as conn:
+            stmt = (
+                update(IdBlockRegister)
+                .where(
+                    IdBlockRegister.name == self.name, IdBlockRegister.next_id <= idx
+                )
+                .values(next_id=idx + 1)
+            )
+            if (await conn.execute(stmt)).rowcount == 0:
+                # already past idx or no row yet, then it starts after the table
+                start = (await conn.execute(select(func.max(UrlRegister.idx)))).scalar()
+                insert = dialect_insert(db)(IdBlockRegister).values(
+                    name=self.name, next_id=max(start or 0, idx) + 1
+                )
+                await conn.execute(insert.on_conflict_do_nothing())
+
+    @timed("db", "reserve_ids")
+    async def _reserve(self, size: int, db: AsyncSession) -> None:
+        # own transaction, a rollback of the caller must not release the block
+        async with db.bind.begin() as conn:
+            stmt = (
+                update(IdBlockRegister)
+                .where(IdBlockRegister.name == self.name)
+                .values(next_id=IdBlockRegister.next_id + size)
+                .returning(IdBlockRegister.next_id)
+            )
+            end = (await conn.execute(stmt)).scalar_one_or_none()
+
+            if end is None:  # first reservation, start after the existing rows
+                start = (await conn.execute(select(func.max(UrlRegister.idx)))).scalar()
+                insert = dialect_insert(db)(IdBlockRegister).values(
+                    name=self.name, next_id=(start or 0) + 1
+                )
+                await conn.execute(insert.on_conflict_do_nothing())
+                end = (await conn.execute(stmt)).scalar_one()
+
+        self.next_id, self.end_id = end - size, end
+        self.high_water = max(self.high_water, end)
+        self.high_water_read = time.monotonic()
+
+
+url_id_allocator = IdAllocator("urls", block_size=settings.id_block_size)
@@ -1,73 +1,416 @@
-from sqlalchemy import select
+import time
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+
+from sqlalchemy import delete, or_, select, update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import UrlModel, UrlRegister
-from app.utils.hash import from_hash, to_hash
+from app.config import settings
+from app.database import on_replica, use_primary
+from app.models import ClickRegister, UrlModel, UrlRegister
+from app.repository.base import (
+    BULK_CHUNK_SIZE,
+    MAX_IDX,
+    chunks,
+    dialect_insert,
+    to_idx,
+)
+from app.repository.id_allocator import url_id_allocator
+from app.utils.digest import url_digest
+from app.utils.entry import CachedUrl
+from app.utils.hash import to_hash, to_hashes
+from app.utils.metrics import timed
+
+# columns of the cache entries, see app/utils/entry.py
+ENTRY_COLUMNS = (
+    UrlRegister.url,
+    UrlRegister.version,
+    UrlRegister.updated_at,
+    UrlRegister.permanent,
+    UrlRegister.expires_at,
+)
+
+
+def _timestamp(value: int | None) -> datetime | None:
+    "unix timestamp column to an aware datetime"
+    return datetime.fromtimestamp(value, tz=UTC) if value else None
+
+
+def _to_entry(row) -> CachedUrl:
+    "cache entry of a row selected with ENTRY_COLUMNS"
+    return CachedUrl(
+        row.url, row.version, row.updated_at, row.permanent, row.expires_at or 0
+    )
+
+
+def _live(now: float):
+    "filter of the links that did not expire yet"
+    return or_(UrlRegister.expires_at.is_(None), UrlRegister.expires_at > now)
 
 
 def _to_model(item: UrlRegister) -> UrlModel:
     "helper function to convert a database row model to a pydantic obj"
-    return UrlModel(hash=to_hash(item.idx), url=item.url, on=item.on)
+    return _to_models([item])[0]
+
+
+def _to_models(items) -> list[UrlModel]:
+    "batch version of _to_model"
+    hashes = to_hashes(item.idx for item in items)
+    return [
+        UrlModel(
+            hash=hash,
+            url=item.url,
+            on=item.on,
+            permanent=item.permanent,
+            version=item.version,
+            updated_at=_timestamp(item.updated_at),
+            expires_at=_timestamp(item.expires_at),
+        )
+        for hash, item in zip(hashes, items)
+    ]
+
+
+def _to_entries(rows) -> dict[str, CachedUrl]:
+    "map the hash to the cache entry of rows selected with ENTRY_COLUMNS"
+    hashes = to_hashes(row.idx for row in rows)
+    return {hash: _to_entry(row) for hash, row in zip(hashes, rows)}
 
 
 class UrlRepository:
     "CRUD abstraction over the SQL table"
 
+    @timed("db")
     async def get(self, hash: str, db: AsyncSession) -> UrlModel | None:
         """Retrieve a URL record by its hash."""
-        item = await db.get(UrlRegister, from_hash(hash))
+        if (idx := to_idx(hash)) is None:
+            return None
+        item = await db.get(UrlRegister, idx)
         return _to_model(item) if item else None
 
+    @timed("db")
+    async def get_entry(self, hash: str, db: AsyncSession) -> CachedUrl | None:
+        """Retrieve the cache entry of an active record, skipping the ORM objects."""
+        if (idx := to_idx(hash)) is None:
+            return None
+        stmt = select(*ENTRY_COLUMNS).where(
+            UrlRegister.idx == idx, UrlRegister.on.is_(True), _live(time.time())
+        )
+        row = (await db.execute(stmt)).one_or_none()
+        # a replica may lag behind a link created a moment ago, older ids and
+        # ids never handed out are trusted to it
+        if (
+            row is None
+            and on_replica(db)
+            and await url_id_allocator.recently_reserved(
+                idx, db, settings.db_replica_retry_span
+            )
+            and use_primary(db)
+        ):
+            row = (await db.execute(stmt)).one_or_none()
+        return _to_entry(row) if row is not None else None
+
+    @timed("db")
     async def get_by_url(self, url: str, db: AsyncSession) -> UrlModel | None:
         """Retrieve a URL record by its URL."""
-        stmt = select(UrlRegister).where(UrlRegister.url == url)
+        stmt = select(UrlRegister).where(UrlRegister.url_digest == url_digest(url))
         item = (await db.execute(stmt)).scalars().first()
         return _to_model(item) if item else None
 
+    @timed("db")
     async def get_all(self, db: AsyncSession) -> list[UrlModel]:
         """Retrieve all URL records."""
         stmt = select(UrlRegister)
         items = (await db.execute(stmt)).scalars().all()
-        return [_to_model(item) for item in items]
+        return _to_models(items)
+
+    @timed("db")
+    async def get_page(
+        self, db: AsyncSession, after: int = 0, limit: int = 100
+    ) -> list[UrlModel]:
+        """Retrieve a page of URL records with an index greater than `after`."""
+        stmt = (
+            select(UrlRegister)
+            .where(UrlRegister.idx > min(after, MAX_IDX))
+            .order_by(UrlRegister.idx)
+            .limit(limit)
+        )
+        items = (await db.execute(stmt)).scalars().all()
+        return _to_models(items)
+
+    @timed("db")
+    async def get_active(
+        self, idxs: list[int], db: AsyncSession
+    ) -> dict[str, CachedUrl]:
+        """Map the hash to the cache entry of the active records among the indexes."""
+        entries, now = {}, time.time()
+        for chunk in chunks(idxs):
+            stmt = select(UrlRegister.idx, *ENTRY_COLUMNS).where(
+                UrlRegister.idx.in_(chunk), UrlRegister.on.is_(True), _live(now)
+            )
+            entries.update(_to_entries((await db.execute(stmt)).all()))
+        return entries
+
+    @timed("db")
+    async def get_latest(
+        self, db: AsyncSession, limit: int = 100
+    ) -> dict[str, CachedUrl]:
+        """Map the hash to the cache entry of the most recent active records."""
+        stmt = (
+            select(UrlRegister.idx, *ENTRY_COLUMNS)
+            .where(UrlRegister.on.is_(True), _live(time.time()))
+            .order_by(UrlRegister.idx.desc())
+            .limit(limit)
+        )
+        return _to_entries((await db.execute(stmt)).all())
 
-    async def add(self, url: str, db: AsyncSession) -> UrlModel | None:
-        """Add a new URL record."""
-        item = UrlRegister(url=url)
+    async def stream(self, db: AsyncSession, after: int = 0) -> AsyncIterator[UrlModel]:
+        """Iterate over all URL records using a server side cursor."""
+        stmt = (
+            select(UrlRegister)
+            .where(UrlRegister.idx > min(after, MAX_IDX))
+            .order_by(UrlRegister.idx)
+            .execution_options(yield_per=BULK_CHUNK_SIZE)
+        )
+        async for item in (await db.stream(stmt)).scalars():
+            yield _to_model(item)
+
+    async def stream_entries(
+        self, db: AsyncSession, size: int = BULK_CHUNK_SIZE
+    ) -> AsyncIterator[dict[str, CachedUrl]]:
+        """Iterate over the cache entries of all active records, `size` at a time."""
+        stmt = (
+            select(UrlRegister.idx, *ENTRY_COLUMNS)
+            .where(UrlRegister.on.is_(True), _live(time.time()))
+            .order_by(UrlRegister.idx)
+            .execution_options(yield_per=size)
+        )
+        async for rows in (await db.stream(stmt)).partitions():
+            yield _to_entries(rows)
+
+    @timed("db")
+    async def add(
+        self,
+        url: str,
+        db: AsyncSession,
+        permanent: bool = False,
+        expires_at: int | None = None,
+    ) -> UrlModel | None:
+        """Add a new URL record, expiring at the `expires_at` unix timestamp."""
+        # the index is known upfront, no refresh round trip after the commit
+        [idx] = await url_id_allocator.allocate(1, db)
+        updated_at = int(time.time())
+        item = UrlRegister(
+            idx=idx,
+            url=url,
+            url_digest=url_digest(url),
+            on=True,
+            version=1,
+            updated_at=updated_at,
+            permanent=permanent,
+            expires_at=expires_at,
+        )
 
         try:
             db.add(item)
             await db.commit()
-            await db.refresh(item)
-            return _to_model(item)
+            return UrlModel(
+                hash=to_hash(idx),
+                url=url,
+                on=True,
+                permanent=permanent,
+                version=1,
+                updated_at=_timestamp(updated_at),
+                expires_at=_timestamp(expires_at),
+            )
         except IntegrityError:  # handle duplicate URL case
             await db.rollback()
             return None
 
+    @timed("db")
+    async def add_many(
+        self, urls: list[str], db: AsyncSession, expires_at: int | None = None
+    ) -> tuple[list[UrlModel], int]:
+        """Add many URL records at once, existing URLs are returned as they are.
+
+        Returns the records in the same order as the input and the number of
+        URLs that were already registered.
+        """
+        # URLs are deduplicated by digest, the first spelling of a URL wins
+        digests = {url: url_digest(url) for url in urls}
+        unique = {digest: url for url, digest in reversed(digests.items())}
+        unique = dict(reversed(unique.items()))
+        records: dict[bytes, UrlModel] = {}
+
+        insert = dialect_insert(db)
+        updated_at = int(time.time())
+        ids = await url_id_allocator.allocate(len(unique), db)
+        for chunk in chunks(list(zip(ids, unique.items()))):
+            rows = [
+                {
+                    "idx": idx,
+                    "url": url,
+                    "url_digest": digest,
+                    "on": True,
+                    "updated_at": updated_at,
+                    "expires_at": expires_at,
+                }
+                for idx, (digest, url) in chunk
+            ]
+            stmt = (
+                insert(UrlRegister)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=[UrlRegister.url_digest])
+                .returning(
+                    UrlRegister.idx,
+                    UrlRegister.url_digest,
+                    UrlRegister.on,
+                    *ENTRY_COLUMNS,
+                )
+            )
+            items = (await db.execute(stmt)).all()
+            records.update(zip((item.url_digest for item in items), _to_models(items)))
+        await db.commit()
+
+        # single lookup for the URLs that were skipped by the conflict clause
+        duplicated = [digest for digest in unique if digest not in records]
+        for chunk in chunks(duplicated):
+            stmt = select(UrlRegister).where(UrlRegister.url_digest.in_(chunk))
+            items = (await db.execute(stmt)).scalars().all()
+            records.update(zip((item.url_digest for item in items), _to_models(items)))
+
+        return [records[digests[url]] for url in urls if digests[url] in records], len(
+            duplicated
+        )
+
+    @timed("db")
+    async def import_many(self, rows: list[dict], db: AsyncSession) -> int:
+        """Insert raw records, keeping the index of those that have one.
+
+        Rows need the `url`, `on`, `permanent` and `expires_at` columns, the
+        `idx`, `version` and `updated_at` ones are optional. Rows conflicting
+        with an existing index or URL are skipped, returns the number of
+        inserted ones. A row keeping its index raises a ValueError, and
+        nothing is committed, when that index holds another URL or its URL
+        has another index.
+        """
+        kept = {row["idx"]: row["url"] for row in rows if row.get("idx") is not None}
+        missing = [row for row in rows if row.get("idx") is None]
+        for row, idx in zip(missing, await url_id_allocator.allocate(len(missing), db)):
+            row["idx"] = idx
+        updated_at = int(time.time())
+        for row in rows:
+            row["url_digest"] = url_digest(row["url"])
+            row["version"] = row.get("version") or 1
+            row["updated_at"] = row.get("updated_at") or updated_at
+
+        insert = dialect_insert(db)
+        inserted = 0
+        for chunk in chunks(rows):
+            stmt = (
+                insert(UrlRegister)
+                .values(chunk)
+                .on_conflict_do_nothing()
+                .returning(UrlRegister.idx, UrlRegister.url)
+            )
+            for idx, url in (await db.execute(stmt)).all():
+                if kept.get(idx) == url:
+                    del kept[idx]
+                inserted += 1
+        await self._check_kept(kept, db)
+        await db.commit()
+        return inserted
+
+    async def _check_kept(self, kept: dict[int, str], db: AsyncSession) -> None:
+        "skipped rows keeping their index must already be in the table as is"
+        found = {}
+        for chunk in chunks(list(kept)):
+            stmt = select(UrlRegister.idx, UrlRegister.url).where(
+                UrlRegister.idx.in_(chunk)
+            )
+            found.update((await db.execute(stmt)).tuples().all())
+        for idx, url in kept.items():
+            if found.get(idx) != url:
+                await db.rollback()
+                raise ValueError(
+                    f"hash {to_hash(idx)} of {url} is taken by {found.get(idx)}"
+                )
+
+    @timed("db")
     async def delete(self, hash: str, db: AsyncSession) -> UrlModel | None:
         """Delete a URL record by its hash."""
-        item = await db.get(UrlRegister, from_hash(hash))
+        use_primary(db)
+        idx = to_idx(hash)
+        item = await db.get(UrlRegister, idx) if idx is not None else None
         if item is None:
             return None
         await db.delete(item)
         await db.commit()
         return _to_model(item)
 
+    @timed("db")
     async def update(self, update: UrlModel, db: AsyncSession) -> UrlModel | None:
-        """Update an existing URL record."""
-        item = await db.get(UrlRegister, from_hash(update.hash))
+        """Update an existing URL record, bumping its version."""
+        use_primary(db)
+        idx = to_idx(update.hash)
+        item = await db.get(UrlRegister, idx) if idx is not None else None
         if item is None:
             return None
 
         # update fields only if they are provided
         if update.url is not None:
             item.url = str(update.url)
+            item.url_digest = url_digest(item.url)
         if update.on is not None:
             item.on = update.on
+        if update.permanent is not None:
+            item.permanent = update.permanent
+        if update.expires_at is not None:
+            item.expires_at = int(update.expires_at.timestamp())
+        # incremented by the DB, concurrent updates get distinct versions
+        item.version = UrlRegister.version + 1
+        item.updated_at = int(time.time())
 
         await db.commit()
         await db.refresh(item)
         return _to_model(item)
 
+    @timed("db")
+    async def expire(
+        self, db: AsyncSession, now: int, limit: int = 1000, purge: bool = True
+    ) -> list[str]:
+        """Delete, or deactivate, a batch of expired records, returns their hashes.
+
+        Deleted records take their click counters with them.
+        The batch is picked on the `expires_at` index, rows locked by another
+        worker sweeping at the same time are skipped.
+        """
+        stmt = (
+            select(UrlRegister.idx)
+            .where(UrlRegister.expires_at <= now)
+            .order_by(UrlRegister.expires_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        if not purge:  # deactivated rows stay expired, do not pick them again
+            stmt = stmt.where(UrlRegister.on.is_(True))
+        idxs = (await db.execute(stmt)).scalars().all()
+        if not idxs:
+            await db.rollback()
+            return []
+
+        if purge:  # with their clicks, a later link never reuses an index
+            await db.execute(delete(ClickRegister).where(ClickRegister.idx.in_(idxs)))
+            stmt = delete(UrlRegister).where(UrlRegister.idx.in_(idxs))
+        else:
+            stmt = (
+                update(UrlRegister)
+                .where(UrlRegister.idx.in_(idxs))
+                .values(on=False, version=UrlRegister.version + 1, updated_at=now)
+            )
+        await db.execute(stmt)
+        await db.commit()
+        return to_hashes(idxs)
+
 
 url_repository = UrlRepository()
@@ -0,0 +1,83 @@
+"""Production entry point, gunicorn managing one uvicorn worker per core.
+
+python -m app.server
+"""
+
+import importlib.util
+import os
+from typing import Any, ClassVar
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from app.config import settings
+from app.service import metrics_sync
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+class Worker(UvicornWorker):
+    "uvicorn worker using the C event loop and http parser when available"
+
+    CONFIG_KWARGS: ClassVar[dict[str, Any]] = {
+        "loop": "uvloop" if _installed("uvloop") else "asyncio",
+        "http": "httptools" if _installed("httptools") else "h11",
+    }
+
+
+def worker_count() -> int:
+    "one async worker per core available to the container, unless configured"
+    if settings.server_workers > 0:
+        return settings.server_workers
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+class Server(BaseApplication):
+    "embedded gunicorn application, avoids a separate gunicorn config file"
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # imported in each worker, so every worker builds its own pools
+        from app.main import app
+
+        return app
+
+
+def child_exit(server, worker):
+    "gunicorn hook in the master, once a worker exited"
+    if settings.prometheus_multiproc_dir:
+        metrics_sync.mark_dead(settings.prometheus_multiproc_dir, worker.pid)
+
+
+def main():
+    if settings.prometheus_multiproc_dir:
+        metrics_sync.reset(settings.prometheus_multiproc_dir)
+    options = {
+        "bind": f"{settings.server_host}:{settings.server_port}",
+        "workers": worker_count(),
+        "worker_class": Worker,
+        "keepalive": settings.server_keepalive,
+        "backlog": settings.server_backlog,
+        "timeout": settings.server_timeout,
+        "graceful_timeout": settings.server_timeout,
+        "preload_app": False,
+        "accesslog": None,
+        "child_exit": child_exit,
+    }
+    Server(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import logging
+from collections.abc import Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from app.cache import NOT_FOUND, evict_local, get_redis, queue_deletes, queue_entries
+from app.config import settings
+from app.models import UrlModel
+from app.service.invalidation import invalidation_bus
+from app.utils.entry import CachedUrl
+from app.utils.metrics import Counter, Gauge, registry, tier_latency
+
+logger = logging.getLogger(__name__)
+
+
+class CacheSync:
+    """Write-behind updates of the redis cache after a DB commit.
+
+    The write handlers queue an upsert or an invalidation per short URL and
+    return right after the commit. Operations on the same key are coalesced,
+    only the last one is kept, and a background task applies them in
+    pipelined batches of one MSET and one DEL (or a HSET and a HDEL per bucket
+    of the bucket layout), then publishes the hashes of
+    the batch on the invalidation bus.
+
+    Consistency: the DB stays the source of truth. The worker that committed
+    drops its local entry and reads its own writes, pending operations take
+    precedence over redis in the resolver. Redis converges to the last
+    committed state of every key within `linger` seconds while it is
+    reachable, and the other workers evict their local entries right after.
+    A failed batch is retried with an exponential backoff, a newer operation
+    on the same key always wins over the retried one. When the worker stops
+    the pending operations are retried for up to `stop_timeout` seconds, and
+    only then logged as lost, with their hashes.
+
+    With `write_through` (the "cache" serving mode, where redis is the only
+    read store) the write handlers also `confirm` their operations: they wait
+    until redis applied them, for up to `write_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Awaitable[Redis]],
+        publish: Callable[[list[str]], Awaitable[None]] | None = None,
+        batch_size: int = 500,
+        linger: float = 0.005,
+        retry_delay: float = 0.1,
+        max_retry_delay: float = 5.0,
+        write_through: bool = False,
+        write_timeout: float = 5.0,
+        stop_timeout: float = 20.0,
+    ):
+        self.client_factory = client_factory
+        self.publish = publish
+        self.batch_size = batch_size
+        self.linger = linger
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.write_through = write_through
+        self.write_timeout = write_timeout
+        self.stop_timeout = stop_timeout
+        # hash -> entry to cache, or NOT_FOUND to invalidate
+        self.pending: dict[str, object] = {}
+        self.inflight: dict[str, object] = {}
+        # hash -> futures of the handlers confirming its last operation
+        self.waiters: dict[str, list[asyncio.Future]] = {}
+        self.wake = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.flushed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def set(self, hash: str, entry: CachedUrl) -> None:
+        """Queue an upsert of the cache entry of a short URL."""
+        self._queue(hash, entry)
+
+    def delete(self, hash: str) -> None:
+        """Queue an invalidation of a short URL."""
+        self._queue(hash, NOT_FOUND)
+
+    def sync(self, record: UrlModel) -> None:
+        """Queue the cache state matching a committed record."""
+        if record.on:
+            updated_at = int(record.updated_at.timestamp()) if record.updated_at else 0
+            expires_at = int(record.expires_at.timestamp()) if record.expires_at else 0
+            entry = CachedUrl(
+                str(record.url),
+                record.version or 0,
+                updated_at,
+                bool(record.permanent),
+                expires_at,
+            )
+            self._queue(record.hash, entry)
+        else:
+            self._queue(record.hash, NOT_FOUND)
+
+    def get(self, hash: str) -> object | None:
+        """Pending operation of a hash: its entry, NOT_FOUND, or None if none."""
+        op = self.pending.get(hash)
+        return op if op is not None else self.inflight.get(hash)
+
+    async def confirm(self, *hashes: str) -> None:
+        """In write-through mode, wait until redis applied the operations of the
+        hashes, raises TimeoutError after `write_timeout` (they stay queued)."""
+        if not self.write_through:
+            return
+        loop = asyncio.get_running_loop()
+        futures = []
+        for hash in hashes:
+            if self.get(hash) is not None:
+                futures.append(future := loop.create_future())
+                self.waiters.setdefault(hash, []).append(future)
+        if futures:
+            async with asyncio.timeout(self.write_timeout):
+                await asyncio.gather(*futures)
+
+    def _queue(self, hash: str, op: object) -> None:
+        evict_local(hash)  # may hold the old value or a negative entry
+        self.pending.pop(hash, None)  # the newest operation goes last
+        self.pending[hash] = op
+        self.wake.set()
+
+    async def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and apply the pending operations, retried
+        for up to `stop_timeout` seconds, the ones left are logged as lost."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        loop = asyncio.get_running_loop()
+        deadline, delay = loop.time() + self.stop_timeout, self.retry_delay
+        while self.pending:
+            if await self.flush():
+                continue
+            if loop.time() >= deadline:
+                self.dropped += len(self.pending)
+                logger.critical(
+                    "lost %d cache updates on stop, redis misses: %s",
+                    len(self.pending),
+                    " ".join(self.pending),
+                )
+                self.pending.clear()
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+        for futures in self.waiters.values():
+            for future in futures:
+                future.cancel()
+        self.waiters.clear()
+
+    async def _run(self) -> None:
+        delay = self.retry_delay
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            # give the operations of concurrent requests a chance to share a batch
+            if len(self.pending) < self.batch_size:
+                await asyncio.sleep(self.linger)
+            while self.pending:
+                if await self.flush():
+                    delay = self.retry_delay
+                    continue
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def flush(self) -> bool:
+        """Apply a batch of pending operations, re-queued when redis fails."""
+        batch = dict(itertools.islice(self.pending.items(), self.batch_size))
+        for hash in batch:
+            del self.pending[hash]
+        self.inflight = batch
+
+        sets = {hash: op for hash, op in batch.items() if op is not NOT_FOUND}
+        deletes = [hash for hash, op in batch.items() if op is NOT_FOUND]
+        try:
+            client = await self.client_factory()
+            pipe = client.pipeline(transaction=False)
+            queue_entries(pipe, sets)
+            queue_deletes(pipe, deletes)
+            with tier_latency.time("redis", "sync"):
+                await pipe.execute()
+            # the other workers evict their entries once redis is up to date
+            if self.publish is not None:
+                await self.publish(list(batch))
+        except Exception:
+            # operations queued in the meantime are newer and stay as they are
+            for hash, op in batch.items():
+                self.pending.setdefault(hash, op)
+            self.retried += len(batch)
+            logger.exception("failed to apply %d cache updates", len(batch))
+            return False
+        finally:
+            self.inflight = {}
+
+        self.flushed += len(batch)
+        for hash in batch:
+            # a newer operation of the hash is still to be confirmed
+            if hash not in self.pending:
+                for future in self.waiters.pop(hash, ()):
+                    if not future.done():
+                        future.set_result(None)
+        return True
+
+
+cache_sync = CacheSync(
+    get_redis,
+    invalidation_bus.publish,
+    batch_size=settings.cache_sync_batch_size,
+    linger=settings.cache_sync_linger,
+    retry_delay=settings.cache_sync_retry_delay,
+    max_retry_delay=settings.cache_sync_max_retry_delay,
+    write_through=settings.serving_mode == "cache",
+    write_timeout=settings.cache_sync_write_timeout,
+    stop_timeout=settings.cache_sync_stop_timeout,
+)
+
+registry.register(
+    Gauge(
+        "cache_sync_pending",
+        "write-behind cache updates waiting in the worker",
+        lambda: {(): len(cache_sync.pending)},
+    )
+)
+registry.register(
+    Counter(
+        "cache_sync_operations_total",
+        "write-behind cache updates by outcome",
+        labels=("state",),
+        callback=lambda: {
+            ("flushed",): cache_sync.flushed,
+            ("retried",): cache_sync.retried,
+            ("dropped",): cache_sync.dropped,
+        },
+    )
+)
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database import SessionLocal
+from app.repository.click_repository import click_repository
+from app.utils import metrics
+from app.utils.metrics import Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+
+class ClickCollector:
+    """Buffers redirect events in memory and writes aggregated counts in batches.
+
+    Recording a click is a non blocking `put_nowait` on a bounded queue. When
+    the writer falls behind and the queue is full new events are dropped, so
+    a slow database never adds latency to the redirect route.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        maxsize: int = 100_000,
+        batch_size: int = 5_000,
+        flush_interval: float = 1.0,
+        bucket_seconds: int = 60,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.bucket_seconds = bucket_seconds
+        self.queue: asyncio.Queue[tuple[int, int]] = asyncio.Queue(maxsize)
+        self.batch_full = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+
+    def record(self, idx: int) -> None:
+        """Register a click for the table index of a short URL."""
+        now = int(time.time())
+        try:
+            self.queue.put_nowait((idx, now - now % self.bucket_seconds))
+            self.recorded += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        if self.queue.qsize() >= self.batch_size:
+            self.batch_full.set()
+
+    async def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background writer and flush the events still in the queue."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        while not self.queue.empty():
+            await self.flush(self._drain())
+
+    async def _run(self) -> None:
+        while True:
+            # wake up every flush interval, or earlier once a batch is full
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            self.batch_full.clear()
+            while not self.queue.empty():
+                await self.flush(self._drain())
+
+    def _drain(self) -> Counter:
+        counts: Counter = Counter()
+        for _ in range(min(self.batch_size, self.queue.qsize())):
+            counts[self.queue.get_nowait()] += 1
+        return counts
+
+    async def flush(self, counts: Counter) -> None:
+        """Write the aggregated counters, a failed batch is logged and dropped."""
+        if not counts:
+            return
+        try:
+            async with self.session_factory() as db:
+                await click_repository.add_counts(counts, db)
+            self.flushed += sum(counts.values())
+        except Exception:
+            self.dropped += sum(counts.values())
+            logger.exception("failed to write %d click buckets", len(counts))
+
+
+click_collector = ClickCollector(
+    SessionLocal,
+    maxsize=settings.clicks_queue_size,
+    batch_size=settings.clicks_batch_size,
+    flush_interval=settings.clicks_flush_interval,
+    bucket_seconds=settings.clicks_bucket_seconds,
+)
+
+registry.register(
+    Gauge(
+        "click_events_queued",
+        "clicks waiting in the queue of the worker",
+        lambda: {(): click_collector.queue.qsize()},
+    )
+)
+registry.register(
+    metrics.Counter(
+        "click_events_total",
+        "clicks handled by the analytics pipeline",
+        labels=("state",),
+        callback=lambda: {
+            ("recorded",): click_collector.recorded,
+            ("flushed",): click_collector.flushed,
+            ("dropped",): click_collector.dropped,
+        },
+    )
+)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from redis.asyncio import Redis
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import get_redis
+from app.config import settings
+from app.database import SessionLocal
+from app.repository.url_repository import url_repository
+from app.service.cache_sync import cache_sync
+from app.utils.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# held for an interval by the worker sweeping it, the others skip the round
+SWEEP_LOCK = "url-expiry:lock"
+
+
+class ExpirySweeper:
+    """Removes the expired links from the DB and the caches in the background.
+
+    Expired links already stop resolving on the redirect path, from their
+    cached `expires_at`, and redis drops them with their TTL. Every
+    `interval` seconds one of the workers, elected with a redis lock held
+    for the interval, deactivates, or purges, the expired rows in batches of
+    `batch_size` and invalidates them like a regular delete, so neither the
+    table nor the cache grow without limit.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        client_factory: Callable[[], Awaitable[Redis]],
+        interval: float = 60.0,
+        batch_size: int = 1000,
+        purge: bool = False,
+    ):
+        self.session_factory = session_factory
+        self.client_factory = client_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.purge = purge
+        self.task: asyncio.Task | None = None
+        self.swept = 0
+
+    async def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self.elected():
+                    await self.sweep()
+            except Exception:
+                logger.exception("failed to sweep the expired links")
+
+    async def elected(self) -> bool:
+        """Whether this worker sweeps the current interval.
+
+        The lock is left to expire, so the other workers skip the interval
+        instead of sweeping right after. The stand-in client of the tests
+        and the development setup elects every worker.
+        """
+        client = await self.client_factory()
+        if not isinstance(client, Redis):
+            return True
+        lease = max(int(self.interval * 1000) - 100, 1)
+        return bool(await client.set(SWEEP_LOCK, 1, nx=True, px=lease))
+
+    async def sweep(self) -> int:
+        """Sweep the links expired by now, returns how many."""
+        now, total = int(time.time()), 0
+        while True:
+            async with self.session_factory() as db:
+                hashes = await url_repository.expire(
+                    db, now, limit=self.batch_size, purge=self.purge
+                )
+            for hash in hashes:
+                cache_sync.delete(hash)
+            total += len(hashes)
+            self.swept += len(hashes)
+            if len(hashes) < self.batch_size:
+                return total
+            await asyncio.sleep(0)  # let the requests run between batches
+
+
+expiry_sweeper = ExpirySweeper(
+    SessionLocal,
+    get_redis,
+    interval=settings.expiry_sweep_interval,
+    batch_size=settings.expiry_sweep_batch_size,
+    purge=settings.expiry_sweep_mode == "purge",
+)
+
+registry.register(
+    Counter(
+        "expired_links_swept_total",
+        "expired links deactivated or purged",
+        callback=lambda: {(): expiry_sweeper.swept},
+    )
+)
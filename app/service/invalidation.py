@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+
+from redis.asyncio import Redis
+
+from app.cache import clear_local, evict_local, get_redis, local_cache
+from app.config import settings
+from app.utils.metrics import Counter, Gauge, registry, tier_latency
+
+logger = logging.getLogger(__name__)
+
+
+def evict(hashes: Iterable[str]) -> None:
+    "drop the local cache entries of the given hashes"
+    for hash in hashes:
+        evict_local(hash)
+
+
+class LocalBus:
+    "in-process stand-in of the invalidation bus, for a single worker in DEV"
+
+    connected = True
+
+    def __init__(self):
+        self.published = 0
+        self.received = 0
+
+    async def publish(self, hashes: list[str]) -> None:
+        """Evict the hashes right away, there are no other workers to notify."""
+        self.published += 1
+        self.received += 1
+        evict(hashes)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class RedisBus:
+    """Invalidations shared by every worker through a redis pub/sub channel.
+
+    The cache sync publishes the hashes of each applied batch in a single
+    message, after redis holds the new values, so the other workers reload
+    fresh entries once they evict theirs. Each worker runs a subscriber task.
+
+    Pub/sub delivery is at most once: while the subscription is down the
+    worker clears its local cache and keeps new entries only for
+    `degraded_ttl` seconds, bounding the staleness of missed messages. The
+    regular TTL is restored for new entries after reconnecting.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Awaitable[Redis]],
+        channel: str = "url-invalidations",
+        degraded_ttl: float = 1.0,
+        retry_delay: float = 0.1,
+        max_retry_delay: float = 5.0,
+    ):
+        self.client_factory = client_factory
+        self.channel = channel
+        self.degraded_ttl = degraded_ttl
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.ttl = local_cache.ttl
+        self.connected = False
+        self.task: asyncio.Task | None = None
+        self.published = 0
+        self.received = 0
+
+    async def publish(self, hashes: list[str]) -> None:
+        """Notify every worker, including this one, to evict the hashes."""
+        client = await self.client_factory()
+        with tier_latency.time("redis", "publish"):
+            await client.publish(self.channel, " ".join(hashes))
+        self.published += 1
+
+    async def start(self) -> None:
+        if self.task is None:
+            self._degrade()  # until the first subscription is confirmed
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.connected = False
+        local_cache.ttl = self.ttl
+
+    async def _run(self) -> None:
+        delay = self.retry_delay
+        while True:
+            try:
+                client = await self.client_factory()
+                async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self._restore()
+                    delay = self.retry_delay
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True, timeout=1.0
+                        )
+                        if message is not None:
+                            self._receive(message["data"])
+            except Exception:
+                logger.warning("invalidation bus disconnected", exc_info=True)
+                self._degrade()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def _receive(self, data: bytes | str) -> None:
+        if isinstance(data, bytes):
+            data = data.decode()
+        self.received += 1
+        evict(data.split())
+
+    def _degrade(self) -> None:
+        "messages may be missed, fall back to short lived local entries"
+        if self.connected:
+            clear_local()
+        self.connected = False
+        local_cache.ttl = self.degraded_ttl
+
+    def _restore(self) -> None:
+        # entries cached while disconnected expire within degraded_ttl anyway
+        local_cache.ttl = self.ttl
+        self.connected = True
+
+
+def gen_bus() -> LocalBus | RedisBus:
+    "redis pub/sub in PROD, the in-process stand-in otherwise"
+    if settings.env != "PROD":
+        return LocalBus()
+    return RedisBus(
+        get_redis,
+        channel=settings.invalidation_channel,
+        degraded_ttl=settings.invalidation_degraded_ttl,
+    )
+
+
+invalidation_bus = gen_bus()
+
+registry.register(
+    Gauge(
+        "invalidation_bus_connected",
+        "whether the worker is subscribed to the invalidation bus",
+        lambda: {(): int(invalidation_bus.connected)},
+    )
+)
+registry.register(
+    Counter(
+        "invalidation_messages_total",
+        "cross worker invalidation messages",
+        labels=("state",),
+        callback=lambda: {
+            ("published",): invalidation_bus.published,
+            ("received",): invalidation_bus.received,
+        },
+    )
+)
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+from app.config import settings
+from app.utils.metrics import Registry, registry
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSync:
+    """Shares the metrics of the gunicorn workers through a directory.
+
+    Each worker writes a snapshot of its registry to `<pid>.json` every
+    `interval` seconds and on shutdown, and the worker that answers a scrape
+    merges the files of all the workers: counters and histograms are summed,
+    dead workers included, gauges are reported per live worker with a `pid`
+    label. Without a directory the metrics are the ones of the worker alone.
+    """
+
+    def __init__(self, registry: Registry, directory: str = "", interval: float = 5.0):
+        self.registry = registry
+        self.directory = Path(directory) if directory else None
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.directory is not None and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+            await self.write()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.write()
+            except OSError:
+                logger.exception("failed to write the metrics of the worker")
+
+    async def write(self) -> None:
+        "write the snapshot of this worker, taken on the event loop"
+        snapshot = {
+            "pid": os.getpid(),
+            "live": True,
+            "metrics": self.registry.snapshot(),
+        }
+        await asyncio.to_thread(write_snapshot, self.directory, snapshot)
+
+    async def render(self) -> str:
+        """Prometheus text format of all the workers, or of this one."""
+        if self.directory is None:
+            return self.registry.render()
+        await self.write()
+        snapshots = await asyncio.to_thread(read_snapshots, self.directory)
+        return self.registry.render(self.registry.merge(snapshots))
+
+
+def write_snapshot(directory: Path, snapshot: dict) -> None:
+    # written aside and renamed, readers never see a partial file
+    path = directory / f"{snapshot['pid']}.json"
+    temp = path.with_suffix(".tmp")
+    temp.write_text(json.dumps(snapshot))
+    os.replace(temp, path)
+
+
+def read_snapshots(directory: Path) -> list[dict]:
+    snapshots = []
+    for path in directory.glob("*.json"):
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (OSError, ValueError):  # removed meanwhile
+            continue
+    return snapshots
+
+
+def reset(directory: str) -> None:
+    "remove the snapshots of a previous run, before the workers start"
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    for snapshot in path.glob("*.json"):
+        snapshot.unlink()
+
+
+def mark_dead(directory: str, pid: int) -> None:
+    "keep the counters of an exited worker, its gauges are gone with it"
+    path = Path(directory) / f"{pid}.json"
+    try:
+        snapshot = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return
+    snapshot["live"] = False
+    write_snapshot(Path(directory), snapshot)
+
+
+metrics_sync = MetricsSync(
+    registry,
+    directory=settings.prometheus_multiproc_dir,
+    interval=settings.metrics_sync_interval,
+)
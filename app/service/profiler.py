@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _frame_name(code) -> str:
+    "function and file of a frame, relative to the import path it was loaded from"
+    filename = code.co_filename
+    for path in _IMPORT_PATHS:
+        if filename.startswith(path):
+            filename = filename[len(path) :]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+# longest first, a package directory wins over its parents
+_IMPORT_PATHS = sorted(
+    (os.path.join(path, "") for path in sys.path if path), key=len, reverse=True
+)
+
+
+class SamplingProfiler:
+    """Samples the stack of the event loop thread at a fixed interval.
+
+    The sampler runs in its own thread for the duration of a profile, the
+    worker keeps serving requests meanwhile. The result is in the folded
+    stack format, one `frame;frame;frame count` line per distinct stack,
+    read by flamegraph.pl, speedscope or inferno. Only one profile runs at
+    a time.
+    """
+
+    def __init__(self):
+        self.running = False
+
+    async def profile(self, seconds: float, interval: float = 0.005) -> Counter:
+        """Sample the thread running this coroutine for `seconds`."""
+        if self.running:
+            raise RuntimeError("a profile is already running")
+        self.running = True
+        try:
+            return await asyncio.to_thread(
+                self.sample, threading.get_ident(), seconds, interval
+            )
+        finally:
+            self.running = False
+
+    def sample(self, thread_id: int, seconds: float, interval: float) -> Counter:
+        stacks = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:  # the thread is gone
+                break
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+            del frame
+            time.sleep(interval)
+        return stacks
+
+
+def render(stacks: Counter) -> str:
+    "folded stacks, the most sampled first"
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,235 @@
+import logging
+import re
+import time
+from collections.abc import Awaitable, Callable
+from typing import NamedTuple
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.cache import get_redis
+from app.config import settings
+from app.utils.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+rate_limited = registry.register(
+    Counter(
+        "rate_limited_total",
+        "requests rejected by the rate limiter",
+        labels=("rule",),
+    )
+)
+
+
+class Rule(NamedTuple):
+    "token bucket refilled with `rate` tokens per second, holding up to `burst`"
+
+    name: str
+    rate: float
+    burst: float
+
+
+def _compile(route: str) -> tuple[str, re.Pattern]:
+    "'METHOD /path/{param}' to the method and a regex of the path"
+    method, _, path = route.partition(" ")
+    pattern = re.sub(r"\\{[^/]+?\\}", "[^/]+", re.escape(path))
+    return method.upper(), re.compile(f"^{pattern}$")
+
+
+class RateLimiter:
+    """Per client token buckets kept in the worker memory.
+
+    Rules are declared per route template, a client is an API key when a
+    known one is sent and its IP address otherwise. Known API keys get
+    `key_factor` times the rate and burst of the rule.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]],
+        key_factor: float = 10.0,
+        max_clients: int = 100_000,
+    ):
+        self.rules: dict[str, list[tuple[re.Pattern, Rule]]] = {}
+        # the rules applied to known API keys, by name
+        self.keyed: dict[str, Rule] = {}
+        for route, (rate, burst) in limits.items():
+            method, pattern = _compile(route)
+            self.rules.setdefault(method, []).append(
+                (pattern, Rule(route, rate, burst))
+            )
+            self.keyed[route] = Rule(route, rate * key_factor, burst * key_factor)
+        self.max_clients = max_clients
+        # (rule, client) -> [tokens, last refill]
+        self.buckets: dict[tuple[Rule, str], list[float]] = {}
+
+    def match(self, method: str, path: str) -> Rule | None:
+        """Rule limiting a request, None when the route is not limited."""
+        for pattern, rule in self.rules.get(method, ()):
+            if pattern.match(path):
+                return rule
+        return None
+
+    async def acquire(self, rule: Rule, client: str) -> float:
+        """Take a token, returns 0 or the seconds to wait for the next one."""
+        return self.take(rule, client)
+
+    def take(self, rule: Rule, client: str) -> float:
+        now = time.monotonic()
+        key = (rule, client)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                self._prune(now)
+            bucket = self.buckets[key] = [rule.burst, now]
+
+        tokens = min(rule.burst, bucket[0] + (now - bucket[1]) * rule.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / rule.rate
+
+    def _prune(self, now: float) -> None:
+        "forget the buckets of idle clients, a full bucket is the initial state"
+        for (rule, client), (tokens, last) in list(self.buckets.items()):
+            if tokens + (now - last) * rule.rate >= rule.burst:
+                del self.buckets[rule, client]
+        if len(self.buckets) >= self.max_clients:
+            self.buckets.clear()
+
+
+# atomic token bucket shared by the workers, hands out up to `want` tokens
+LEASE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(want, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+local wait = 0
+if granted == 0 then
+    wait = (1 - tokens) / rate
+end
+return {granted, tostring(wait)}
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Global limits across workers, with redis holding the token buckets.
+
+    Workers lease tokens by `lease` at a time with an atomic script and
+    serve them from memory, so most requests do not leave the worker. A
+    rejected client is rejected locally until it may retry. When redis is
+    unreachable the local buckets of the worker take over for `cooldown`
+    seconds, then a single request probes redis again.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]],
+        client_factory: Callable[[], Awaitable[Redis]],
+        lease: int = 10,
+        cooldown: float = 5.0,
+        **kwargs,
+    ):
+        super().__init__(limits, **kwargs)
+        self.client_factory = client_factory
+        self.lease = lease
+        self.cooldown = cooldown
+        self.script = None
+        # redis is left alone until then after a failure, 0 while it answers
+        self.down_until = 0.0
+        self.logged_until = 0.0
+        # (rule, client) -> leased tokens, or the time a rejected client may retry
+        self.leases: dict[tuple[Rule, str], int] = {}
+        self.blocked: dict[tuple[Rule, str], float] = {}
+
+    async def acquire(self, rule: Rule, client: str) -> float:
+        key = (rule, client)
+        leased = self.leases.get(key, 0)
+        if leased > 0:
+            self.leases[key] = leased - 1
+            return 0.0
+
+        now = time.monotonic()
+        if (until := self.blocked.get(key)) is not None:
+            if now < until:
+                return until - now
+            del self.blocked[key]
+
+        if now < self.down_until:
+            return self.take(rule, client)
+        probe = self.down_until > 0
+        if probe:
+            # the other requests stay on the local buckets meanwhile
+            self.down_until = now + self.cooldown
+
+        try:
+            granted, wait = await self._lease(rule, client)
+        except (RedisError, OSError, TimeoutError) as exc:
+            self._trip(exc)
+            return self.take(rule, client)
+        if probe:
+            self.down_until = 0.0
+            logger.info("rate limiter back on redis")
+
+        if len(self.leases) >= self.max_clients:
+            self.leases.clear()
+            self.blocked.clear()
+        if granted == 0:
+            self.blocked[key] = now + wait
+            return wait
+        self.leases[key] = granted - 1
+        return 0.0
+
+    def _trip(self, exc: Exception) -> None:
+        "use the local buckets for a while, logging once per window"
+        now = time.monotonic()
+        self.down_until = max(self.down_until, now + self.cooldown)
+        if now >= self.logged_until:
+            self.logged_until = self.down_until
+            logger.warning(
+                "rate limiter on local buckets for %ss, redis failed: %r",
+                self.cooldown,
+                exc,
+            )
+
+    async def _lease(self, rule: Rule, client: str) -> tuple[int, float]:
+        if self.script is None:
+            self.script = (await self.client_factory()).register_script(LEASE_SCRIPT)
+        want = max(1, min(self.lease, int(rule.burst)))
+        granted, wait = await self.script(
+            keys=[f"ratelimit:{rule.name}:{client}"],
+            args=[rule.rate, rule.burst, want],
+        )
+        return int(granted), float(wait)
+
+
+def gen_rate_limiter() -> RateLimiter:
+    "local buckets by default, global ones through redis when configured"
+    kwargs = {
+        "key_factor": settings.rate_limit_key_factor,
+        "max_clients": settings.rate_limit_max_clients,
+    }
+    if settings.rate_limit_backend == "redis":
+        return RedisRateLimiter(
+            settings.rate_limits,
+            get_redis,
+            lease=settings.rate_limit_lease,
+            cooldown=settings.rate_limit_redis_cooldown,
+            **kwargs,
+        )
+    return RateLimiter(settings.rate_limits, **kwargs)
+
+
+rate_limiter = gen_rate_limiter()
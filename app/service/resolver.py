@@ -0,0 +1,123 @@
+import time
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import NOT_FOUND, generations, local_cache, read_entry, write_entry
+from app.config import settings
+from app.database import LazySession
+from app.repository.url_repository import url_repository
+from app.service.cache_sync import cache_sync
+from app.utils.entry import CachedUrl
+from app.utils.metrics import cache_requests, tier_latency
+from app.utils.singleflight import SingleFlight
+
+# in flight cache miss lookups of this worker, keyed by hash
+lookups = SingleFlight()
+
+
+async def resolve_url(
+    hash: str, session_factory: sessionmaker, rd: Redis
+) -> CachedUrl | None:
+    """Cache entry of an active short URL, or None if unknown or inactive.
+
+    Looks up the worker local cache, then redis and finally the DB. Both cache
+    tiers are filled on the way back. In the "cache" serving mode redis holds
+    every active link and the DB is never queried.
+
+    A lookup shared by concurrent requests outlives the request that started
+    it, so it opens its own session, only once it reaches the DB.
+    """
+    # check the worker local cache first, a hit never touches the network
+    entry = local_cache.get(hash)
+    if entry is not None:
+        cache_requests.inc("local", "hit")
+        if entry is NOT_FOUND:
+            return None
+    else:
+        cache_requests.inc("local", "miss")
+        # concurrent misses for the same hash share a single redis and DB lookup
+        entry = await lookups.do(hash, lambda: _load(hash, session_factory, rd))
+
+    # expired links stop resolving right away, the sweeper removes them later
+    if entry is not None and entry.expires_at and entry.expired(time.time()):
+        return None
+    return entry
+
+
+async def _load(
+    hash: str, session_factory: sessionmaker, rd: Redis
+) -> CachedUrl | None:
+    "resolve a hash missing from the local cache"
+    # writes of this worker not applied to redis yet take precedence
+    pending = cache_sync.get(hash)
+    if isinstance(pending, CachedUrl):
+        local_cache.set(hash, pending)
+        return pending
+
+    # an eviction while redis or the DB answer means the value read may be
+    # older than the write that evicted it, it is returned but not cached
+    generation = generations.setdefault(hash, 0)
+    try:
+        if pending is None:
+            entry = await _load_cached(hash, rd, generation)
+            if entry is not None:
+                return entry
+
+        if settings.serving_mode == "cache":
+            # redis is the read store, a miss is an unknown or inactive link
+            _cache(hash, NOT_FOUND, generation, ttl=_negative_ttl())
+            return None
+        db = LazySession(session_factory)
+        try:
+            return await _load_db(hash, db, rd, generation)
+        finally:
+            await db.close()
+    finally:
+        del generations[hash]
+
+
+def _cache(hash: str, entry: object, generation: int, ttl: float | None = None) -> bool:
+    "fill the local cache, unless the hash was evicted since the load started"
+    if generations[hash] != generation:
+        return False
+    local_cache.set(hash, entry, ttl=ttl)
+    return True
+
+
+async def _load_cached(hash: str, rd: Redis, generation: int) -> CachedUrl | None:
+    "lookup redis, filling the local cache on a hit"
+    # check if short URL already in cache
+    with tier_latency.time("redis", "get"):
+        entry = await read_entry(rd, hash)
+    if entry is not None:
+        cache_requests.inc("redis", "hit")
+        _cache(hash, entry, generation)
+        return entry
+
+    cache_requests.inc("redis", "miss")
+    return None
+
+
+def _negative_ttl() -> float:
+    return min(settings.negative_cache_ttl, local_cache.ttl)
+
+
+async def _load_db(
+    hash: str, db: AsyncSession, rd: Redis, generation: int
+) -> CachedUrl | None:
+    "lookup the DB, filling both cache tiers"
+    # query the SQL DB, the session only checks out a connection at this point
+    entry = await url_repository.get_entry(hash, db)
+    if entry is None:
+        # unknown and inactive hashes are remembered for a short while
+        _cache(hash, NOT_FOUND, generation, ttl=_negative_ttl())
+        return None
+
+    # cache short URL, a stale row must not overwrite the newer redis value
+    if _cache(hash, entry, generation):
+        with tier_latency.time("redis", "set"):
+            await write_entry(rd, hash, entry)
+
+    return entry
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+
+from redis.asyncio import Redis
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import (
+    clear_local,
+    get_redis,
+    local_cache,
+    queue_deletes,
+    queue_entries,
+    track_evictions,
+)
+from app.config import settings
+from app.database import SessionLocal
+from app.repository.base import to_idx
+from app.repository.click_repository import click_repository
+from app.repository.url_repository import url_repository
+from app.utils.entry import CachedUrl
+from app.utils.hash import to_hashes
+
+logger = logging.getLogger(__name__)
+
+# set once redis holds every active link of the layout, the lock elects the
+# worker filling it
+BACKFILL_KEY = f"url-backfill:{settings.cache_layout}"
+BACKFILL_LOCK = f"url-backfill:{settings.cache_layout}:lock"
+
+
+class WarmUp:
+    """Preloads the hot short URLs in redis and in the local cache on startup.
+
+    The hottest links are the most clicked ones of the last `window` seconds,
+    completed with the most recent ones. The worker reports ready once the
+    warm-up finished, failed or timed out, a cold cache is slower but still
+    correct.
+
+    With `backfill` redis is the read store of the app (the "cache" serving
+    mode): it is filled with every active link instead, once for all the
+    workers, unless an earlier worker already did and redis kept the marker.
+    The worker is only ready once the backfill is done, it retries every
+    `check_interval` seconds until then, and watches the marker afterwards:
+    when redis lost its data, e.g. flushed or restarted without persistence,
+    the worker turns unready and backfills again.
+
+    Both only write the keys missing from redis, the values written by the
+    app meanwhile are newer. The links evicted while they run, updated or
+    deleted after they may have been read, are read and written again.
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        client_factory: Callable[[], Awaitable[Redis]],
+        size: int = 1000,
+        window: int = 86400,
+        timeout: float = 10.0,
+        backfill: bool = False,
+        check_interval: float = 10.0,
+    ):
+        self.session_factory = session_factory
+        self.client_factory = client_factory
+        self.size = size
+        self.window = window
+        self.timeout = timeout
+        self.backfill = backfill
+        self.check_interval = check_interval
+        self.task: asyncio.Task | None = None
+        self.ready = False
+        self.loaded = 0
+
+    async def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self) -> None:
+        """Warm the caches, the worker is ready afterwards even if it failed."""
+        if self.backfill:
+            return await self.keep_filled()
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                self.loaded = await self.load()
+            logger.info(
+                "warmed %d links in %.2fs", self.loaded, time.perf_counter() - start
+            )
+        except Exception:
+            logger.exception("cache warm-up failed, starting cold")
+        finally:
+            self.ready = True
+
+    async def keep_filled(self) -> None:
+        """Backfill redis, then watch that it keeps the data, until cancelled.
+
+        Redis is the only read store, the worker is not ready while it is
+        missing links: a miss would be answered with a 404.
+        """
+        while True:
+            start = time.perf_counter()
+            try:
+                async with asyncio.timeout(self.timeout):
+                    self.loaded = await self.load_all()
+            except Exception:
+                logger.exception("redis backfill failed, retrying")
+                self.ready = False
+                await asyncio.sleep(self.check_interval)
+                continue
+            if not self.ready:
+                logger.info(
+                    "backfilled %d links in %.2fs",
+                    self.loaded,
+                    time.perf_counter() - start,
+                )
+                # misses cached while redis was empty
+                clear_local()
+                self.ready = True
+            await asyncio.sleep(self.check_interval)
+            try:
+                client = await self.client_factory()
+                if await client.exists(BACKFILL_KEY):
+                    continue
+            except Exception:
+                # unreachable, the readiness check reports redis itself
+                logger.warning("failed to check the redis backfill", exc_info=True)
+                continue
+            logger.warning("redis lost the backfilled links, filling it again")
+            self.ready = False
+
+    async def load(self) -> int:
+        """Copy the hottest links to both cache tiers, returns how many."""
+        if self.size <= 0:
+            return 0
+        with track_evictions() as evicted:
+            return await self._load(evicted)
+
+    async def _load(self, evicted: set[str]) -> int:
+        async with self.session_factory() as db:
+            since = int(time.time()) - self.window
+            idxs = await click_repository.top(db, since=since, limit=self.size)
+            active = await url_repository.get_active(idxs, db)
+            # hottest first, inactive and deleted links are skipped
+            entries = {hash: active[hash] for hash in to_hashes(idxs) if hash in active}
+            if len(entries) < self.size:
+                latest = await url_repository.get_latest(db, self.size)
+                for hash, entry in latest.items():
+                    if len(entries) >= self.size:
+                        break
+                    entries.setdefault(hash, entry)
+
+        if not entries:
+            return 0
+
+        client = await self.client_factory()
+        await self._fill(client, entries)
+        rewritten = await self._rewrite(client, evicted)
+        # the hottest links are inserted last, the least likely to be evicted
+        for hash, entry in reversed(entries.items()):
+            if hash not in rewritten:
+                local_cache.set(hash, entry)
+        return len(entries)
+
+    async def load_all(self) -> int:
+        """Copy every active link to redis, returns how many, 0 if already done."""
+        client = await self.client_factory()
+        if await client.exists(BACKFILL_KEY):
+            return 0
+        # the lock expires with the timeout, a crashed worker does not block
+        if not await client.set(BACKFILL_LOCK, 1, nx=True, ex=int(self.timeout) + 1):
+            # another worker is filling it, ready once it is done
+            while not await client.exists(BACKFILL_KEY):
+                await asyncio.sleep(1.0)
+            return 0
+
+        loaded = 0
+        try:
+            with track_evictions() as evicted:
+                async with self.session_factory() as db:
+                    async for entries in url_repository.stream_entries(db):
+                        await self._fill(client, entries)
+                        loaded += len(entries)
+                await self._rewrite(client, evicted)
+            await client.set(BACKFILL_KEY, int(time.time()))
+        finally:
+            await client.delete(BACKFILL_LOCK)
+        return loaded
+
+    async def _fill(self, client: Redis, entries: dict[str, CachedUrl]) -> None:
+        "write the entries missing from redis"
+        pipe = client.pipeline(transaction=False)
+        queue_entries(pipe, entries, nx=True)
+        await pipe.execute()
+
+    async def _rewrite(self, client: Redis, evicted: set[str]) -> set[str]:
+        """Write again the links evicted since they were read, until none was.
+
+        Returns their hashes. Written over whatever redis holds, an update
+        racing with this read is evicted again and gets another round.
+        """
+        rewritten: set[str] = set()
+        while evicted:
+            hashes = list(evicted)
+            evicted.clear()
+            rewritten.update(hashes)
+            idxs = [idx for idx in map(to_idx, hashes) if idx is not None]
+            async with self.session_factory() as db:
+                entries = await url_repository.get_active(idxs, db)
+            pipe = client.pipeline(transaction=False)
+            queue_entries(pipe, entries)
+            queue_deletes(pipe, [hash for hash in hashes if hash not in entries])
+            await pipe.execute()
+        return rewritten
+
+
+warmup = WarmUp(
+    SessionLocal,
+    get_redis,
+    size=settings.warmup_size,
+    window=settings.warmup_window,
+    timeout=(
+        settings.backfill_timeout
+        if settings.serving_mode == "cache"
+        else settings.warmup_timeout
+    ),
+    backfill=settings.serving_mode == "cache",
+    check_interval=settings.backfill_check_interval,
+)
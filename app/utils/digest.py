@@ -0,0 +1,32 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+# width of the digest column, 128 bits keep collisions out of reach
+DIGEST_SIZE = 16
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    "canonical form used for deduplication, scheme and host are case insensitive"
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if ":" in netloc:  # IPv6 address
+        netloc = f"[{netloc}]"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += f":{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f":{parts.port}"
+    path = parts.path or "/"
+    return urlunsplit((scheme, netloc, path, parts.query, parts.fragment))
+
+
+def url_digest(url: str) -> bytes:
+    "fixed width BLAKE2 digest of the normalized URL, the dedup key of a record"
+    return hashlib.blake2b(
+        normalize_url(url).encode(), digest_size=DIGEST_SIZE
+    ).digest()
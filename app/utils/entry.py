@@ -0,0 +1,90 @@
+import struct
+import zlib
+from typing import NamedTuple
+
+# tag of the encoded entries, entries of older releases hold the bare URL
+ENTRY_TAG = "v2"
+
+# binary entries, see pack_entry: a flags byte then version and updated_at
+_PACKED = struct.Struct("<BII")
+_EXPIRES_AT = struct.Struct("<I")
+PERMANENT = 1
+EXPIRES = 2
+COMPRESSED = 4
+# flags never reach a printable character, unlike the first byte of a text entry
+_MAX_FLAGS = 0x1F
+
+# preset dictionary of the raw deflate streams, the common pieces of the URLs
+# give short values something to refer back to
+URL_DICT = (
+    b"utm_source=utm_medium=utm_campaign=utm_content=ref=id=q=page="
+    b".html.php/index/search/products/watch?v=/articles/2024/2025/2026/"
+    b".org/.net/.io/.co.uk/.de/.com/https://www.http://"
+)
+
+
+class CachedUrl(NamedTuple):
+    "cached state of an active short URL, what the read routes need to answer"
+
+    url: str
+    version: int = 0  # 0 when unknown, e.g. an entry cached by an older release
+    updated_at: int = 0  # unix timestamp of the last change
+    permanent: bool = False
+    expires_at: int = 0  # unix timestamp, 0 for links that never expire
+
+    def expired(self, now: float) -> bool:
+        return 0 < self.expires_at <= now
+
+
+def encode_entry(entry: CachedUrl) -> str:
+    "redis value of a cache entry, URLs never contain spaces"
+    return (
+        f"{ENTRY_TAG} {entry.version} {entry.updated_at} {entry.permanent:d}"
+        f" {entry.expires_at} {entry.url}"
+    )
+
+
+def pack_entry(entry: CachedUrl, compress_min: int = 0) -> bytes:
+    "compact binary value of a cache entry, URLs from `compress_min` bytes deflated"
+    url = entry.url.encode()
+    flags = PERMANENT if entry.permanent else 0
+    if compress_min and len(url) >= compress_min:
+        deflate = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=URL_DICT)
+        compressed = deflate.compress(url) + deflate.flush()
+        if len(compressed) < len(url):
+            url, flags = compressed, flags | COMPRESSED
+    if entry.expires_at:
+        flags |= EXPIRES
+        header = _PACKED.pack(flags, entry.version, entry.updated_at)
+        return header + _EXPIRES_AT.pack(entry.expires_at) + url
+    return _PACKED.pack(flags, entry.version, entry.updated_at) + url
+
+
+def unpack_entry(value: bytes) -> CachedUrl:
+    "inverse of pack_entry"
+    flags, version, updated_at = _PACKED.unpack_from(value)
+    offset, expires_at = _PACKED.size, 0
+    if flags & EXPIRES:
+        (expires_at,) = _EXPIRES_AT.unpack_from(value, offset)
+        offset += _EXPIRES_AT.size
+    url = value[offset:]
+    if flags & COMPRESSED:
+        inflate = zlib.decompressobj(-15, zdict=URL_DICT)
+        url = inflate.decompress(url) + inflate.flush()
+    return CachedUrl(
+        url.decode(), version, updated_at, bool(flags & PERMANENT), expires_at
+    )
+
+
+def decode_entry(value: str | bytes) -> CachedUrl:
+    "inverse of encode_entry and pack_entry, also reads the bare URLs of older releases"
+    if isinstance(value, bytes):
+        if value and value[0] <= _MAX_FLAGS:
+            return unpack_entry(value)
+        value = value.decode()
+    if value.startswith(ENTRY_TAG + " "):
+        _, version, updated_at, permanent, expires_at, url = value.split(" ", 5)
+        return CachedUrl(
+            url, int(version), int(updated_at), permanent == "1", int(expires_at)
+        )
+    return CachedUrl(value)
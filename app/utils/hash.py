@@ -1,30 +1,144 @@
-import base64
+import hashlib
+from binascii import a2b_base64, b2a_base64
+from collections.abc import Callable, Iterable
 
 from sqlalchemy import Column
 
-# TODO: add cipher to hash function
+from app.config import settings
+from app.utils.metrics import timed
 
+# 8 URL safe base64 characters encode exactly 48 bits
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+_STANDARD = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_CHARS = frozenset(ALPHABET)
 
+_MASK24 = (1 << 24) - 1
+_MASK48 = (1 << 48) - 1
+_MULT = 0x9E3779B1  # odd 32 bits constant of the round function
+
+
+def _tables(alphabet: bytes) -> tuple[bytes, bytes]:
+    "translations from and to the base64 of binascii, other characters become invalid"
+    return (
+        bytes.maketrans(_STANDARD, alphabet),
+        bytes.maketrans(alphabet + b"+/=", _STANDARD + b"!!!"),
+    )
+
+
+def _round_keys(key: str) -> tuple[int, int, int, int]:
+    "four 24 bits round keys derived from the secret"
+    digest = hashlib.blake2b(key.encode(), digest_size=12).digest()
+    k0, k1, k2, k3 = (int.from_bytes(digest[i : i + 3]) for i in range(0, 12, 3))
+    return k0, k1, k2, k3
+
+
+def _encode(num: int, table: bytes) -> str:
+    return b2a_base64(num.to_bytes(6), newline=False).translate(table).decode()
+
+
+def _decode(hash: str, table: bytes) -> int:
+    try:
+        return int.from_bytes(
+            a2b_base64(hash.encode().translate(table), strict_mode=True)
+        )
+    except ValueError:
+        raise ValueError(f"invalid hash: {hash!r}") from None
+
+
+def _codec(
+    key: str, legacy: int = 0
+) -> tuple[Callable[[int], str], Callable[[str], int]]:
+    """encode and decode functions of a secret, a keyed bijection of the 48 bits
+    values; without a key, and for the ids up to legacy, hashes are plain base64"""
+    to_plain, from_plain = _tables(ALPHABET.encode())
+    if not key:
+        return (
+            lambda num: _encode(num, to_plain),
+            lambda hash: _decode(hash, from_plain),
+        )
+
+    # a balanced feistel network of four rounds over the two 24 bits halves,
+    # every output bit depends on every input bit and on the key
+    k0, k1, k2, k3 = _round_keys(key)
+
+    # rounds unrolled and the base64 inlined, these are the hot paths
+    def encode(num: int) -> str:
+        left, right = num >> 24, num & _MASK24
+        left ^= ((right ^ k0) * _MULT >> 16) & _MASK24
+        right ^= ((left ^ k1) * _MULT >> 16) & _MASK24
+        left ^= ((right ^ k2) * _MULT >> 16) & _MASK24
+        right ^= ((left ^ k3) * _MULT >> 16) & _MASK24
+        data = (left << 24 | right).to_bytes(6)
+        return b2a_base64(data, newline=False).translate(to_plain).decode()
+
+    def decode(hash: str) -> int:
+        try:
+            data = a2b_base64(hash.encode().translate(from_plain), strict_mode=True)
+        except ValueError:
+            raise ValueError(f"invalid hash: {hash!r}") from None
+        num = int.from_bytes(data)
+        left, right = num >> 24, num & _MASK24
+        right ^= ((left ^ k3) * _MULT >> 16) & _MASK24
+        left ^= ((right ^ k2) * _MULT >> 16) & _MASK24
+        right ^= ((left ^ k1) * _MULT >> 16) & _MASK24
+        left ^= ((right ^ k0) * _MULT >> 16) & _MASK24
+        return left << 24 | right
+
+    if not legacy:
+        return encode, decode
+
+    def encode_walk(num: int) -> str:
+        if num <= legacy:
+            return _encode(num, to_plain)
+        # cycle walking, a hash that reads as a legacy one is ciphered again
+        while (value := _decode(hash := encode(num), from_plain)) <= legacy:
+            num = value
+        return hash
+
+    def decode_walk(hash: str) -> int:
+        if (num := _decode(hash, from_plain)) <= legacy:
+            return num
+        num = decode(hash)
+        while num <= legacy:
+            num = decode(_encode(num, to_plain))
+        return num
+
+    return encode_walk, decode_walk
+
+
+_encrypt, _decrypt = _codec(settings.hash_key, settings.hash_legacy_max_idx)
+
+
+@timed("hash")
 def to_hash(num: int | Column[int]) -> str:
-    "hash a integer to a URL safe base64 encoding, assures the output is 8 characters long"
-    return base64.urlsafe_b64encode(num.to_bytes(length=6)).decode()
+    "cipher a integer and encode it as URL safe base64, assures the output is 8 characters long"
+    if not 0 <= num <= _MASK48:
+        raise OverflowError(f"{num} does not fit in 48 bits")
+    return _encrypt(num)
 
 
+@timed("hash")
 def from_hash(hash: str | Column[str]) -> int:
     "decode a 8 charter hash to a integer"
-    return int.from_bytes(base64.urlsafe_b64decode(hash))
+    if len(hash) != 8:
+        raise ValueError(f"invalid hash length: {hash!r}")
+    return _decrypt(hash)
 
 
-def valid_hash(hash: str) -> bool:
-    "check if hash is valid base64 format with 8 characters"
+@timed("hash", "to_hashes")
+def to_hashes(nums: Iterable[int]) -> list[str]:
+    "batch version of to_hash, for bulk operations"
+    return list(map(_encrypt, nums))
 
-    if not isinstance(hash, str):
-        return False
-    if len(hash) != 8:
-        return False
 
-    try:  # test if bijection holds
-        num = from_hash(hash)
-        return hash == to_hash(num)
-    except Exception:
-        return False
+@timed("hash", "from_hashes")
+def from_hashes(hashes: Iterable[str]) -> list[int]:
+    "batch version of from_hash, for bulk operations"
+    return list(map(_decrypt, hashes))
+
+
+@timed("hash")
+def valid_hash(hash: str) -> bool:
+    "check if hash is valid base64 format with 8 characters"
+    # every 48 bits value is a valid id, so checking the format is enough
+    return isinstance(hash, str) and len(hash) == 8 and _CHARS.issuperset(hash)
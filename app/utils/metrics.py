@@ -0,0 +1,265 @@
+import copy
+import inspect
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+from functools import wraps
+
+from app.utils.tracing import current_trace
+
+# latency buckets in seconds, from sub-millisecond cache hits to slow queries
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """monotonic counter, rendered in the prometheus text format; the totals
+    kept by a service are read from `callback` at scrape time instead"""
+
+    kind = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: Iterable[str] = (),
+        callback: Callable[[], dict[tuple[str, ...], float]] | None = None,
+    ):
+        self.name, self.doc = name, doc
+        self.label_names = tuple(labels)
+        self.values: dict[tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def current(self) -> dict[tuple[str, ...], float]:
+        return self.callback() if self.callback is not None else self.values
+
+    def samples(self):
+        for labels, value in self.current().items():
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Gauge:
+    "value read from a callback at scrape time"
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        callback: Callable[[], dict[tuple[str, ...], float]],
+        labels: Iterable[str] = (),
+    ):
+        self.name, self.doc = name, doc
+        self.label_names = tuple(labels)
+        self.callback = callback
+
+    def current(self) -> dict[tuple[str, ...], float]:
+        return self.callback()
+
+    def samples(self):
+        for labels, value in self.current().items():
+            yield self.name, _labels(self.label_names, labels), value
+
+
+class Histogram:
+    "latency histogram, buckets are cumulated only when rendered"
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name, self.doc = name, doc
+        self.label_names = tuple(labels)
+        self.buckets = buckets
+        # label values -> [count per bucket..., +Inf count, sum]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def current(self) -> dict[tuple[str, ...], list[float]]:
+        return self.values
+
+    def observe(self, value: float, *labels: str) -> None:
+        if (series := self.values.get(labels)) is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        "observe the duration of a block, also a span of the traced requests"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(duration, *labels)
+            if (trace := current_trace.get()) is not None:
+                trace.add(".".join(labels), start, duration)
+
+    def samples(self):
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = _labels(self.label_names, labels, le=bound)
+                yield f"{self.name}_bucket", le, cumulative
+            yield f"{self.name}_sum", _labels(self.label_names, labels), series[-1]
+            yield f"{self.name}_count", _labels(self.label_names, labels), cumulative
+
+
+class Registry:
+    "collection of metrics exposed by a single worker"
+
+    def __init__(self):
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict[str, list]:
+        "current values of the metrics, gauges read now, as JSON friendly lists"
+        return {
+            metric.name: [
+                [list(labels), value] for labels, value in metric.current().items()
+            ]
+            for metric in self.metrics
+        }
+
+    def merge(self, snapshots: list[dict]) -> list[Counter | Gauge | Histogram]:
+        """metrics summed over the snapshots of several workers, `{"pid", "live",
+        "metrics"}` dicts; gauges are kept per live worker with a pid label"""
+        merged = []
+        for metric in self.metrics:
+            clone = copy.copy(metric)
+            if isinstance(metric, Gauge):
+                gauges = {
+                    (*labels, str(snapshot["pid"])): value
+                    for snapshot in snapshots
+                    if snapshot["live"]
+                    for labels, value in snapshot["metrics"].get(metric.name, [])
+                }
+                clone.label_names = (*metric.label_names, "pid")
+                clone.callback = lambda gauges=gauges: gauges
+            else:
+                if isinstance(metric, Counter):
+                    clone.callback = None
+                clone.values = {}
+                for snapshot in snapshots:
+                    for labels, value in snapshot["metrics"].get(metric.name, []):
+                        labels = tuple(labels)
+                        if (total := clone.values.get(labels)) is None:
+                            clone.values[labels] = value
+                        elif isinstance(metric, Histogram):
+                            clone.values[labels] = [a + b for a, b in zip(total, value)]
+                        else:
+                            clone.values[labels] = total + value
+            merged.append(clone)
+        return merged
+
+    def render(self, metrics: list | None = None) -> str:
+        lines = []
+        for metric in self.metrics if metrics is None else metrics:
+            lines.append(f"# HELP {metric.name} {metric.doc}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_latency = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route",
+        labels=("method", "route", "status"),
+    )
+)
+tier_latency = registry.register(
+    Histogram(
+        "tier_duration_seconds",
+        "time spent in each layer of the app",
+        labels=("tier", "operation"),
+    )
+)
+cache_requests = registry.register(
+    Counter(
+        "cache_requests_total",
+        "cache lookups by tier and result",
+        labels=("tier", "result"),
+    )
+)
+
+
+def timed(tier: str, operation: str | None = None):
+    """decorator recording the latency of a sync or async function in tier_latency,
+    and a `tier.operation` span in the traced requests"""
+
+    def decorator(func):
+        name = operation or func.__name__
+        series = (tier, name)
+        span_name = f"{tier}.{name}"
+        observe = tier_latency.observe
+        clock = time.perf_counter
+        get_trace = current_trace.get
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = clock()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    duration = clock() - start
+                    observe(duration, *series)
+                    if (trace := get_trace()) is not None:
+                        trace.add(span_name, start, duration)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                duration = clock() - start
+                observe(duration, *series)
+                if (trace := get_trace()) is not None:
+                    trace.add(span_name, start, duration)
+
+        return wrapper
+
+    return decorator
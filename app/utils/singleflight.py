@@ -0,0 +1,37 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    "deduplicate concurrent calls for the same key, every caller gets the same result"
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Run `func` unless a call for `key` is in flight, then wait for it."""
+        if (task := self._calls.get(key)) is None:
+            # a task of its own, owned by none of the callers
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            self.shared += 1
+        # shield so a cancelled caller, the first one included, does not cancel
+        # the shared call for the others
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even when every caller was cancelled
@@ -0,0 +1,48 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class Trace:
+    "spans of a sampled request, started relative to the request start"
+
+    __slots__ = ("spans", "start")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # (name, start offset, duration) in seconds, in completion order
+        self.spans: list[tuple[str, float, float]] = []
+
+    def add(self, name: str, start: float, duration: float) -> None:
+        self.spans.append((name, start - self.start, duration))
+
+    def breakdown(self) -> dict[str, float]:
+        "total duration per span name, repeated spans are summed"
+        totals: dict[str, float] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+
+# trace of the request handled by the current task, None when not sampled;
+# tasks created while handling a request share its trace
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+def record(name: str, start: float, duration: float) -> None:
+    "add a span to the trace of the current request, if it is sampled"
+    if (trace := current_trace.get()) is not None:
+        trace.add(name, start, duration)
+
+
+@contextmanager
+def span(name: str):
+    "time a block as a span of the current trace, a no-op outside of traces"
+    if (trace := current_trace.get()) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start)
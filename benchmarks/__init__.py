@@ -0,0 +1,21 @@
+"""Offline benchmarks, run against the ASGI app with a temporary SQLite file.
+
+The environment is set here, before any `app` module creates the engine.
+"""
+
+import json
+import os
+import tempfile
+
+os.environ["ENV"] = "DEV"
+os.environ["DEV_DATABASE_URI"] = (
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+)
+# the limits are checked on every request but never reached
+os.environ["RATE_LIMITS"] = json.dumps(
+    {
+        "GET /{hash}": [1e9, 1e9],
+        "POST /api/v1/urls/": [1e9, 1e9],
+        "POST /api/v1/urls/bulk": [1e9, 1e9],
+    }
+)
@@ -0,0 +1,62 @@
+"""Compare the redirect route with the previous implementation.
+
+The previous route went through the JSON API handler, building a `UrlModel`
+and `UrlResponse` before emitting a `RedirectResponse`.
+
+    python -m benchmarks.bench_redirect [iterations]
+"""
+
+import asyncio
+import sys
+
+from fastapi import Request, Response
+from fastapi.responses import RedirectResponse
+
+from app.cache import RedisClient, local_cache
+from app.controller import url_controller
+from app.database import SessionFactory, SessionLocal
+from app.repository.url_repository import url_repository
+from benchmarks.common import app, engine, request, setup_db, summarize, timed
+
+
+@app.get("/legacy/{hash}")
+async def legacy_redirect(
+    hash: str,
+    request: Request,
+    response: Response,
+    session_factory: SessionFactory,
+    rd: RedisClient,
+):
+    "redirect route as it was before the fast path"
+    found = await url_controller.get(hash, request, response, session_factory, rd)
+    return RedirectResponse(str(found.data.url), status_code=302)
+
+
+async def measure(path: str, n: int, cold: bool) -> float:
+    "median latency in microseconds"
+    samples = []
+    for _ in range(n):
+        if cold:
+            local_cache.clear()
+        with timed(samples):
+            status, _ = await request("GET", path)
+        assert status == 302
+    return summarize(samples)["p50"]
+
+
+async def main(n: int):
+    await setup_db()
+    async with SessionLocal() as db:
+        [record], _ = await url_repository.add_many(["https://example.com/"], db)
+
+    print(f"{'case':<12}{'legacy (us)':>14}{'fast (us)':>12}{'speedup':>10}")
+    for case, cold in (("cache hit", False), ("cache miss", True)):
+        legacy = await measure(f"/legacy/{record.hash}", n, cold)
+        fast = await measure(f"/{record.hash}", n, cold)
+        print(f"{case:<12}{legacy:>14.1f}{fast:>12.1f}{legacy / fast:>9.2f}x")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,80 @@
+import json
+import time
+
+from app.database import engine
+from app.main import app
+from app.migrations import migrate
+
+
+async def setup_db():
+    await migrate(engine)
+
+
+async def request(
+    method: str, path: str, body: dict | None = None
+) -> tuple[int, bytes]:
+    "drive the ASGI app directly, an http client would dominate the timings"
+    status, content = 0, []
+    payload = json.dumps(body).encode() if body is not None else b""
+    path, _, query = path.partition("?")
+
+    async def receive():
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            content.append(message.get("body", b""))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode()),
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    return status, b"".join(content)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    "throughput in operations per second and latencies in microseconds"
+    return {
+        "ops": len(samples) / sum(samples),
+        "p50": percentile(samples, 0.50) * 1e6,
+        "p99": percentile(samples, 0.99) * 1e6,
+    }
+
+
+def timed(samples: list[float]):
+    "append the elapsed time of the block to samples"
+    return _Timer(samples)
+
+
+class _Timer:
+    def __init__(self, samples: list[float]):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
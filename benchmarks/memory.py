@@ -0,0 +1,110 @@
+"""Redis memory per cached link of each cache layout.
+
+Fills a redis database with the same synthetic links in each layout, through
+`app.cache.queue_entries` as the app does, and reports the growth of
+`used_memory` per link next to the size of the stored values. Needs a real
+redis server: the database given by `--uri` is FLUSHED before each layout.
+
+    python -m benchmarks.memory [--uri redis://localhost:6379/15] [-n 100000]
+                                [--compress-min 48]
+
+Buckets stay listpack encoded while they hold at most
+`hash-max-listpack-entries` fields (128 by default, see CACHE_BUCKET_BITS) of
+at most `hash-max-listpack-value` bytes (64 by default); the report shows the
+encoding of the first bucket.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+
+from redis import asyncio as aioredis
+
+from app.cache import bucket_of, queue_entries
+from app.config import settings
+from app.utils.entry import CachedUrl, encode_entry, pack_entry
+from app.utils.hash import to_hash
+
+DOMAINS = ["example.com", "www.nytimes.com", "github.com", "youtu.be", "shop.co.uk"]
+WORDS = ["news", "article", "product", "search", "watch", "blog", "2025", "items"]
+
+
+def synthetic_links(n: int, seed: int = 0) -> dict[str, CachedUrl]:
+    "links with paths and query strings of varied lengths, the same for every run"
+    rnd = random.Random(seed)
+    links = {}
+    for idx in range(1, n + 1):
+        path = "/".join(rnd.choices(WORDS, k=rnd.randint(1, 5)))
+        url = f"https://{rnd.choice(DOMAINS)}/{path}/{rnd.getrandbits(32):x}"
+        if rnd.random() < 0.3:
+            url += f"?utm_source=newsletter&id={rnd.getrandbits(24)}"
+        expires_at = 4102444800 if rnd.random() < 0.1 else 0
+        links[to_hash(idx)] = CachedUrl(url, 1, 1700000000, False, expires_at)
+    return links
+
+
+async def used_memory(client: aioredis.Redis) -> int:
+    return (await client.info("memory"))["used_memory"]
+
+
+async def measure(client: aioredis.Redis, layout: str, links: dict) -> dict:
+    "memory per link of a layout, from an empty database"
+    settings.cache_layout = layout
+    await client.flushdb()
+    before = await used_memory(client)
+    items = list(links.items())
+    for i in range(0, len(items), 1000):
+        pipe = client.pipeline(transaction=False)
+        queue_entries(pipe, dict(items[i : i + 1000]))
+        await pipe.execute()
+    after = await used_memory(client)
+
+    first = next(iter(links))
+    if layout == "bucket":
+        key = bucket_of(first)[0]
+        sizes = [
+            len(pack_entry(e, settings.cache_compress_min)) for e in links.values()
+        ]
+    else:
+        key = first
+        sizes = [len(encode_entry(e).encode()) for e in links.values()]
+    return {
+        "bytes_per_link": (after - before) / len(links),
+        "value_bytes": statistics.mean(sizes),
+        "encoding": (await client.object("encoding", key)).decode(),
+    }
+
+
+async def main(uri: str, n: int) -> None:
+    client = aioredis.Redis.from_url(uri)
+    links = synthetic_links(n)
+    urls = statistics.mean(len(entry.url) for entry in links.values())
+    print(f"{n} links, {urls:.1f} bytes per URL on average")
+    try:
+        results = {
+            layout: await measure(client, layout, links)
+            for layout in ("string", "bucket")
+        }
+        await client.flushdb()
+    finally:
+        await client.aclose()
+
+    base = results["string"]["bytes_per_link"]
+    print(f"{'layout':<8} {'bytes/link':>11} {'value':>7} {'saved':>7}  encoding")
+    for layout, result in results.items():
+        saved = 1 - result["bytes_per_link"] / base
+        print(
+            f"{layout:<8} {result['bytes_per_link']:>11.1f}"
+            f" {result['value_bytes']:>7.1f} {saved:>7.0%}  {result['encoding']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uri", default="redis://localhost:6379/15")
+    parser.add_argument("-n", type=int, default=100_000, help="number of links")
+    parser.add_argument("--compress-min", type=int, default=settings.cache_compress_min)
+    args = parser.parse_args()
+    settings.cache_compress_min = args.compress_min
+    asyncio.run(main(args.uri, args.n))
@@ -0,0 +1,230 @@
+"""Benchmark suite for the hot paths of the app.
+
+Reports throughput and p50/p99 latency for each case and compares the p50
+against a stored baseline, exiting with an error when a case regressed more
+than the tolerance. Baselines are machine specific, record one with
+`--update-baseline` before comparing changes.
+
+    python -m benchmarks.run [-n 2000] [--rounds 3] [--tolerance 0.25]
+                             [--update-baseline]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+from pathlib import Path
+
+from app.cache import local_cache
+from app.config import settings
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.service.cache_sync import cache_sync
+from app.service.rate_limiter import RateLimiter
+from app.utils.hash import from_hash, from_hashes, to_hash, to_hashes, valid_hash
+from benchmarks.common import engine, request, setup_db, summarize, timed
+
+BASELINE = Path(__file__).parent / "baseline.json"
+PREFIX = "/api/v1/urls"
+
+# unique suffix for new URLs across rounds
+new_urls = itertools.count()
+
+
+async def bench_redirect_hit(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    await request("GET", f"/{hashes[0]}")  # fill the local cache
+    for _ in range(n):
+        with timed(samples):
+            status, _ = await request("GET", f"/{hashes[0]}")
+    assert status == 302
+    return samples
+
+
+async def bench_redirect_miss(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    for i in range(n):
+        local_cache.clear()
+        with timed(samples):
+            status, _ = await request("GET", f"/{hashes[i % len(hashes)]}")
+    assert status == 302
+    return samples
+
+
+async def bench_create_new(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    for _ in range(n):
+        body = {"url": f"https://bench.com/new/{next(new_urls)}"}
+        with timed(samples):
+            status, _ = await request("POST", f"{PREFIX}/", body)
+    assert status == 200
+    return samples
+
+
+async def bench_create_duplicate(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    body = {"url": "https://bench.com/seed/0"}
+    for _ in range(n):
+        with timed(samples):
+            status, _ = await request("POST", f"{PREFIX}/", body)
+    assert status == 200
+    return samples
+
+
+async def bench_list(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    for _ in range(max(1, n // 10)):
+        with timed(samples):
+            status, _ = await request("GET", f"{PREFIX}/?limit=1000")
+    assert status == 200
+    return samples
+
+
+async def bench_hash_encode(n: int, hashes: list[str]) -> list[float]:
+    return _micro(lambda i: to_hash(i), n)
+
+
+async def bench_hash_decode(n: int, hashes: list[str]) -> list[float]:
+    return _micro(lambda i: from_hash(hashes[i % len(hashes)]), n)
+
+
+async def bench_hash_validate(n: int, hashes: list[str]) -> list[float]:
+    return _micro(lambda i: valid_hash(hashes[i % len(hashes)]), n)
+
+
+async def bench_hash_encode_batch(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    for i in range(n):
+        nums = range(i * 100 + 1, i * 100 + 101)
+        with timed(samples):
+            to_hashes(nums)
+    return [sample / 100 for sample in samples]
+
+
+async def bench_hash_decode_batch(n: int, hashes: list[str]) -> list[float]:
+    samples = []
+    for i in range(n):
+        start = i * 100 % len(hashes)
+        batch = (hashes * 2)[start : start + 100]
+        with timed(samples):
+            from_hashes(batch)
+    return [sample / 100 for sample in samples]
+
+
+async def bench_rate_limit(n: int, hashes: list[str]) -> list[float]:
+    "overhead of the middleware on an allowed redirect, one client per request"
+
+    async def noop(scope, receive, send):
+        pass
+
+    middleware = RateLimitMiddleware(noop, RateLimiter(settings.rate_limits))
+    headers = [(b"host", b"localhost"), (b"user-agent", b"bench"), (b"accept", b"*/*")]
+    samples = []
+    for i in range(n):
+        scopes = [
+            {
+                "type": "http",
+                "method": "GET",
+                "path": f"/{hashes[j % len(hashes)]}",
+                "headers": headers,
+                "client": (f"10.0.{j % 256}.{j // 256 % 256}", 1234),
+            }
+            for j in range(i * 100, i * 100 + 100)
+        ]
+        with timed(samples):
+            for scope in scopes:
+                await middleware(scope, None, None)
+    return [sample / 100 for sample in samples]
+
+
+def _micro(func, n: int, batch: int = 100) -> list[float]:
+    "time batches of calls, a single call is too close to the clock resolution"
+    samples = []
+    for i in range(n):
+        with timed(samples):
+            for j in range(batch):
+                func(i * batch + j + 1)
+    return [sample / batch for sample in samples]
+
+
+CASES = {
+    "redirect_hit": bench_redirect_hit,
+    "redirect_miss": bench_redirect_miss,
+    "create_new": bench_create_new,
+    "create_duplicate": bench_create_duplicate,
+    "list": bench_list,
+    "hash_encode": bench_hash_encode,
+    "hash_decode": bench_hash_decode,
+    "hash_validate": bench_hash_validate,
+    "hash_encode_batch": bench_hash_encode_batch,
+    "hash_decode_batch": bench_hash_decode_batch,
+    "rate_limit": bench_rate_limit,
+}
+
+
+async def seed(size: int = 2000) -> list[str]:
+    "register the URLs used by the read benchmarks"
+    hashes = []
+    for start in range(0, size, 1000):
+        urls = [f"https://bench.com/seed/{i}" for i in range(start, start + 1000)]
+        _, body = await request("POST", f"{PREFIX}/bulk", {"urls": urls})
+        hashes.extend(item["hash"] for item in json.loads(body)["data"])
+    return hashes
+
+
+async def run(n: int, rounds: int) -> dict[str, dict[str, float]]:
+    "keep the fastest round of each case, the slower ones are mostly noise"
+    await setup_db()
+    await cache_sync.start()  # the write handlers queue their cache updates
+    hashes = await seed()
+    results = {}
+    for name, case in CASES.items():
+        stats = [summarize(await case(n, hashes)) for _ in range(rounds)]
+        results[name] = min(stats, key=lambda round: round["p50"])
+    await cache_sync.stop()
+    await engine.dispose()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    "names of the cases with a p50 slower than the baseline by more than tolerance"
+    regressions = []
+    print(f"{'case':<18}{'ops/s':>12}{'p50 (us)':>11}{'p99 (us)':>11}{'vs base':>9}")
+    for name, stats in results.items():
+        change = ""
+        if base := baseline.get(name):
+            ratio = stats["p50"] / base["p50"]
+            change = f"{ratio - 1:+.0%}"
+            if ratio > 1 + tolerance:
+                regressions.append(name)
+                change += " !"
+        print(
+            f"{name:<18}{stats['ops']:>12.0f}{stats['p50']:>11.1f}"
+            f"{stats['p99']:>11.1f}{change:>9}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=2000, help="iterations per case")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds per case")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.n, args.rounds))
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
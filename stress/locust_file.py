@@ -1,17 +1,13 @@
+from pathlib import Path
+
 from locust import FastHttpUser, task
 
-data = (
-    "AAAAAAAC",
-    "AAAAAAAB",
-    "AAAAAAAD",
-    "AAAAAAAF",
-    "AAAAAAAG",
-    "AAAAAAAH",
-    "AAAAAAAI",
-    "AAAAAAAJ",
-    "AAAAAAAK",
-    "AAAAAAAL",
-)
+# hashes printed by populate_db.sh, they are no longer sequential
+data = tuple(
+    line.strip().strip('"')
+    for line in (Path(__file__).parent / "hashes.txt").read_text().splitlines()
+    if line.strip()
+)[:10]
 
 
 class StressTests(FastHttpUser):
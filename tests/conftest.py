@@ -0,0 +1,119 @@
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.config import settings
+
+
+class FakePipeline:
+    "commands of a FakeRedis, applied in order on execute"
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        getattr(self.redis, "_" + name)  # unknown commands fail when queued
+
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        if self.redis.fail:
+            self.redis.fail -= 1
+            raise ConnectionError("redis is down")
+        self.redis.executed.append(self.commands)
+        return [
+            self.redis.apply(name, *args, **kwargs)
+            for name, args, kwargs in self.commands
+        ]
+
+
+class FakeRedis:
+    """In-memory redis with the string and hash commands of the app.
+
+    `data` maps the keys to their value, or to a dict of fields for hashes,
+    `ttls` the keys to their EXAT. Every applied command is logged in
+    `commands` as (name, key), every executed pipeline in `executed`, and
+    the next `fail` pipelines raise a ConnectionError.
+    """
+
+    def __init__(self, fail: int = 0):
+        self.fail = fail
+        self.data = {}
+        self.ttls = {}
+        self.commands = []
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        getattr(self, "_" + name)
+
+        async def command(*args, **kwargs):
+            return self.apply(name, *args, **kwargs)
+
+        return command
+
+    def apply(self, name, *args, **kwargs):
+        self.commands.append((name, args[0] if args else None))
+        return getattr(self, "_" + name)(*args, **kwargs)
+
+    def _get(self, key):
+        return self.data.get(key)
+
+    def _set(self, key, value, nx=False, ex=None, px=None, exat=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.ttls.pop(key, None)
+        if exat is not None:
+            self.ttls[key] = exat
+        return True
+
+    def _mset(self, mapping):
+        for key, value in mapping.items():
+            self._set(key, value)
+        return True
+
+    def _exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def _delete(self, *keys):
+        for key in keys:
+            self.ttls.pop(key, None)
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def _hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def _hset(self, key, field=None, value=None, mapping=None):
+        fields = dict(mapping or {})
+        if field is not None:
+            fields[field] = value
+        self.data.setdefault(key, {}).update(fields)
+        return len(fields)
+
+    def _hsetnx(self, key, field, value):
+        values = self.data.setdefault(key, {})
+        if field in values:
+            return 0
+        values[field] = value
+        return 1
+
+    def _hdel(self, key, *fields):
+        values = self.data.get(key, {})
+        return sum(values.pop(field, None) is not None for field in fields)
+
+
+@pytest.fixture
+def bucket_layout(monkeypatch):
+    monkeypatch.setattr(settings, "cache_layout", "bucket")
+    monkeypatch.setattr(settings, "cache_bucket_bits", 7)
@@ -0,0 +1,75 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+
+from app.cache import cache_client
+from app.config import settings
+from app.main import app
+from app.service.warmup import warmup
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(app=app, base_url="http://") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+class TestSystemController:
+    async def test_health(self, client: AsyncClient):
+        await cache_client.connect()
+        response = await client.get("/system/health")
+        assert response.status_code == 200
+        assert response.json()["cache"]["status"] == "up"
+
+    async def test_health_cache_down(self, client: AsyncClient):
+        await cache_client.close()
+        response = await client.get("/system/health")
+        assert response.status_code == 503
+        assert response.json()["cache"]["status"] == "down"
+
+    async def test_live(self, client: AsyncClient):
+        response = await client.get("/system/health/live")
+        assert response.status_code == 200
+
+    async def test_ready_after_warmup(self, client: AsyncClient):
+        await cache_client.connect()
+        warmup.ready = False
+        response = await client.get("/system/health/ready")
+        assert response.status_code == 503
+        assert response.json()["warmup"]["done"] is False
+
+        warmup.ready = True
+        response = await client.get("/system/health/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    async def test_pool_stats(self, client: AsyncClient):
+        response = await client.get("/system/pool")
+        assert response.status_code == 200
+        assert "checkouts" in response.json()
+        assert "wait_max" in response.json()
+
+    async def test_metrics(self, client: AsyncClient):
+        await client.get("/system/health")
+        response = await client.get("/system/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'route="/system/health"' in response.text
+        assert "db_pool" in response.text
+
+    async def test_profile_disabled(self, client: AsyncClient):
+        response = await client.get("/system/profile?seconds=0.01")
+        assert response.status_code == 404
+
+    async def test_profile(self, client: AsyncClient, monkeypatch):
+        monkeypatch.setattr(settings, "profiler_enabled", True)
+        response = await client.get("/system/profile?seconds=0.05&interval=0.001")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        stack, count = response.text.splitlines()[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert ";" in stack
+
+        response = await client.get("/system/profile?seconds=600")
+        assert response.status_code == 422
@@ -1,13 +1,20 @@
+import json
+
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from app.controller.url_controller import get_db
+from app.cache import NOT_FOUND, local_cache
+from app.database import get_db, get_sessionmaker
 from app.main import app
 from app.models import Base, UrlModel
+from app.repository.id_allocator import url_id_allocator
 from app.repository.url_repository import url_repository
+from app.service.cache_sync import cache_sync
+from app.service.rate_limiter import rate_limiter
+from app.utils.entry import CachedUrl
 from app.utils.hash import to_hash
 
 # Setup database engine and session
@@ -23,24 +30,43 @@ HASH = {i: to_hash(i) for i in (1, 2, 3, 100)}
 # Helper function to populate the database
 async def populate_db(db):
     await url_repository.add("https://foo.com/", db)
-    await url_repository.add("https://bar.com/", db)
+    await url_repository.add("https://bar.com/", db, permanent=True)
     await url_repository.add("https://disable.com/", db)
-    await url_repository.update(UrlModel(hash="AAAAAAAD", url=None, on=False), db)
+    await url_repository.update(UrlModel(hash=HASH[3], url=None, on=False), db)
 
 
 # Override database dependency for testing
 async def override_get_db():
+    async with SessionLocal() as session:
+        yield session
+
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_sessionmaker] = lambda: SessionLocal
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def populated_db():
+    "a fresh DB per test, shared by get_db and the handlers opening their own"
+    url_id_allocator.reset()  # the reserved block belongs to the dropped DB
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     async with SessionLocal() as session:
         await populate_db(session)
-        yield session
+    yield
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
     await engine.dispose()
 
 
-app.dependency_overrides[get_db] = override_get_db
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    local_cache.clear()
+    cache_sync.pending.clear()
+    rate_limiter.buckets.clear()
+    yield
+    local_cache.clear()
+    cache_sync.pending.clear()
 
 
 @pytest_asyncio.fixture
@@ -64,11 +90,134 @@ class TestUrlController:
         response = await client.get(f"{API_PREFIX}/{HASH[3]}")
         assert response.status_code == 404
 
+    async def test_get_url_from_local_cache(self, client: AsyncClient):
+        local_cache.set(HASH[100], CachedUrl("https://cached.com/"))
+        response = await client.get(f"{API_PREFIX}/{HASH[100]}")
+        assert response.status_code == 200
+        assert response.json()["data"]["url"] == "https://cached.com/"
+
+    async def test_deactivate_evicts_local_cache(self, client: AsyncClient):
+        await client.get(f"{API_PREFIX}/{HASH[1]}")
+        assert local_cache.get(HASH[1]).url == "https://foo.com/"
+        await client.put(f"{API_PREFIX}/deactivate/{HASH[1]}")
+        assert local_cache.get(HASH[1]) is None
+
+    async def test_get_url_not_found_is_cached(self, client: AsyncClient):
+        response = await client.get(f"{API_PREFIX}/{HASH[100]}")
+        assert response.status_code == 404
+        assert local_cache.get(HASH[100]) is NOT_FOUND
+
+        response = await client.get(f"{API_PREFIX}/{HASH[100]}")
+        assert response.status_code == 404
+
+    async def test_activate_evicts_negative_entry(self, client: AsyncClient):
+        await client.get(f"{API_PREFIX}/{HASH[3]}")
+        assert local_cache.get(HASH[3]) is NOT_FOUND
+        await client.put(f"{API_PREFIX}/activate/{HASH[3]}")
+        assert local_cache.get(HASH[3]) is None
+
+    async def test_writes_are_queued_for_the_cache(self, client: AsyncClient):
+        await client.put(f"{API_PREFIX}/activate/{HASH[3]}")
+        assert cache_sync.get(HASH[3]).url == "https://disable.com/"
+        await client.put(f"{API_PREFIX}/deactivate/{HASH[1]}")
+        assert cache_sync.get(HASH[1]) is NOT_FOUND
+
+        # the pending writes are read back before reaching redis
+        response = await client.get(f"{API_PREFIX}/{HASH[3]}")
+        assert response.json()["data"]["url"] == "https://disable.com/"
+
+    async def test_get_url_not_modified(self, client: AsyncClient):
+        response = await client.get(f"{API_PREFIX}/{HASH[1]}")
+        etag = response.headers["etag"]
+        assert etag == '"1"'
+        last_modified = response.headers["last-modified"]
+
+        response = await client.get(
+            f"{API_PREFIX}/{HASH[1]}", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        response = await client.get(
+            f"{API_PREFIX}/{HASH[1]}", headers={"If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 304
+
+    async def test_update_changes_etag(self, client: AsyncClient):
+        await client.put(f"{API_PREFIX}/{HASH[1]}", json={"url": "https://new.com/"})
+        response = await client.get(
+            f"{API_PREFIX}/{HASH[1]}", headers={"If-None-Match": '"1"'}
+        )
+        assert response.status_code == 200
+        assert response.headers["etag"] == '"2"'
+
+    async def test_create_permanent_url(self, client: AsyncClient):
+        url_data = {"url": "https://example.com/", "permanent": True}
+        response = await client.post(f"{API_PREFIX}/", json=url_data)
+        assert response.json()["data"]["permanent"] is True
+
+    async def test_create_expiring_url(self, client: AsyncClient):
+        url_data = {"url": "https://example.com/", "expires_at": "2100-01-01T00:00Z"}
+        response = await client.post(f"{API_PREFIX}/", json=url_data)
+        assert response.json()["data"]["expires_at"] == "2100-01-01T00:00:00Z"
+
+    async def test_permanent_url_can_not_be_edited(self, client: AsyncClient):
+        url_data = {"url": "https://other.com/"}
+        response = await client.put(f"{API_PREFIX}/{HASH[2]}", json=url_data)
+        assert response.status_code == 409
+
+    async def test_permanent_url_stays_permanent(self, client: AsyncClient):
+        for url_data in (
+            {"url": "https://bar.com/"},
+            {"url": "https://bar.com/", "permanent": False},
+            {
+                "url": "https://bar.com/",
+                "permanent": True,
+                "expires_at": "2100-01-01T00:00Z",
+            },
+        ):
+            response = await client.put(f"{API_PREFIX}/{HASH[2]}", json=url_data)
+            assert response.status_code == 409, url_data
+
+        url_data = {"url": "https://bar.com/", "permanent": True}
+        response = await client.put(f"{API_PREFIX}/{HASH[2]}", json=url_data)
+        assert response.status_code == 200
+
     async def test_get_all_urls(self, client: AsyncClient):
         response = await client.get(f"{API_PREFIX}/")
         assert response.status_code == 200
         assert len(response.json()["data"]) == 3
 
+    async def test_get_all_urls_paginated(self, client: AsyncClient):
+        response = await client.get(f"{API_PREFIX}/", params={"limit": 2})
+        assert response.status_code == 200
+        assert len(response.json()["data"]) == 2
+        cursor = response.json()["next_cursor"]
+        assert cursor == HASH[2]
+
+        response = await client.get(
+            f"{API_PREFIX}/", params={"limit": 2, "cursor": cursor}
+        )
+        assert response.status_code == 200
+        assert [item["hash"] for item in response.json()["data"]] == [HASH[3]]
+        assert response.json()["next_cursor"] is None
+
+    async def test_get_all_urls_invalid_cursor(self, client: AsyncClient):
+        response = await client.get(f"{API_PREFIX}/", params={"cursor": "foo"})
+        assert response.status_code == 400
+
+    async def test_export_urls(self, client: AsyncClient):
+        response = await client.get(f"{API_PREFIX}/export")
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert len(lines) == 3
+        assert json.loads(lines[0])["url"] == "https://foo.com/"
+
+    async def test_url_stats(self, client: AsyncClient):
+        response = await client.get(f"{API_PREFIX}/stats/{HASH[1]}")
+        assert response.status_code == 200
+        assert response.json()["data"] == []
+        assert response.json()["total"] == 0
+
     async def test_create_url(self, client: AsyncClient):
         url_data = {"url": "https://example.com/"}
         response = await client.post(f"{API_PREFIX}/", json=url_data)
@@ -82,6 +231,14 @@ class TestUrlController:
         assert response.json()["status"] == "warning"
         assert response.json()["errors"] == "URL already in database"
 
+    async def test_create_many_urls(self, client: AsyncClient):
+        url_data = {"urls": ["https://example.com/", "https://foo.com/"]}
+        response = await client.post(f"{API_PREFIX}/bulk", json=url_data)
+        assert response.status_code == 200
+        assert response.json()["status"] == "warning"
+        assert [item["url"] for item in response.json()["data"]] == url_data["urls"]
+        assert response.json()["data"][1]["hash"] == HASH[1]
+
     async def test_delete_url(self, client: AsyncClient):
         response = await client.delete(f"{API_PREFIX}/{HASH[1]}")
         assert response.status_code == 200
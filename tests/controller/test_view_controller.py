@@ -0,0 +1,108 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import local_cache
+from app.config import settings
+from app.database import get_db, get_sessionmaker
+from app.main import app
+from app.models import Base
+from app.repository.id_allocator import url_id_allocator
+from app.repository.url_repository import url_repository
+from app.service.cache_sync import cache_sync
+from app.service.rate_limiter import rate_limiter
+from app.utils.entry import CachedUrl
+from app.utils.hash import to_hash
+
+# Setup database engine and session
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+)
+
+HASH = {i: to_hash(i) for i in (1, 100)}
+
+
+# Override database dependency for testing
+async def override_get_db():
+    async with SessionLocal() as session:
+        yield session
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def override_db():
+    overrides = {get_db: override_get_db, get_sessionmaker: lambda: SessionLocal}
+    previous = {dep: app.dependency_overrides.get(dep) for dep in overrides}
+    app.dependency_overrides.update(overrides)
+    url_id_allocator.reset()  # the reserved block belongs to the dropped DB
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        await url_repository.add("https://foo.com/", session)
+    local_cache.clear()
+    cache_sync.pending.clear()
+    rate_limiter.buckets.clear()
+    yield
+    local_cache.clear()
+    cache_sync.pending.clear()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+    for dep, override in previous.items():
+        if override is None:
+            app.dependency_overrides.pop(dep)
+        else:
+            app.dependency_overrides[dep] = override
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with AsyncClient(app=app, base_url="http://") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+class TestViewController:
+    async def test_redirect(self, client: AsyncClient):
+        response = await client.get(f"/{HASH[1]}")
+        assert response.status_code == 302
+        assert response.headers["location"] == "https://foo.com/"
+        assert response.content == b""
+
+    async def test_redirect_from_local_cache(self, client: AsyncClient):
+        local_cache.set(HASH[100], CachedUrl("https://cached.com/"))
+        response = await client.get(f"/{HASH[100]}")
+        assert response.status_code == 302
+        assert response.headers["location"] == "https://cached.com/"
+
+    async def test_permanent_redirect_is_cacheable(self, client: AsyncClient):
+        local_cache.set(HASH[100], CachedUrl("https://cached.com/", 1, 0, True))
+        response = await client.get(f"/{HASH[100]}")
+        assert response.status_code == 301
+        assert response.headers["cache-control"] == "public, max-age=86400"
+
+    async def test_expired_link_is_not_redirected(self, client: AsyncClient):
+        local_cache.set(HASH[100], CachedUrl("https://cached.com/", expires_at=1))
+        response = await client.get(f"/{HASH[100]}")
+        assert response.status_code == 404
+
+    async def test_cache_serving_mode_skips_the_db(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "serving_mode", "cache")
+        # in the DB but not in redis, which is the read store
+        response = await client.get(f"/{HASH[1]}")
+        assert response.status_code == 404
+
+        local_cache.clear()
+        cache_sync.set(HASH[1], CachedUrl("https://foo.com/"))
+        response = await client.get(f"/{HASH[1]}")
+        assert response.status_code == 302
+
+    async def test_redirect_not_found(self, client: AsyncClient):
+        response = await client.get(f"/{HASH[100]}")
+        assert response.status_code == 404
+
+    async def test_redirect_invalid_hash(self, client: AsyncClient):
+        response = await client.get("/foo")
+        assert response.status_code == 400
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from sqlalchemy import inspect, select, text
+
+from app.database import build_engine
+from app.migrations import MIGRATIONS, migrate, pending, schema_version
+
+
+async def versions(engine) -> list[int]:
+    async with engine.connect() as conn:
+        stmt = select(schema_version.c.version).order_by(schema_version.c.version)
+        return list((await conn.execute(stmt)).scalars())
+
+
+async def tables(engine) -> set[str]:
+    async with engine.connect() as conn:
+        return set(await conn.run_sync(lambda c: inspect(c).get_table_names()))
+
+
+@pytest.mark.asyncio
+class TestMigrate:
+    async def test_new_database(self, tmp_path):
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path}/app.db")
+        applied = await migrate(engine)
+
+        assert applied == [name for _, name, _ in MIGRATIONS]
+        assert {"urls", "id_blocks", "clicks", "schema_version"} <= await tables(engine)
+        assert await versions(engine) == [version for version, _, _ in MIGRATIONS]
+        await engine.dispose()
+
+    async def test_up_to_date(self, tmp_path):
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path}/app.db")
+        await migrate(engine)
+        assert await migrate(engine) == []
+        await engine.dispose()
+
+    async def test_pending(self, tmp_path):
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path}/app.db")
+        assert await pending(engine) == [name for _, name, _ in MIGRATIONS]
+        await migrate(engine)
+        assert await pending(engine) == []
+        await engine.dispose()
+
+    async def test_workers_do_not_race(self, tmp_path):
+        uri = f"sqlite+aiosqlite:///{tmp_path}/app.db"
+        engines = [build_engine(uri) for _ in range(4)]
+        results = await asyncio.gather(*(migrate(engine) for engine in engines))
+
+        assert sorted(len(applied) for applied in results) == [0, 0, 0, len(MIGRATIONS)]
+        assert await versions(engines[0]) == [version for version, _, _ in MIGRATIONS]
+        for engine in engines:
+            await engine.dispose()
+
+    async def test_legacy_database(self, tmp_path):
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path}/app.db")
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "CREATE TABLE urls (idx INTEGER NOT NULL PRIMARY KEY,"
+                    ' url VARCHAR(255) NOT NULL UNIQUE, "on" BOOLEAN NOT NULL)'
+                )
+            )
+            await conn.execute(
+                text(
+                    "INSERT INTO urls (idx, url, \"on\") VALUES (1, 'https://foo.com/', 1)"
+                )
+            )
+
+        await migrate(engine)
+        async with engine.connect() as conn:
+            row = (await conn.execute(text("SELECT url, url_digest FROM urls"))).one()
+        assert row.url == "https://foo.com/"
+        assert row.url_digest is not None
+        await engine.dispose()
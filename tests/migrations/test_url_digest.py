@@ -0,0 +1,81 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.migrations.url_digest import upgrade
+from app.utils.digest import url_digest
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+
+LEGACY_SCHEMA = """
+CREATE TABLE urls (
+    idx INTEGER NOT NULL PRIMARY KEY,
+    url VARCHAR(255) NOT NULL UNIQUE,
+    "on" BOOLEAN NOT NULL
+)
+"""
+
+
+@pytest_asyncio.fixture(scope="function")
+async def legacy_db():
+    async with engine.begin() as conn:
+        await conn.execute(text(LEGACY_SCHEMA))
+        await conn.execute(
+            text('INSERT INTO urls (idx, url, "on") VALUES (:idx, :url, :on)'),
+            [
+                {"idx": 1, "url": "https://foo.com/", "on": True},
+                {"idx": 2, "url": "https://bar.com/", "on": False},
+            ],
+        )
+    yield engine
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS urls"))
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+class TestUrlDigestMigration:
+    async def test_existing_rows_are_backfilled(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await upgrade(conn)
+            rows = (
+                await conn.execute(text('SELECT idx, url, url_digest, "on" FROM urls'))
+            ).all()
+
+        assert [(row.idx, row.url, row.on) for row in rows] == [
+            (1, "https://foo.com/", True),
+            (2, "https://bar.com/", False),
+        ]
+        assert rows[0].url_digest == url_digest("https://foo.com/")
+
+    async def test_digest_is_unique(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await upgrade(conn)
+        with pytest.raises(IntegrityError):
+            async with legacy_db.begin() as conn:
+                await conn.execute(
+                    text(
+                        'INSERT INTO urls (idx, url, url_digest, "on") VALUES'
+                        " (3, 'HTTPS://FOO.com', :digest, 1)"
+                    ),
+                    {"digest": url_digest("HTTPS://FOO.com")},
+                )
+
+    async def test_upgrade_twice(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await upgrade(conn)
+            await upgrade(conn)
+
+    async def test_duplicates_abort(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await conn.execute(
+                text(
+                    "INSERT INTO urls (idx, url, \"on\") VALUES (3, 'HTTPS://Foo.com', 1)"
+                )
+            )
+        with pytest.raises(RuntimeError, match="duplicated"):
+            async with legacy_db.begin() as conn:
+                await upgrade(conn)
@@ -0,0 +1,39 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.migrations.url_expiry import INDEX, upgrade
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def legacy_db():
+    async with engine.begin() as conn:
+        await conn.execute(
+            text('CREATE TABLE urls (idx INTEGER PRIMARY KEY, url TEXT, "on" BOOLEAN)')
+        )
+        await conn.execute(text("INSERT INTO urls VALUES (1, 'https://foo.com/', 1)"))
+    yield engine
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS urls"))
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+class TestUrlExpiryMigration:
+    async def test_existing_rows_never_expire(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await upgrade(conn)
+            await upgrade(conn)  # a no-op the second time
+            expires_at = (
+                await conn.execute(text("SELECT expires_at FROM urls"))
+            ).scalar()
+            indexes = await conn.run_sync(
+                lambda sync_conn: inspect(sync_conn).get_indexes("urls")
+            )
+
+        assert expires_at is None
+        assert INDEX in {index["name"] for index in indexes}
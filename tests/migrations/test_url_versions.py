@@ -0,0 +1,55 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.migrations.url_versions import upgrade
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+
+LEGACY_SCHEMA = """
+CREATE TABLE urls (
+    idx INTEGER NOT NULL PRIMARY KEY,
+    url TEXT NOT NULL,
+    url_digest BLOB NOT NULL UNIQUE,
+    "on" BOOLEAN NOT NULL
+)
+"""
+
+
+@pytest_asyncio.fixture(scope="function")
+async def legacy_db():
+    async with engine.begin() as conn:
+        await conn.execute(text(LEGACY_SCHEMA))
+        await conn.execute(
+            text(
+                'INSERT INTO urls (idx, url, url_digest, "on")'
+                " VALUES (1, 'https://foo.com/', x'01', 1)"
+            )
+        )
+    yield engine
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS urls"))
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+class TestUrlVersionsMigration:
+    async def test_existing_rows_get_defaults(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await upgrade(conn)
+            row = (
+                await conn.execute(
+                    text("SELECT version, updated_at, permanent FROM urls")
+                )
+            ).one()
+
+        assert row.version == 1
+        assert row.updated_at > 0
+        assert not row.permanent
+
+    async def test_upgrade_twice(self, legacy_db):
+        async with legacy_db.begin() as conn:
+            await upgrade(conn)
+            await upgrade(conn)
@@ -0,0 +1,77 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, UrlRegister
+from app.repository.id_allocator import IdAllocator
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+)
+
+
+# Fixture to manage database sessions
+@pytest_asyncio.fixture(scope="function")
+async def db_session():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        yield session
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+class TestIdAllocator:
+    async def test_allocate_sequential_ids(self, db_session):
+        allocator = IdAllocator("test", block_size=3)
+        assert await allocator.allocate(2, db_session) == [1, 2]
+        assert await allocator.allocate(3, db_session) == [3, 4, 5]
+
+    async def test_large_allocation(self, db_session):
+        allocator = IdAllocator("test", block_size=3)
+        assert await allocator.allocate(10, db_session) == list(range(1, 11))
+
+    async def test_workers_get_disjoint_blocks(self, db_session):
+        first = IdAllocator("test", block_size=10)
+        second = IdAllocator("test", block_size=10)
+        assert await first.allocate(1, db_session) == [1]
+        assert await second.allocate(1, db_session) == [11]
+        assert await first.allocate(1, db_session) == [2]
+
+    async def test_restart_skips_unused_ids(self, db_session):
+        allocator = IdAllocator("test", block_size=10)
+        assert await allocator.allocate(1, db_session) == [1]
+        allocator.reset()  # same as a new worker process
+        assert await allocator.allocate(1, db_session) == [11]
+
+    async def test_starts_after_existing_rows(self, db_session):
+        db_session.add(UrlRegister(idx=41, url="https://foo.com/"))
+        await db_session.commit()
+        allocator = IdAllocator("test", block_size=10)
+        assert await allocator.allocate(1, db_session) == [42]
+
+    async def test_advance_past_imported_ids(self, db_session):
+        allocator = IdAllocator("test", block_size=10)
+        assert await allocator.allocate(1, db_session) == [1]
+        await allocator.advance(50, db_session)
+        await allocator.advance(20, db_session)  # never moves back
+        allocator.reset()
+        assert await allocator.allocate(1, db_session) == [51]
+
+    async def test_recently_reserved(self, db_session):
+        allocator = IdAllocator("test", block_size=10)
+        other = IdAllocator("test", block_size=10)
+        assert await allocator.allocate(1, db_session) == [1]
+        assert await allocator.recently_reserved(5, db_session, span=100)
+        assert not await allocator.recently_reserved(5, db_session, span=5)
+
+        # reserved by another worker, seen once the counter is read again
+        assert await other.allocate(1, db_session) == [11]
+        assert not await allocator.recently_reserved(11, db_session, 100, refresh=60)
+        assert await allocator.recently_reserved(11, db_session, 100, refresh=0)
+        assert not await allocator.recently_reserved(21, db_session, 100, refresh=0)
@@ -0,0 +1,94 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.database import LazySession, RoutingSession, build_engine
+from app.migrations import migrate
+from app.models import UrlModel, UrlRegister
+from app.repository.id_allocator import url_id_allocator
+from app.repository.url_repository import url_repository
+from app.utils.hash import to_hash
+
+
+@pytest_asyncio.fixture(scope="function")
+async def session_factory(tmp_path):
+    "two sqlite files standing in for the primary and a lagging replica"
+    url_id_allocator.reset()  # the reserved block belongs to another DB
+    primary = build_engine(f"sqlite+aiosqlite:///{tmp_path}/primary.db")
+    replica = build_engine(f"sqlite+aiosqlite:///{tmp_path}/replica.db")
+    for engine in (primary, replica):
+        await migrate(engine)
+
+    # the replica only knows about the first link, and an older URL of it
+    async with AsyncSession(primary) as db:
+        db.add(UrlRegister(idx=1, url="https://primary.com/", on=True))
+        db.add(UrlRegister(idx=2, url="https://new.com/", on=True))
+        db.add(UrlRegister(idx=3, url="https://newer.com/", on=True))
+        await db.commit()
+    async with AsyncSession(replica) as db:
+        db.add(UrlRegister(idx=1, url="https://replica.com/", on=True))
+        await db.commit()
+
+    yield sessionmaker(
+        bind=primary,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        replicas=[replica.sync_engine],
+    )
+    url_id_allocator.reset()
+    await primary.dispose()
+    await replica.dispose()
+
+
+@pytest.mark.asyncio
+class TestReplicaRouting:
+    async def test_reads_go_to_the_replica(self, session_factory):
+        async with session_factory() as db:
+            record = await url_repository.get(to_hash(1), db)
+            assert str(record.url) == "https://replica.com/"
+            records = await url_repository.get_all(db)
+            assert [str(record.url) for record in records] == ["https://replica.com/"]
+
+    async def test_reads_after_write_go_to_the_primary(self, session_factory):
+        async with session_factory() as db:
+            await url_repository.add("https://foo.com/", db)
+            record = await url_repository.get(to_hash(1), db)
+            assert str(record.url) == "https://primary.com/"
+            assert await url_repository.get_by_url("https://foo.com/", db)
+
+    async def test_updates_use_the_primary(self, session_factory):
+        async with session_factory() as db:
+            update = UrlModel(hash=to_hash(1), url=None, on=False)
+            record = await url_repository.update(update, db)
+            assert str(record.url) == "https://primary.com/"
+            assert record.on is False
+
+    async def test_replica_miss_falls_back_to_the_primary(self, session_factory):
+        async with session_factory() as db:
+            entry = await url_repository.get_entry(to_hash(2), db)
+            assert entry.url == "https://new.com/"
+
+    async def test_only_recent_ids_fall_back(self, session_factory, monkeypatch):
+        monkeypatch.setattr(settings, "db_replica_retry_span", 1)
+        async with session_factory() as db:
+            assert await url_repository.get_entry(to_hash(2), db) is None
+            # never handed out, the primary does not have it either
+            assert await url_repository.get_entry(to_hash(1000), db) is None
+            entry = await url_repository.get_entry(to_hash(3), db)
+            assert entry.url == "https://newer.com/"
+
+
+@pytest.mark.asyncio
+class TestLazySession:
+    async def test_opened_on_first_use(self, session_factory):
+        db = LazySession(session_factory)
+        assert not db.opened
+        await db.close()  # nothing to close
+
+        record = await url_repository.get(to_hash(1), db)
+        assert str(record.url) == "https://replica.com/"
+        assert db.opened
+        await db.close()
+        assert not db.opened
@@ -4,7 +4,9 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.models import Base, UrlModel
+from app.repository.id_allocator import url_id_allocator
 from app.repository.url_repository import url_repository
+from app.utils.hash import from_hash
 
 # Setup for in-memory SQLite database
 engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
@@ -16,6 +18,7 @@ SessionLocal = sessionmaker(
 # Fixture to manage database sessions
 @pytest_asyncio.fixture(scope="function")
 async def db_session():
+    url_id_allocator.reset()  # the reserved block belongs to the dropped DB
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     async with SessionLocal() as session:
@@ -70,6 +73,22 @@ class TestUrlRepository:
         assert retrieved is not None
         assert str(retrieved.url) == url
 
+    async def test_get_url_by_normalized_url(self, db_session):
+        await url_repository.add("https://example.com/", db_session)
+        assert await url_repository.add("HTTPS://Example.COM:443/", db_session) is None
+
+        retrieved = await url_repository.get_by_url("HTTPS://EXAMPLE.com", db_session)
+        assert retrieved is not None
+        assert str(retrieved.url) == "https://example.com/"
+
+    async def test_add_long_url(self, db_session):
+        url = "https://example.com/" + "a" * 2000
+        result = await url_repository.add(url, db_session)
+        assert result is not None
+
+        retrieved = await url_repository.get_by_url(url, db_session)
+        assert str(retrieved.url) == url
+
     async def test_missing_get_url_by_url(self, db_session):
         retrieved = await url_repository.get_by_url("https://example.com/", db_session)
         assert retrieved is None
@@ -95,6 +114,16 @@ class TestUrlRepository:
         assert retrieved is not None
         assert str(retrieved.url) == "https://bar.com/"
 
+    async def test_update_bumps_version(self, db_session):
+        result = await url_repository.add("https://foo.com/", db_session)
+        assert result.version == 1
+
+        updated = await url_repository.update(
+            UrlModel(hash=result.hash, url=None, on=False), db_session
+        )
+        assert updated.version == 2
+        assert updated.updated_at >= result.updated_at
+
     async def test_update_active_status(self, db_session):
         result = await url_repository.add("https://foo.com/", db_session)
         assert result is not None
@@ -106,3 +135,41 @@ class TestUrlRepository:
 
         assert retrieved is not None
         assert not retrieved.on
+
+    async def test_add_many_urls(self, db_session):
+        urls = ["https://foo.com/", "https://bar.com/", "https://baz.com/"]
+        results, duplicated = await url_repository.add_many(urls, db_session)
+
+        assert duplicated == 0
+        assert [str(result.url) for result in results] == urls
+        assert len({result.hash for result in results}) == 3
+
+    async def test_add_many_duplicated_urls(self, db_session):
+        existing = await url_repository.add("https://foo.com/", db_session)
+        assert existing is not None
+
+        urls = ["https://bar.com/", "https://foo.com/", "https://bar.com/"]
+        results, duplicated = await url_repository.add_many(urls, db_session)
+
+        assert duplicated == 1
+        assert [str(result.url) for result in results] == urls
+        assert results[1].hash == existing.hash
+        assert results[0].hash == results[2].hash
+
+    async def test_get_page(self, db_session):
+        urls = [f"https://example.com/{i}" for i in range(5)]
+        await url_repository.add_many(urls, db_session)
+
+        page = await url_repository.get_page(db_session, after=0, limit=2)
+        assert [str(item.url) for item in page] == urls[:2]
+
+        after = from_hash(page[-1].hash)
+        page = await url_repository.get_page(db_session, after=after, limit=10)
+        assert [str(item.url) for item in page] == urls[2:]
+
+    async def test_stream(self, db_session):
+        urls = [f"https://example.com/{i}" for i in range(5)]
+        await url_repository.add_many(urls, db_session)
+
+        streamed = [item async for item in url_repository.stream(db_session)]
+        assert [str(item.url) for item in streamed] == urls
@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from app.cache import NOT_FOUND, bucket_of, local_cache
+from app.models import UrlModel
+from app.service.cache_sync import CacheSync
+from app.utils.entry import CachedUrl, encode_entry, pack_entry
+from app.utils.hash import to_hash
+from tests.conftest import FakeRedis
+
+FOO = CachedUrl("https://foo.com/", 1, 1700000000)
+BAR = CachedUrl("https://bar.com/", 2, 1700000001)
+
+
+def make_sync(redis: FakeRedis, publish=None, **kwargs) -> CacheSync:
+    async def factory():
+        return redis
+
+    return CacheSync(factory, publish, retry_delay=0, linger=0, **kwargs)
+
+
+@pytest.mark.asyncio
+class TestCacheSync:
+    async def test_operations_are_coalesced(self):
+        redis = FakeRedis()
+        sync = make_sync(redis)
+        sync.set("AAAAAAAB", FOO)
+        sync.set("AAAAAAAB", BAR)
+        sync.delete("AAAAAAAC")
+        await sync.stop()
+
+        assert redis.data == {"AAAAAAAB": encode_entry(BAR)}
+        assert len(redis.executed) == 1, "A single pipelined round trip"
+        assert sync.flushed == 2
+
+    async def test_last_operation_wins(self):
+        redis = FakeRedis()
+        redis.data["AAAAAAAB"] = encode_entry(FOO)
+        sync = make_sync(redis)
+        sync.set("AAAAAAAB", BAR)
+        sync.delete("AAAAAAAB")
+        assert sync.get("AAAAAAAB") is NOT_FOUND
+        await sync.stop()
+        assert redis.data == {}
+
+    async def test_sync_inactive_record_invalidates(self):
+        sync = make_sync(FakeRedis())
+        sync.sync(UrlModel(hash="AAAAAAAB", url="https://foo.com/", on=False))
+        assert sync.get("AAAAAAAB") is NOT_FOUND
+        sync.sync(UrlModel(hash="AAAAAAAB", url="https://foo.com/", on=True))
+        assert sync.get("AAAAAAAB") == CachedUrl("https://foo.com/")
+
+    async def test_expiring_entries_get_a_ttl(self):
+        redis = FakeRedis()
+        sync = make_sync(redis)
+        expiring = CachedUrl(
+            "https://foo.com/", 1, 1700000000, expires_at=4_000_000_000
+        )
+        sync.set("AAAAAAAB", expiring)
+        sync.set("AAAAAAAC", CachedUrl("https://bar.com/", expires_at=1))
+        await sync.stop()
+        assert redis.data == {"AAAAAAAB": encode_entry(expiring)}
+        assert redis.ttls == {"AAAAAAAB": 4_000_000_000}
+
+    async def test_queue_evicts_local_cache(self):
+        local_cache.set("AAAAAAAB", "https://foo.com/")
+        sync = make_sync(FakeRedis())
+        sync.delete("AAAAAAAB")
+        assert "AAAAAAAB" not in local_cache
+
+    async def test_failed_batch_is_retried(self):
+        redis = FakeRedis(fail=1)
+        sync = make_sync(redis)
+        sync.set("AAAAAAAB", FOO)
+        assert await sync.flush() is False
+        assert sync.get("AAAAAAAB") == FOO
+
+        # a newer operation queued after the failure is kept
+        sync.set("AAAAAAAB", BAR)
+        assert await sync.flush() is True
+        assert redis.data == {"AAAAAAAB": encode_entry(BAR)}
+        assert sync.retried == 1
+
+    async def test_background_flush(self):
+        redis = FakeRedis(fail=2)
+        sync = make_sync(redis)
+        await sync.start()
+        sync.set("AAAAAAAB", FOO)
+        for _ in range(100):
+            if redis.data:
+                break
+            await asyncio.sleep(0)
+        await sync.stop()
+        assert redis.data == {"AAAAAAAB": encode_entry(FOO)}
+        assert sync.retried == 2
+
+    async def test_batches_are_published_after_redis(self):
+        redis = FakeRedis()
+        published = []
+
+        async def publish(hashes):
+            assert redis.data == {"AAAAAAAB": encode_entry(FOO)}
+            published.append(hashes)
+
+        sync = make_sync(redis, publish)
+        sync.set("AAAAAAAB", FOO)
+        sync.delete("AAAAAAAC")
+        await sync.stop()
+        assert published == [["AAAAAAAB", "AAAAAAAC"]]
+
+    async def test_stop_retries_pending_operations(self):
+        redis = FakeRedis(fail=3)
+        sync = make_sync(redis)
+        sync.set("AAAAAAAB", FOO)
+        await sync.stop()
+        assert redis.data == {"AAAAAAAB": encode_entry(FOO)}
+        assert sync.dropped == 0
+
+    async def test_stop_reports_lost_operations(self, caplog):
+        sync = make_sync(FakeRedis(fail=10_000), stop_timeout=0.01)
+        sync.set("AAAAAAAB", FOO)
+        await sync.stop()
+        assert sync.dropped == 1
+        assert "AAAAAAAB" in caplog.text
+
+    async def test_confirm_waits_for_redis(self):
+        redis = FakeRedis(fail=2)
+        sync = make_sync(redis, write_through=True)
+        await sync.start()
+        sync.set("AAAAAAAB", FOO)
+        await sync.confirm("AAAAAAAB")
+        assert redis.data == {"AAAAAAAB": encode_entry(FOO)}
+        await sync.confirm("AAAAAAAC")  # nothing pending
+        await sync.stop()
+
+    async def test_confirm_timeout_keeps_operation(self):
+        redis = FakeRedis(fail=10_000)
+        sync = make_sync(redis, write_through=True, write_timeout=0.01)
+        await sync.start()
+        sync.set("AAAAAAAB", FOO)
+        with pytest.raises(TimeoutError):
+            await sync.confirm("AAAAAAAB")
+        assert sync.get("AAAAAAAB") == FOO
+
+        redis.fail = 0
+        sync.stop_timeout = 1.0
+        await sync.stop()
+        assert redis.data == {"AAAAAAAB": encode_entry(FOO)}
+
+    async def test_confirm_without_write_through(self):
+        sync = make_sync(FakeRedis(fail=10_000))
+        sync.set("AAAAAAAB", FOO)
+        await sync.confirm("AAAAAAAB")  # returns right away
+
+    async def test_bucket_layout(self, bucket_layout):
+        redis = FakeRedis()
+        key, field = bucket_of(to_hash(2))
+        redis.data[key] = {field: pack_entry(BAR)}
+        sync = make_sync(redis)
+        sync.set(to_hash(1), FOO)
+        sync.set(to_hash(200), BAR)
+        sync.delete(to_hash(2))
+        await sync.stop()
+
+        assert redis.data == {"b:0": {1: pack_entry(FOO)}, "b:1": {72: pack_entry(BAR)}}
+        assert len(redis.executed) == 1
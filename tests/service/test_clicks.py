@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base
+from app.repository.click_repository import click_repository
+from app.service.clicks import ClickCollector
+from app.utils.hash import to_hash
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def session_factory():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield SessionLocal
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+class TestClickCollector:
+    async def test_clicks_are_aggregated(self, session_factory):
+        collector = ClickCollector(session_factory, bucket_seconds=3600)
+        for _ in range(3):
+            collector.record(1)
+        collector.record(2)
+        await collector.stop()
+
+        async with session_factory() as db:
+            clicks = await click_repository.get(to_hash(1), db)
+        assert len(clicks) == 1
+        assert clicks[0].count == 3
+        assert collector.flushed == 4
+
+    async def test_counts_are_incremented(self, session_factory):
+        collector = ClickCollector(session_factory, bucket_seconds=3600)
+        collector.record(1)
+        await collector.stop()
+        collector.record(1)
+        await collector.stop()
+
+        async with session_factory() as db:
+            clicks = await click_repository.get(to_hash(1), db)
+        assert sum(click.count for click in clicks) == 2
+
+    async def test_full_queue_drops_events(self, session_factory):
+        collector = ClickCollector(session_factory, maxsize=2)
+        for _ in range(5):
+            collector.record(1)
+        assert collector.recorded == 2
+        assert collector.dropped == 3
+
+    async def test_background_flush(self, session_factory):
+        collector = ClickCollector(session_factory, batch_size=2, flush_interval=60)
+        await collector.start()
+        collector.record(1)
+        collector.record(1)  # full batch, wakes up the writer
+        for _ in range(100):
+            if collector.flushed:
+                break
+            await asyncio.sleep(0.01)
+        await collector.stop()
+        assert collector.flushed == 2
@@ -0,0 +1,105 @@
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import NOT_FOUND
+from app.models import Base
+from app.repository.click_repository import click_repository
+from app.repository.id_allocator import url_id_allocator
+from app.repository.url_repository import url_repository
+from app.service.cache_sync import cache_sync
+from app.service.expiry import SWEEP_LOCK, ExpirySweeper
+from app.utils.hash import to_hash
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def session_factory():
+    url_id_allocator.reset()  # the reserved block belongs to the dropped DB
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    now = int(time.time())
+    async with SessionLocal() as db:
+        # indexes 1 to 3 expired, 4 expires later and 5 never
+        await url_repository.add_many(
+            [f"https://{i}.com/" for i in range(1, 4)], db, expires_at=now - 10
+        )
+        await url_repository.add("https://4.com/", db, expires_at=now + 3600)
+        await url_repository.add("https://5.com/", db)
+    cache_sync.pending.clear()
+    yield SessionLocal
+    cache_sync.pending.clear()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+def redis_client(set_result=True):
+    client = AsyncMock(spec=Redis)
+    client.set = AsyncMock(return_value=set_result)
+    return client
+
+
+def make_sweeper(session_factory, client=None, **kwargs) -> ExpirySweeper:
+    client = client or redis_client()
+    return ExpirySweeper(session_factory, AsyncMock(return_value=client), **kwargs)
+
+
+@pytest.mark.asyncio
+class TestExpirySweeper:
+    async def test_purge_in_batches(self, session_factory):
+        async with session_factory() as db:
+            now = int(time.time())
+            await click_repository.add_counts({(1, now): 3, (4, now): 2}, db)
+        sweeper = make_sweeper(session_factory, batch_size=2, purge=True)
+        assert await sweeper.sweep() == 3
+        assert await sweeper.sweep() == 0
+
+        async with session_factory() as db:
+            records = await url_repository.get_all(db)
+        assert [str(record.url) for record in records] == [
+            "https://4.com/",
+            "https://5.com/",
+        ]
+        # swept links are invalidated like deleted ones
+        assert cache_sync.get(to_hash(1)) is NOT_FOUND
+        # and their clicks are gone with them
+        async with session_factory() as db:
+            assert await click_repository.get(to_hash(1), db) == []
+            assert len(await click_repository.get(to_hash(4), db)) == 1
+
+    async def test_deactivate(self, session_factory):
+        sweeper = make_sweeper(session_factory, batch_size=2)
+        assert await sweeper.sweep() == 3
+        assert await sweeper.sweep() == 0
+
+        async with session_factory() as db:
+            record = await url_repository.get(to_hash(1), db)
+        assert record.on is False
+        assert record.version == 2
+
+    async def test_expired_links_do_not_resolve(self, session_factory):
+        async with session_factory() as db:
+            assert await url_repository.get_entry(to_hash(1), db) is None
+            entry = await url_repository.get_entry(to_hash(4), db)
+            assert entry.expires_at > time.time()
+
+    async def test_single_worker_sweeps_an_interval(self, session_factory):
+        client = redis_client()
+        sweeper = make_sweeper(session_factory, client, interval=60)
+        assert await sweeper.elected()
+        client.set.assert_awaited_with(SWEEP_LOCK, 1, nx=True, px=59_900)
+
+        # the lock is held by another worker
+        sweeper = make_sweeper(session_factory, redis_client(None))
+        assert not await sweeper.elected()
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ConnectionError
+
+from app.cache import local_cache
+from app.service.invalidation import LocalBus, RedisBus
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def subscribe(self, channel):
+        if self.redis.down:
+            raise ConnectionError("redis is down")
+        self.redis.subscribed.set()
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        if self.redis.down:
+            raise ConnectionError("redis is down")
+        try:
+            data = await asyncio.wait_for(self.redis.messages.get(), timeout)
+        except TimeoutError:
+            return None
+        return {"type": "message", "data": data}
+
+
+class FakeRedis:
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.messages = asyncio.Queue()
+        self.subscribed = asyncio.Event()
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    async def publish(self, channel, data):
+        await self.messages.put(data.encode())
+
+
+def make_bus(redis: FakeRedis) -> RedisBus:
+    async def factory():
+        return redis
+
+    return RedisBus(factory, degraded_ttl=0.5, retry_delay=0)
+
+
+async def wait_until(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not met")
+
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    ttl = local_cache.ttl
+    local_cache.clear()
+    yield
+    local_cache.clear()
+    local_cache.ttl = ttl
+
+
+@pytest.mark.asyncio
+class TestInvalidationBus:
+    async def test_local_bus_evicts(self):
+        local_cache.set("AAAAAAAB", "https://foo.com/")
+        await LocalBus().publish(["AAAAAAAB"])
+        assert "AAAAAAAB" not in local_cache
+
+    async def test_published_hashes_are_evicted(self):
+        redis = FakeRedis()
+        bus = make_bus(redis)
+        await bus.start()
+        await redis.subscribed.wait()
+        assert bus.connected
+
+        local_cache.set("AAAAAAAB", "https://foo.com/")
+        local_cache.set("AAAAAAAC", "https://bar.com/")
+        local_cache.set("AAAAAAAD", "https://baz.com/")
+        await bus.publish(["AAAAAAAB", "AAAAAAAC"])
+        await wait_until(lambda: bus.received == 1)
+        await bus.stop()
+
+        assert "AAAAAAAB" not in local_cache
+        assert "AAAAAAAC" not in local_cache
+        assert "AAAAAAAD" in local_cache
+
+    async def test_disconnect_bounds_staleness(self):
+        redis = FakeRedis()
+        bus = make_bus(redis)
+        regular_ttl = local_cache.ttl
+        await bus.start()
+        await redis.subscribed.wait()
+        local_cache.set("AAAAAAAB", "https://foo.com/")
+
+        # a lost subscription clears the cache and shortens the ttl
+        redis.down = True
+        await redis.messages.put(b"")
+        await wait_until(lambda: not bus.connected)
+        assert len(local_cache) == 0
+        assert local_cache.ttl == 0.5
+
+        # back to the regular ttl once subscribed again
+        redis.down, redis.subscribed = False, asyncio.Event()
+        await redis.subscribed.wait()
+        await wait_until(lambda: bus.connected)
+        assert local_cache.ttl == regular_ttl
+        await bus.stop()
@@ -0,0 +1,60 @@
+import pytest
+
+from app.service.metrics_sync import MetricsSync, mark_dead, reset, write_snapshot
+from app.utils.metrics import Counter, Gauge, Histogram, Registry
+
+
+def worker_registry(hits: int, in_use: int) -> Registry:
+    registry = Registry()
+    counter = registry.register(Counter("hits_total", "hits", labels=("tier",)))
+    counter.inc("local", amount=hits)
+    histogram = registry.register(Histogram("latency", "latency", buckets=(1.0,)))
+    histogram.observe(0.5)
+    registry.register(Gauge("pool", "pool", lambda: {(): in_use}))
+    registry.register(Counter("jobs_total", "jobs", callback=lambda: {(): hits * 10}))
+    return registry
+
+
+@pytest.mark.asyncio
+class TestMetricsSync:
+    async def test_single_worker_without_directory(self):
+        sync = MetricsSync(worker_registry(3, 1))
+        text = await sync.render()
+        assert 'hits_total{tier="local"} 3' in text
+        assert "pool 1" in text
+
+    async def test_merges_the_workers(self, tmp_path):
+        reset(str(tmp_path))
+        other = worker_registry(2, 4)
+        write_snapshot(tmp_path, {"pid": 1, "live": True, "metrics": other.snapshot()})
+        sync = MetricsSync(worker_registry(3, 1), str(tmp_path))
+
+        text = await sync.render()
+        assert 'hits_total{tier="local"} 5' in text
+        assert 'latency_bucket{le="1.0"} 2' in text
+        assert 'pool{pid="1"} 4' in text
+        assert text.count("pool{pid=") == 2
+
+    async def test_dead_worker_keeps_counters(self, tmp_path):
+        reset(str(tmp_path))
+        other = worker_registry(2, 4)
+        write_snapshot(tmp_path, {"pid": 1, "live": True, "metrics": other.snapshot()})
+        mark_dead(str(tmp_path), 1)
+        sync = MetricsSync(worker_registry(3, 1), str(tmp_path))
+
+        text = await sync.render()
+        assert 'hits_total{tier="local"} 5' in text
+        assert 'pool{pid="1"}' not in text
+        # totals kept by the services are counters too, the dead worker included
+        assert "jobs_total 50" in text
+
+    async def test_stop_writes_a_last_snapshot(self, tmp_path):
+        sync = MetricsSync(worker_registry(3, 1), str(tmp_path), interval=60)
+        await sync.start()
+        await sync.stop()
+        assert len(list(tmp_path.glob("*.json"))) == 1
+
+    async def test_reset(self, tmp_path):
+        (tmp_path / "1.json").write_text("{}")
+        reset(str(tmp_path))
+        assert not list(tmp_path.glob("*.json"))
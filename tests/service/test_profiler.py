@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import pytest
+
+from app.service.profiler import SamplingProfiler, render
+
+
+def busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.mark.asyncio
+class TestSamplingProfiler:
+    async def test_samples_the_event_loop(self):
+        profiler = SamplingProfiler()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            busy(0.2)
+
+        stacks, _ = await asyncio.gather(profiler.profile(0.15, 0.001), work())
+        assert any(stack.endswith(")") and "busy (" in stack for stack in stacks)
+        lines = render(stacks).splitlines()
+        assert lines[0].rsplit(" ", 1)[1] == str(stacks.most_common(1)[0][1])
+
+    async def test_one_profile_at_a_time(self):
+        profiler = SamplingProfiler()
+        running = asyncio.create_task(profiler.profile(0.05))
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError):
+            await profiler.profile(0.05)
+        assert await running is not None
+        assert not profiler.running
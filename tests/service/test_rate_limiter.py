@@ -0,0 +1,184 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from redis.exceptions import ConnectionError
+
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.service.rate_limiter import RateLimiter, RedisRateLimiter, Rule
+
+LIMITS = {"GET /{hash}": (1.0, 2), "POST /api/v1/urls/": (1.0, 1)}
+
+
+class FakeScript:
+    "stands for the lease script, a bucket of `tokens` that never refills"
+
+    def __init__(self, tokens: int, fail: bool = False):
+        self.tokens = tokens
+        self.fail = fail
+        self.calls = []
+
+    async def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        if self.fail:
+            raise ConnectionError("redis is down")
+        granted = min(self.tokens, args[2])
+        self.tokens -= granted
+        return [granted, "0" if granted else "2.5"]
+
+
+class FakeRedis:
+    def __init__(self, script: FakeScript):
+        self.script = script
+
+    def register_script(self, source):
+        return self.script
+
+
+async def ok(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+@pytest.mark.asyncio
+class TestRateLimiter:
+    async def test_match_route_template(self):
+        limiter = RateLimiter(LIMITS)
+        assert limiter.match("GET", "/abcdefgh").name == "GET /{hash}"
+        assert limiter.match("POST", "/api/v1/urls/").name == "POST /api/v1/urls/"
+        assert limiter.match("GET", "/api/v1/urls/") is None
+        assert limiter.match("DELETE", "/abcdefgh") is None
+
+    async def test_burst_then_retry_after(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("app.service.rate_limiter.time.monotonic", lambda: now[0])
+        limiter = RateLimiter(LIMITS)
+        rule = limiter.match("GET", "/abcdefgh")
+
+        assert await limiter.acquire(rule, "1.1.1.1") == 0
+        assert await limiter.acquire(rule, "1.1.1.1") == 0
+        assert await limiter.acquire(rule, "1.1.1.1") == pytest.approx(1.0)
+        # other clients have their own bucket
+        assert await limiter.acquire(rule, "2.2.2.2") == 0
+
+        now[0] += 0.5
+        assert await limiter.acquire(rule, "1.1.1.1") == pytest.approx(0.5)
+        now[0] += 0.5
+        assert await limiter.acquire(rule, "1.1.1.1") == 0
+
+    async def test_prune_idle_clients(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("app.service.rate_limiter.time.monotonic", lambda: now[0])
+        limiter = RateLimiter(LIMITS, max_clients=2)
+        rule = limiter.match("GET", "/abcdefgh")
+        await limiter.acquire(rule, "1.1.1.1")
+        await limiter.acquire(rule, "2.2.2.2")
+        await limiter.acquire(rule, "2.2.2.2")
+
+        now[0] += 1.0
+        await limiter.acquire(rule, "3.3.3.3")
+        # the first client refilled its bucket, the second did not yet
+        assert {client for _, client in limiter.buckets} == {"2.2.2.2", "3.3.3.3"}
+
+    async def test_keyed_rules(self):
+        limiter = RateLimiter(LIMITS, key_factor=10)
+        assert limiter.keyed["GET /{hash}"] == Rule("GET /{hash}", 10.0, 20)
+
+    async def test_redis_leases_tokens(self):
+        script = FakeScript(tokens=3)
+        limiter = RedisRateLimiter(LIMITS, lambda: _client(script), lease=2)
+        rule = limiter.match("GET", "/abcdefgh")
+
+        for _ in range(3):
+            assert await limiter.acquire(rule, "1.1.1.1") == 0
+        assert len(script.calls) == 2
+        assert script.calls[0] == (["ratelimit:GET /{hash}:1.1.1.1"], [1.0, 2, 2])
+
+        # a rejected client is rejected locally until it may retry
+        assert await limiter.acquire(rule, "1.1.1.1") == 2.5
+        assert await limiter.acquire(rule, "1.1.1.1") > 0
+        assert len(script.calls) == 3
+
+    async def test_redis_down_falls_back_to_local_buckets(self):
+        script = FakeScript(tokens=0, fail=True)
+        limiter = RedisRateLimiter(LIMITS, lambda: _client(script))
+        rule = limiter.match("POST", "/api/v1/urls/")
+        assert await limiter.acquire(rule, "1.1.1.1") == 0
+        assert await limiter.acquire(rule, "1.1.1.1") > 0
+
+    async def test_redis_down_is_probed_after_the_cooldown(self, monkeypatch, caplog):
+        now = [100.0]
+        monkeypatch.setattr("app.service.rate_limiter.time.monotonic", lambda: now[0])
+        script = FakeScript(tokens=100, fail=True)
+        calls = script.calls
+        limiter = RedisRateLimiter(LIMITS, lambda: _client(script), cooldown=5.0)
+        rule = limiter.match("GET", "/abcdefgh")
+        assert await limiter.acquire(rule, "1.1.1.1") == 0
+        # redis is not tried again, nor the failure logged, during the cooldown
+        for client_ip in ("2.2.2.2", "3.3.3.3"):
+            assert await limiter.acquire(rule, client_ip) == 0
+        assert len(calls) == 1
+        assert len(caplog.records) == 1
+        assert caplog.records[0].exc_info is None
+
+        # then a request probes it, failing again opens a new window
+        now[0] += 5.0
+        assert await limiter.acquire(rule, "4.4.4.4") == 0
+        assert len(calls) == 2
+        assert len(caplog.records) == 2
+        assert await limiter.acquire(rule, "5.5.5.5") == 0
+        assert len(calls) == 2
+
+        # once redis answers the leases are served by it again
+        now[0] += 5.0
+        script.fail = False
+        assert await limiter.acquire(rule, "6.6.6.6") == 0
+        assert limiter.down_until == 0
+        assert len(calls) == 3
+        assert await limiter.acquire(rule, "7.7.7.7") == 0
+        assert len(calls) == 4
+
+
+async def _client(script: FakeScript) -> FakeRedis:
+    return FakeRedis(script)
+
+
+@pytest.mark.asyncio
+class TestRateLimitMiddleware:
+    async def request(self, app, path="/abcdefgh", headers=None):
+        transport = ASGITransport(app=app, client=("1.1.1.1", 123))
+        async with AsyncClient(transport=transport, base_url="http://") as client:
+            return await client.get(path, headers=headers)
+
+    async def test_too_many_requests(self):
+        app = RateLimitMiddleware(ok, RateLimiter(LIMITS))
+        assert (await self.request(app)).status_code == 200
+        assert (await self.request(app)).status_code == 200
+        response = await self.request(app)
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+        assert response.json() == {"detail": "Too Many Requests"}
+
+    async def test_unlimited_route(self):
+        app = RateLimitMiddleware(ok, RateLimiter(LIMITS))
+        for _ in range(5):
+            assert (await self.request(app, "/api/v1/urls/")).status_code == 200
+
+    async def test_api_key(self):
+        limiter = RateLimiter(LIMITS)
+        app = RateLimitMiddleware(ok, limiter, api_keys=["secret"])
+        for _ in range(5):
+            response = await self.request(app, headers={"X-API-Key": "secret"})
+            assert response.status_code == 200
+        # unknown keys are limited by IP address
+        for _ in range(2):
+            await self.request(app, headers={"X-API-Key": "guess"})
+        assert (
+            await self.request(app, headers={"X-API-Key": "guess"})
+        ).status_code == 429
+        assert all("secret" not in client for _, client in limiter.buckets)
+
+    async def test_forwarded_for(self):
+        limiter = RateLimiter(LIMITS)
+        app = RateLimitMiddleware(ok, limiter, trusted_proxies=1)
+        await self.request(app, headers={"X-Forwarded-For": "6.6.6.6, 2.2.2.2"})
+        await self.request(app)
+        assert {client for _, client in limiter.buckets} == {"2.2.2.2", "1.1.1.1"}
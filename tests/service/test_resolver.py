@@ -0,0 +1,72 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+import pytest_asyncio
+
+from app.cache import generations, local_cache
+from app.repository.url_repository import url_repository
+from app.service.invalidation import LocalBus
+from app.service.resolver import resolve_url
+from app.utils.entry import CachedUrl, encode_entry
+from app.utils.hash import to_hash
+
+HASH = to_hash(1)
+OLD = CachedUrl("https://old.com/", 1, 1700000000)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def redis():
+    "redis answering the old entry, the test decides what happens meanwhile"
+    local_cache.clear()
+    client = AsyncMock()
+    client.get = AsyncMock(return_value=encode_entry(OLD))
+    yield client
+    local_cache.clear()
+
+
+@pytest.mark.asyncio
+class TestResolver:
+    async def test_redis_hit_is_cached(self, redis):
+        assert await resolve_url(HASH, None, redis) == OLD
+        assert local_cache.get(HASH) == OLD
+        assert not generations
+
+    async def test_evicted_during_the_load_is_not_cached(self, redis):
+        async def get(key):
+            # the link is updated while the GET is in flight
+            await LocalBus().publish([HASH])
+            return encode_entry(OLD)
+
+        redis.get.side_effect = get
+        assert await resolve_url(HASH, None, redis) == OLD
+        assert local_cache.get(HASH) is None
+        assert not generations
+
+    async def test_shared_load_outlives_a_cancelled_leader(self, redis, monkeypatch):
+        sessions = []
+        released = asyncio.Event()
+
+        def session_factory():
+            session = AsyncMock()
+            sessions.append(session)
+            return session
+
+        async def get_entry(hash, db):
+            await db.execute("SELECT 1")  # opens the session, as a query would
+            await released.wait()
+            return OLD
+
+        redis.get.return_value = None
+        monkeypatch.setattr(url_repository, "get_entry", get_entry)
+        leader = asyncio.create_task(resolve_url(HASH, session_factory, redis))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(resolve_url(HASH, session_factory, redis))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        released.set()
+
+        assert await follower == OLD
+        assert len(sessions) == 1
+        sessions[0].close.assert_awaited_once()
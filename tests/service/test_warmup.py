@@ -0,0 +1,198 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import bucket_of, evict_local, local_cache
+from app.models import Base, UrlModel
+from app.repository.click_repository import click_repository
+from app.repository.id_allocator import url_id_allocator
+from app.repository.url_repository import url_repository
+from app.service.warmup import BACKFILL_KEY, BACKFILL_LOCK, WarmUp
+from app.utils.entry import CachedUrl, decode_entry, encode_entry
+from app.utils.hash import to_hash
+from tests.conftest import FakeRedis
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def session_factory():
+    url_id_allocator.reset()  # the reserved block belongs to the dropped DB
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        await url_repository.add_many([f"https://{i}.com/" for i in range(1, 6)], db)
+        # index 4 is the most clicked, then index 2
+        now = int(time.time())
+        await click_repository.add_counts({(4, now): 10, (2, now): 5}, db)
+    local_cache.clear()
+    yield SessionLocal
+    local_cache.clear()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+def make_warmup(session_factory, redis: FakeRedis, size: int) -> WarmUp:
+    async def factory():
+        return redis
+
+    return WarmUp(session_factory, factory, size=size)
+
+
+@pytest.mark.asyncio
+class TestWarmUp:
+    async def test_most_clicked_links_first(self, session_factory):
+        redis = FakeRedis()
+        warmup = make_warmup(session_factory, redis, size=2)
+        await warmup.run()
+
+        assert warmup.ready
+        assert warmup.loaded == 2
+        assert [decode_entry(value).url for value in redis.data.values()] == [
+            "https://4.com/",
+            "https://2.com/",
+        ]
+        assert list(redis.data) == [to_hash(4), to_hash(2)]
+        assert local_cache.get(to_hash(4)).url == "https://4.com/"
+
+    async def test_newer_values_are_kept(self, session_factory):
+        redis = FakeRedis()
+        redis.data[to_hash(4)] = encode_entry(CachedUrl("https://new.com/", 2))
+        warmup = make_warmup(session_factory, redis, size=2)
+        await warmup.run()
+
+        assert decode_entry(redis.data[to_hash(4)]).url == "https://new.com/"
+        assert decode_entry(redis.data[to_hash(2)]).url == "https://2.com/"
+
+    async def test_newer_fields_are_kept(self, session_factory, bucket_layout):
+        redis = FakeRedis()
+        key, field = bucket_of(to_hash(4))
+        redis.data[key] = {field: b"newer"}
+        warmup = make_warmup(session_factory, redis, size=2)
+        await warmup.run()
+
+        assert redis.data[key][field] == b"newer"
+        assert ("hsetnx", key) in redis.commands
+
+    async def test_completed_with_latest_links(self, session_factory):
+        redis = FakeRedis()
+        warmup = make_warmup(session_factory, redis, size=4)
+        await warmup.run()
+
+        assert list(redis.data) == [to_hash(i) for i in (4, 2, 5, 3)]
+
+    async def test_failure_still_ready(self, session_factory):
+        async def factory():
+            raise ConnectionError("redis is down")
+
+        warmup = WarmUp(session_factory, factory, size=2)
+        await warmup.run()
+        assert warmup.ready
+        assert warmup.loaded == 0
+
+    async def test_backfill_every_active_link(self, session_factory):
+        async with session_factory() as db:
+            await url_repository.add("https://expired.com/", db, expires_at=1)
+        redis = FakeRedis()
+        warmup = WarmUp(session_factory, lambda: _resolved(redis), backfill=True)
+        await warmup.start()
+        await until(lambda: warmup.ready)
+        await warmup.stop()
+
+        assert warmup.loaded == 5
+        assert BACKFILL_KEY in redis.data
+        assert BACKFILL_LOCK not in redis.data
+        assert {
+            hash: decode_entry(value).url
+            for hash, value in redis.data.items()
+            if hash != BACKFILL_KEY
+        } == {to_hash(i): f"https://{i}.com/" for i in range(1, 6)}
+
+        # done once, the next workers find the marker
+        assert await warmup.load_all() == 0
+
+    async def test_backfill_rewrites_the_links_written_meanwhile(
+        self, session_factory, monkeypatch
+    ):
+        redis = FakeRedis()
+        stream_entries = url_repository.stream_entries
+
+        async def racing(db):
+            async for entries in stream_entries(db):
+                # link 1 deleted and link 2 updated after being read, the
+                # cache sync applies it before the backfill writes them
+                async with session_factory() as other:
+                    await url_repository.delete(to_hash(1), other)
+                    update = UrlModel(hash=to_hash(2), url="https://new.com/")
+                    await url_repository.update(update, other)
+                redis.data[to_hash(2)] = encode_entry(CachedUrl("https://new.com/"))
+                evict_local(to_hash(1))
+                evict_local(to_hash(2))
+                yield entries
+
+        monkeypatch.setattr(url_repository, "stream_entries", racing)
+        warmup = WarmUp(session_factory, lambda: _resolved(redis), backfill=True)
+        assert await warmup.load_all() == 5
+
+        assert to_hash(1) not in redis.data
+        assert decode_entry(redis.data[to_hash(2)]).url == "https://new.com/"
+        assert decode_entry(redis.data[to_hash(3)]).url == "https://3.com/"
+
+    async def test_backfill_waits_for_another_worker(self, session_factory):
+        redis = FakeRedis()
+        redis.data[BACKFILL_LOCK] = 1
+        warmup = WarmUp(session_factory, lambda: _resolved(redis), backfill=True)
+        await warmup.start()
+        await asyncio.sleep(0.01)
+        assert not warmup.ready
+
+        redis.data[BACKFILL_KEY] = 1
+        await until(lambda: warmup.ready)
+        await warmup.stop()
+        assert warmup.loaded == 0
+
+    async def test_backfill_failure_not_ready(self, session_factory):
+        async def factory():
+            raise ConnectionError("redis is down")
+
+        warmup = WarmUp(session_factory, factory, backfill=True, check_interval=0.01)
+        await warmup.start()
+        await asyncio.sleep(0.05)
+        assert not warmup.ready
+        await warmup.stop()
+
+    async def test_backfill_again_after_flush(self, session_factory):
+        redis = FakeRedis()
+        warmup = WarmUp(
+            session_factory,
+            lambda: _resolved(redis),
+            backfill=True,
+            check_interval=0.01,
+        )
+        await warmup.start()
+        await until(lambda: warmup.ready)
+
+        redis.data.clear()  # FLUSHALL
+        await until(lambda: BACKFILL_KEY in redis.data)
+        await until(lambda: warmup.ready)
+        await warmup.stop()
+        assert to_hash(1) in redis.data
+
+
+async def _resolved(value):
+    return value
+
+
+async def until(condition, timeout: float = 2.0) -> None:
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.005)
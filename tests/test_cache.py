@@ -0,0 +1,55 @@
+import pytest
+
+from app.cache import (
+    bucket_of,
+    queue_deletes,
+    queue_entries,
+    read_entry,
+    write_entry,
+)
+from app.utils.entry import CachedUrl, pack_entry
+from app.utils.hash import to_hash
+from tests.conftest import FakeRedis
+
+FOO = CachedUrl("https://foo.com/", 1, 1700000000)
+BAR = CachedUrl("https://bar.com/", 2, 1700000001, True, 4102444800)
+
+
+@pytest.mark.asyncio
+class TestCacheLayout:
+    async def test_string_layout(self):
+        redis = FakeRedis()
+        await write_entry(redis, to_hash(1), FOO)
+        assert await read_entry(redis, to_hash(1)) == FOO
+        assert await read_entry(redis, to_hash(2)) is None
+
+    async def test_bucket_layout(self, bucket_layout):
+        redis = FakeRedis()
+        await write_entry(redis, to_hash(1), FOO)
+        await write_entry(redis, to_hash(2), BAR)
+
+        assert list(redis.data) == ["b:0"]
+        assert redis.data["b:0"] == {1: pack_entry(FOO), 2: pack_entry(BAR)}
+        assert await read_entry(redis, to_hash(2)) == BAR
+        assert await read_entry(redis, to_hash(3)) is None
+
+    async def test_bucket_of(self, bucket_layout):
+        assert bucket_of(to_hash(127)) == ("b:0", 127)
+        assert bucket_of(to_hash(128)) == ("b:1", 0)
+        assert bucket_of(to_hash(4096 + 5)) == ("b:20", 5)
+
+    async def test_queue_a_hset_per_bucket(self, bucket_layout):
+        redis = FakeRedis()
+        expired = CachedUrl("https://old.com/", expires_at=1)
+        entries = {to_hash(1): FOO, to_hash(2): BAR, to_hash(200): FOO}
+        pipe = redis.pipeline()
+        queue_entries(pipe, {**entries, to_hash(3): expired})
+        await pipe.execute()
+        assert redis.commands == [("hset", "b:0"), ("hset", "b:1"), ("hdel", "b:0")]
+        for hash, entry in entries.items():
+            assert await read_entry(redis, hash) == entry
+
+        pipe = redis.pipeline()
+        queue_deletes(pipe, [to_hash(1), to_hash(200)])
+        await pipe.execute()
+        assert redis.data == {"b:0": {2: pack_entry(BAR)}, "b:1": {}}
@@ -0,0 +1,189 @@
+import json
+from datetime import UTC, datetime
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from pydantic import HttpUrl
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cli import export_urls, import_urls, prefill_cache, read_checkpoint
+from app.models import Base, UrlModel
+from app.repository.id_allocator import url_id_allocator
+from app.repository.url_repository import url_repository
+from app.utils.entry import decode_entry
+from app.utils.hash import to_hash
+from tests.conftest import FakeRedis
+
+# Setup for in-memory SQLite database
+engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=True)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=AsyncSession
+)
+
+EXPIRES_AT = datetime(2100, 1, 1, tzinfo=UTC)
+
+
+async def reset_db():
+    url_id_allocator.reset()  # the reserved block belongs to the dropped DB
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest_asyncio.fixture(scope="function")
+async def session_factory():
+    await reset_db()
+    async with SessionLocal() as db:
+        await url_repository.add_many([f"https://{i}.com/" for i in range(1, 6)], db)
+        await url_repository.add("https://later.com/", db, expires_at=4102444800)
+        await url_repository.update(UrlModel(hash=to_hash(2), url=None, on=False), db)
+    yield SessionLocal
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+class TestCli:
+    @pytest.mark.parametrize("name", ["urls.ndjson", "urls.csv"])
+    async def test_export_then_import(self, session_factory, tmp_path, name):
+        path = str(tmp_path / name)
+        fmt = "csv" if name.endswith(".csv") else "ndjson"
+        assert await export_urls(path, fmt, session_factory, chunk_size=4) == 6
+        assert read_checkpoint(path)["rows"] == 6
+        async with session_factory() as db:
+            exported = await url_repository.get_all(db)
+
+        await reset_db()
+        assert await import_urls(path, fmt, session_factory, chunk_size=4) == 6
+        async with session_factory() as db:
+            assert await url_repository.get_all(db) == exported
+            # new links are not given the imported ids
+            record = await url_repository.add("https://new.com/", db)
+        assert record.hash not in {item.hash for item in exported}
+
+    async def test_import_skips_existing(self, session_factory, tmp_path):
+        path = tmp_path / "urls.ndjson"
+        path.write_text(
+            json.dumps({"hash": to_hash(1), "url": "https://1.com/"})
+            + "\n\n"
+            + json.dumps({"url": "https://6.com/", "expires_at": str(EXPIRES_AT)})
+            + "\n"
+        )
+        assert await import_urls(str(path), "ndjson", session_factory) == 1
+        async with session_factory() as db:
+            record = await url_repository.get_by_url("https://6.com/", db)
+        assert record.expires_at == EXPIRES_AT
+        assert record.version == 1
+
+    async def test_import_kept_and_new_hashes(self, session_factory, tmp_path):
+        await reset_db()
+        path = tmp_path / "urls.ndjson"
+        lines = [
+            {"url": "https://new-a.com/"},
+            {"hash": to_hash(1), "url": "https://kept.com/"},
+            {"hash": to_hash(5), "url": "https://kept-5.com/"},
+            {"url": "https://new-b.com/"},
+        ]
+        path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+        assert await import_urls(str(path), "ndjson", session_factory) == 4
+        async with session_factory() as db:
+            assert (await url_repository.get(to_hash(1), db)).url == HttpUrl(
+                "https://kept.com/"
+            )
+            assert (await url_repository.get(to_hash(5), db)).url == HttpUrl(
+                "https://kept-5.com/"
+            )
+            new = await url_repository.add_many(
+                [f"https://{i}.com/" for i in range(8)], db
+            )
+        hashes = {record.hash for record in new[0]}
+        assert not hashes & {to_hash(1), to_hash(5)}
+
+    async def test_import_skips_the_reserved_block(self, session_factory, tmp_path):
+        await reset_db()
+        path = tmp_path / "urls.ndjson"
+        lines = [
+            {"url": "https://new-a.com/"},
+            {"hash": to_hash(5), "url": "https://kept.com/"},
+            {"url": "https://new-b.com/"},
+        ]
+        path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+        assert (
+            await import_urls(str(path), "ndjson", session_factory, chunk_size=1) == 3
+        )
+        async with session_factory() as db:
+            assert (await url_repository.get(to_hash(5), db)).url == HttpUrl(
+                "https://kept.com/"
+            )
+            record = await url_repository.get_by_url("https://new-b.com/", db)
+        assert record.hash == to_hash(6)
+
+    async def test_import_conflicting_hash(self, session_factory, tmp_path):
+        await reset_db()
+        path = tmp_path / "urls.ndjson"
+        lines = [
+            {"url": "https://new-a.com/"},
+            {"hash": to_hash(1), "url": "https://kept.com/"},
+        ]
+        path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+        # the new link of the first chunk already took the hash
+        with pytest.raises(SystemExit, match="is taken by https://new-a.com/"):
+            await import_urls(str(path), "ndjson", session_factory, chunk_size=1)
+        async with session_factory() as db:
+            assert await url_repository.get_by_url("https://kept.com/", db) is None
+
+    async def test_import_hash_out_of_range(self, session_factory, tmp_path):
+        path = tmp_path / "urls.ndjson"
+        line = {"hash": to_hash(2**31), "url": "https://kept.com/"}
+        path.write_text(json.dumps(line) + "\n")
+        with pytest.raises(SystemExit, match="invalid hash"):
+            await import_urls(str(path), "ndjson", session_factory)
+
+    async def test_invalid_record(self, session_factory, tmp_path):
+        path = tmp_path / "urls.csv"
+        path.write_text("url,on\nhttps://6.com/,true\nnot a url,true\n")
+        with pytest.raises(SystemExit, match="invalid record at byte 27"):
+            await import_urls(str(path), "csv", session_factory, chunk_size=1)
+        # the first chunk was committed and can be resumed from
+        assert read_checkpoint(str(path)) == {"offset": 27, "rows": 1}
+
+    async def test_resume_export(self, session_factory, tmp_path):
+        path = str(tmp_path / "urls.ndjson")
+        await export_urls(path, "ndjson", session_factory, chunk_size=4)
+        # interrupted after the checkpoint
+        Path(path).write_text(Path(path).read_text() + '{"partial')
+        async with session_factory() as db:
+            await url_repository.add("https://7.com/", db)
+
+        assert await export_urls(path, "ndjson", session_factory, resume=True) == 1
+        lines = [json.loads(line) for line in Path(path).read_text().splitlines()]
+        assert [line["url"] for line in lines][-2:] == [
+            "https://later.com/",
+            "https://7.com/",
+        ]
+        assert read_checkpoint(path)["rows"] == 7
+
+    async def test_resume_import(self, session_factory, tmp_path):
+        path = str(tmp_path / "urls.ndjson")
+        await export_urls(path, "ndjson", session_factory)
+        await reset_db()
+        first = len(Path(path).read_bytes().splitlines(keepends=True)[0])
+        Path(path + ".checkpoint").write_text(json.dumps({"offset": first, "rows": 1}))
+
+        assert await import_urls(path, "ndjson", session_factory, resume=True) == 5
+        async with session_factory() as db:
+            assert await url_repository.get(to_hash(1), db) is None
+            assert await url_repository.get(to_hash(2), db) is not None
+
+    async def test_prefill(self, session_factory, tmp_path):
+        path = str(tmp_path / "urls.ndjson")
+        await export_urls(path, "ndjson", session_factory)
+        redis = FakeRedis()
+        assert await prefill_cache(path, "ndjson", redis, chunk_size=2) == 5
+
+        assert to_hash(2) not in redis.data  # inactive
+        assert decode_entry(redis.data[to_hash(1)]).url == "https://1.com/"
+        assert redis.ttls == {to_hash(6): 4102444800}
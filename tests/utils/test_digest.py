@@ -0,0 +1,31 @@
+import pytest
+
+from app.utils.digest import DIGEST_SIZE, normalize_url, url_digest
+
+
+class TestDigestModule:
+    def test_digest_size(self):
+        assert len(url_digest("https://example.com/")) == DIGEST_SIZE
+
+    def test_normalize_url(self):
+        assert normalize_url("HTTPS://Example.COM") == "https://example.com/"
+        assert normalize_url("http://example.com:80/a") == "http://example.com/a"
+        assert normalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+        assert normalize_url("https://[::1]:8443/") == "https://[::1]:8443/"
+
+    def test_path_and_query_are_case_sensitive(self):
+        assert url_digest("https://example.com/A") != url_digest(
+            "https://example.com/a"
+        )
+        assert url_digest("https://example.com/?q=A") != url_digest(
+            "https://example.com/?q=a"
+        )
+
+    def test_equivalent_urls_share_digest(self):
+        assert url_digest("HTTPS://EXAMPLE.com:443") == url_digest(
+            "https://example.com/"
+        )
+
+
+if __name__ == "__main__":
+    pytest.main()
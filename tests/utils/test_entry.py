@@ -0,0 +1,44 @@
+from app.utils.entry import (
+    COMPRESSED,
+    CachedUrl,
+    decode_entry,
+    encode_entry,
+    pack_entry,
+    unpack_entry,
+)
+
+
+class TestEntryModule:
+    def test_round_trip(self):
+        entry = CachedUrl("https://example.com/a b?q=1", 3, 1700000000, True)
+        assert decode_entry(encode_entry(entry)) == entry
+        assert decode_entry(encode_entry(entry).encode()) == entry
+
+    def test_expired(self):
+        assert not CachedUrl("https://example.com/").expired(1e12)
+        assert CachedUrl("https://example.com/", expires_at=100).expired(100)
+        assert not CachedUrl("https://example.com/", expires_at=100).expired(99)
+
+    def test_legacy_entry_is_a_bare_url(self):
+        assert decode_entry(b"https://example.com/") == CachedUrl(
+            "https://example.com/"
+        )
+
+    def test_packed_round_trip(self):
+        entry = CachedUrl("https://example.com/", 3, 1700000000, True, 1800000000)
+        assert unpack_entry(pack_entry(entry)) == entry
+        assert decode_entry(pack_entry(entry)) == entry
+        entry = CachedUrl("https://example.com/", 1, 1700000000)
+        assert len(pack_entry(entry)) == 9 + len(entry.url)
+
+    def test_packed_long_url_is_compressed(self):
+        url = "https://www.example.com/articles/2025/" + "a-long-title-" * 5
+        entry = CachedUrl(url, 1, 1700000000)
+        packed = pack_entry(entry, compress_min=48)
+        assert packed[0] & COMPRESSED
+        assert len(packed) < len(pack_entry(entry))
+        assert decode_entry(packed) == entry
+
+    def test_short_url_is_not_compressed(self):
+        entry = CachedUrl("https://a.io/", 1, 1700000000)
+        assert pack_entry(entry, compress_min=48) == pack_entry(entry)
@@ -1,6 +1,15 @@
+import base64
+
 import pytest
 
-from app.utils.hash import from_hash, to_hash, valid_hash
+from app.utils.hash import (
+    _codec,
+    from_hash,
+    from_hashes,
+    to_hash,
+    to_hashes,
+    valid_hash,
+)
 
 
 class TestHashModule:
@@ -39,6 +48,86 @@ class TestHashModule:
         assert valid_hash("0123456") is False
         assert valid_hash("012345678") is False
 
+    def test_invalid_hash_characters(self):
+        assert valid_hash("0123456!") is False
+        with pytest.raises(ValueError):
+            from_hash("0123456!")
+
+    def test_round_trip(self):
+        for num in (0, 1, 2, 1000, 2**31 - 1, 2**48 - 1):
+            assert from_hash(to_hash(num)) == num
+
+    def test_out_of_range(self):
+        with pytest.raises(OverflowError):
+            to_hash(2**48)
+        with pytest.raises(OverflowError):
+            to_hash(-1)
+
+    def test_non_sequential(self):
+        encode, _ = _codec("some secret")
+        hashes = [encode(num) for num in range(1, 101)]
+        assert len(set(hashes)) == 100
+        assert hashes != sorted(hashes), "Adjacent ids should not sort together"
+        # consecutive ids should not share a common prefix
+        assert len({hash[:4] for hash in hashes}) > 50
+
+    def test_batch(self):
+        nums = list(range(500))
+        hashes = to_hashes(nums)
+        assert hashes == [to_hash(num) for num in nums]
+        assert from_hashes(hashes) == nums
+
+    def test_bijection(self):
+        encode, decode = _codec("some secret")
+        nums = [*range(1000), 2**48 - 1]
+        hashes = [encode(num) for num in nums]
+        assert len(set(hashes)) == len(nums)
+        assert [decode(hash) for hash in hashes] == nums
+        assert _codec("other secret")[0](1) != hashes[1]
+
+    def test_no_short_cycles(self):
+        encode, _ = _codec("some secret")
+        # ids 64 apart must not share their last character, nor ids 2**42
+        # apart differ in a single one
+        assert len({encode(num)[-1] for num in range(0, 64 * 64, 64)}) > 32
+        for num in (1, 1000, 123456789):
+            far = encode(num + 2**42)
+            assert sum(a != b for a, b in zip(encode(num), far)) > 1
+
+    def test_invalid_characters(self):
+        _, decode = _codec("some secret")
+        for hash in ("AAAAAA==", "AAAAAAA+", "AAAAAAA/", "AAAAAAA!"):
+            with pytest.raises(ValueError):
+                decode(hash)
+
+    def test_legacy_range(self):
+        # half of the values are legacy ones, so that cycle walking happens
+        legacy = 2**47
+        encode, decode = _codec("some secret", legacy)
+        plain, _ = _codec("")
+        old = [0, 1, 1000, legacy]
+        assert [encode(num) for num in old] == [plain(num) for num in old]
+        assert plain(1) == "AAAAAAAB"
+        assert [decode(plain(num)) for num in old] == old
+
+        # new links never land on the hash of a legacy one
+        new = [legacy + i for i in range(1, 1000)] + [2**48 - 1]
+        hashes = [encode(num) for num in new]
+        assert all(base64_value(hash) > legacy for hash in hashes)
+        assert len(set(hashes)) == len(new)
+        assert [decode(hash) for hash in hashes] == new
+
+    def test_empty_key_is_base64(self):
+        encode, decode = _codec("")
+        for num in (1, 123456789):
+            legacy = base64.urlsafe_b64encode(num.to_bytes(6)).decode()
+            assert encode(num) == legacy
+            assert decode(legacy) == num
+
+
+def base64_value(hash: str) -> int:
+    return int.from_bytes(base64.urlsafe_b64decode(hash))
+
 
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,42 @@
+from app.utils.lru import LRUCache
+
+
+class TestLRUCache:
+    def test_get_and_set(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" becomes the oldest entry
+        cache.set("c", 3)
+        assert "a" in cache
+        assert "b" not in cache
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1, ttl=-1)
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+    def test_pop_and_clear(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        assert cache.pop("a") == 1
+        assert cache.pop("a") is None
+        cache.set("b", 2)
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_disabled_cache(self):
+        cache = LRUCache(maxsize=0, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") is None
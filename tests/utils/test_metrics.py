@@ -0,0 +1,39 @@
+import pytest
+
+from app.utils.metrics import Counter, Histogram, Registry, tier_latency, timed
+
+
+class TestMetrics:
+    def test_counter(self):
+        counter = Counter("hits_total", "hits", labels=("tier",))
+        counter.inc("local")
+        counter.inc("local", amount=2)
+        assert list(counter.samples()) == [("hits_total", '{tier="local"}', 3)]
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("latency", "latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        samples = {name + labels: value for name, labels, value in histogram.samples()}
+        assert samples['latency_bucket{le="0.1"}'] == 1
+        assert samples['latency_bucket{le="1.0"}'] == 2
+        assert samples['latency_bucket{le="+Inf"}'] == 3
+        assert samples["latency_count"] == 3
+        assert samples["latency_sum"] == pytest.approx(5.55)
+
+    def test_registry_render(self):
+        registry = Registry()
+        counter = registry.register(Counter("hits_total", "hits"))
+        counter.inc()
+        text = registry.render()
+        assert "# TYPE hits_total counter" in text
+        assert "hits_total 1" in text
+
+    def test_timed(self):
+        @timed("test", "double")
+        def double(x):
+            return 2 * x
+
+        assert double(2) == 4
+        assert tier_latency.values[("test", "double")][-1] > 0
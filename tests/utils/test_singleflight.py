@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from app.utils.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+    async def test_concurrent_calls_are_shared(self):
+        flight = SingleFlight()
+        calls = 0
+
+        async def lookup():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "https://foo.com/"
+
+        results = await asyncio.gather(*(flight.do("a", lookup) for _ in range(10)))
+        assert results == ["https://foo.com/"] * 10
+        assert calls == 1
+        assert flight.shared == 9
+        assert len(flight) == 0
+
+    async def test_different_keys_are_not_shared(self):
+        flight = SingleFlight()
+
+        async def lookup(key):
+            await asyncio.sleep(0.01)
+            return key
+
+        results = await asyncio.gather(
+            flight.do("a", lambda: lookup("a")), flight.do("b", lambda: lookup("b"))
+        )
+        assert results == ["a", "b"]
+        assert flight.calls == 2
+
+    async def test_errors_are_shared(self):
+        flight = SingleFlight()
+
+        async def lookup():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            flight.do("a", lookup), flight.do("a", lookup), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(flight) == 0
+
+    async def test_cancelled_leader_does_not_cancel_waiters(self):
+        flight = SingleFlight()
+
+        async def lookup():
+            await asyncio.sleep(0.01)
+            return "https://foo.com/"
+
+        leader = asyncio.create_task(flight.do("a", lookup))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("a", lookup))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await waiter == "https://foo.com/"
+        assert leader.cancelled()
+        assert flight.calls == 1
+        await asyncio.sleep(0)
+        assert len(flight) == 0
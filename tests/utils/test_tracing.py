@@ -0,0 +1,88 @@
+import logging
+
+import pytest
+from httpx import AsyncClient
+
+from app.cache import local_cache
+from app.main import app
+from app.middleware.tracing import TracingMiddleware
+from app.utils.entry import CachedUrl
+from app.utils.hash import to_hash
+from app.utils.metrics import timed
+from app.utils.tracing import Trace, current_trace, record, span
+
+
+@timed("test", "double")
+def double(x):
+    return 2 * x
+
+
+@pytest.fixture
+def trace():
+    trace = Trace()
+    token = current_trace.set(trace)
+    yield trace
+    current_trace.reset(token)
+
+
+def traced_client(sample_rate: float, slow_threshold: float) -> AsyncClient:
+    middleware = TracingMiddleware(app, sample_rate, slow_threshold, lambda: 0.5)
+    return AsyncClient(app=middleware, base_url="http://")
+
+
+class TestTrace:
+    def test_spans_outside_of_a_trace_are_ignored(self):
+        with span("noop"):
+            record("noop", 0.0, 1.0)
+        assert double(2) == 4
+        assert current_trace.get() is None
+
+    def test_spans(self, trace):
+        with span("block"):
+            double(1)
+        record("db.checkout", trace.start + 1, 0.5)
+        record("db.checkout", trace.start + 2, 0.25)
+        assert [name for name, _, _ in trace.spans] == [
+            "test.double",
+            "block",
+            "db.checkout",
+            "db.checkout",
+        ]
+        assert trace.spans[-1][1] == 2
+        assert trace.breakdown()["db.checkout"] == 0.75
+
+
+@pytest.mark.asyncio
+class TestTracingMiddleware:
+    async def test_slow_request_logged_with_spans(self, caplog):
+        hash = to_hash(100)
+        local_cache.set(hash, CachedUrl("https://cached.com/"))
+        with caplog.at_level(logging.WARNING, "app.middleware.tracing"):
+            async with traced_client(1.0, 1e-9) as client:
+                response = await client.get(f"/api/v1/urls/{hash}")
+        local_cache.clear()
+
+        assert response.status_code == 200
+        [message] = [r.getMessage() for r in caplog.records]
+        assert message.startswith(f"slow request GET /api/v1/urls/{hash} 200 ")
+        for name in (
+            "hash.valid_hash",
+            "route.dependencies",
+            "route.endpoint",
+            "route.serialize",
+        ):
+            assert f" {name}=" in message
+        assert current_trace.get() is None
+
+    async def test_not_sampled(self, caplog):
+        with caplog.at_level(logging.WARNING, "app.middleware.tracing"):
+            async with traced_client(0.1, 1e-9) as client:
+                await client.get("/system/health/live")
+        [message] = [r.getMessage() for r in caplog.records]
+        assert message.endswith(": not traced")
+
+    async def test_fast_request_not_logged(self, caplog):
+        with caplog.at_level(logging.WARNING, "app.middleware.tracing"):
+            async with traced_client(1.0, 60.0) as client:
+                await client.get("/system/health/live")
+        assert not caplog.records